@@ -0,0 +1,51 @@
+"""Benchmark requests told apart by their JSON bodies, against
+a growing number of bodies registered for the same URL.
+
+Each registration matches one JSON body; each request sends one of them
+(with its keys in a different order), so it must be parsed and matched
+canonically.
+
+Run with: python benchmarks/body_matching.py
+"""
+from __future__ import print_function, unicode_literals
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+
+
+SIZES = (1, 100, 10000)
+REQUESTS = 5000
+
+
+def main():
+    print('%10s  %14s  %14s' % ('bodies', 'sec to register',
+                                'usec / request'))
+    for size in SIZES:
+        adapter = FauxAdapter(journal='count')
+
+        def register():
+            for i in range(size):
+                adapter.register('http://api/rpc', 'answer %d' % i,
+                                 method='POST',
+                                 match_json={'op': 'get', 'id': i})
+        registering = timeit.timeit(register, number=1)
+
+        bodies = [json.dumps({'id': i % size, 'op': 'get'}).encode('utf8')
+                  for i in range(REQUESTS)]
+
+        def run():
+            for body in bodies:
+                adapter.dispatch('POST', 'http://api/rpc', body=body)
+
+        best = min(timeit.repeat(run, number=1, repeat=3))
+        print('%10d  %14.2f  %14.2f' % (size, registering,
+                                        best / REQUESTS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark loading a large JSON lines cassette lazily, against
+registering every exchange up front.
+
+Run with: python benchmarks/cassette_load.py
+"""
+from __future__ import print_function, unicode_literals
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+
+
+EXCHANGES = 20000
+BODY_SIZE = 16 * 1024
+
+
+def write_cassette(path):
+    with open(path, 'w') as file_:
+        for i in range(EXCHANGES):
+            file_.write(json.dumps({
+                'url': 'http://api/items/%d' % i,
+                'headers': {'Content-Type': 'text/plain'},
+                'body': 'x' * BODY_SIZE,
+            }) + '\n')
+
+
+def eager(path):
+    adapter = FauxAdapter()
+    with open(path) as file_:
+        for line in file_:
+            exchange = json.loads(line)
+            adapter.register(exchange['url'], exchange['body'],
+                             headers=exchange['headers'])
+    return adapter
+
+
+def lazy(path):
+    adapter = FauxAdapter()
+    adapter.load(path)
+    return adapter
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'cassette.jsonl')
+        write_cassette(path)
+        print('%8s  %10s  %10s' % ('', 'seconds', 'MiB held'))
+        for name, load in (('eager', eager), ('lazy', lazy)):
+            tracemalloc.start()
+            started = time.time()
+            adapter = load(path)
+            elapsed = time.time() - started
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print('%8s  %10.2f  %10.1f' % (name, elapsed, held / 2 ** 20))
+            del adapter
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark retrying clients against a flaky service, on a virtual clock.
+
+The service refuses connections, times out, and breaks off or stalls
+bodies at random (from a seeded generator, so every run is the same).
+Each client must complete the same number of requests, retrying every
+failure: either at once, or after an exponential backoff. The table
+shows the faults injected (from the journal), the (virtual) time taken,
+and the wall time per request, which also measures what injecting
+faults costs.
+
+Run with: python benchmarks/fault_injection.py
+"""
+from __future__ import division, print_function, unicode_literals
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+from fauxquests.faults import Fault
+from fauxquests.timing import VirtualClock
+from requests import Session
+from requests.exceptions import RequestException
+
+
+REQUESTS = 5000
+BODY = 'x' * 16 * 1024
+
+
+def faults(rate):
+    """Return faults of each kind, each injected at the given rate."""
+    if not rate:
+        return None
+    return [Fault(kind, probability=rate, seed=seed, seconds=2)
+            for seed, kind in enumerate(Fault.KINDS)]
+
+
+def run(rate, backoff):
+    clock = VirtualClock()
+    adapter = FauxAdapter(journal='count', latency=0.05, clock=clock,
+                          faults=faults(rate))
+    adapter.register('http://api/items', BODY)
+    session = Session()
+    session.trust_env = False
+    session.mount('http://', adapter)
+
+    started = time.time()
+    done = 0
+    delay = 0.1
+    while done < REQUESTS:
+        try:
+            session.get('http://api/items', timeout=(1, 5)).content
+            done += 1
+            delay = 0.1
+        except RequestException:
+            if backoff:
+                clock.sleep(delay)
+                delay = min(delay * 2, 10)
+    wall = time.time() - started
+    return (sum(adapter.journal.faults.values()), clock.time(),
+            wall / adapter.journal.count * 1e6)
+
+
+def main():
+    print('%6s  %8s  %8s  %12s  %10s' % ('rate', 'retry', 'faults',
+                                        'virtual sec', 'us/req'))
+    for rate in (0, 0.01, 0.05):
+        for backoff in (False, True):
+            injected, seconds, per_request = run(rate, backoff)
+            print('%6s  %8s  %8d  %12.1f  %10.1f' % (
+                '%d%%' % (rate * 100), 'backoff' if backoff else 'at once',
+                injected, seconds, per_request,
+            ))
+
+
+if __name__ == '__main__':
+    main()
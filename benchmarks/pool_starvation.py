@@ -0,0 +1,65 @@
+"""Benchmark threads sharing a session through pools of various sizes.
+
+Each of THREADS threads sends REQUESTS requests, each of which takes
+LATENCY seconds to arrive, through a FauxAdapter with the given
+`pool_maxsize`. Pools which block make threads wait for a connection;
+those which do not open more connections than they keep. The table shows
+the connections opened, reused and discarded, the peak number in use,
+the mean and longest waits for a connection, and the wall time taken.
+
+Run with: python benchmarks/pool_starvation.py
+"""
+from __future__ import division, print_function, unicode_literals
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+from requests import Session
+
+
+THREADS = 16
+REQUESTS = 25
+LATENCY = 0.002
+
+
+def run(maxsize, block):
+    adapter = FauxAdapter(journal='count', latency=LATENCY,
+                          pool_maxsize=maxsize, pool_block=block)
+    adapter.register('http://api/items', 'ok')
+    session = Session()
+    session.trust_env = False
+    session.mount('http://', adapter)
+
+    def work():
+        for _ in range(REQUESTS):
+            session.get('http://api/items')
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return adapter.pool('http://api/'), time.time() - started
+
+
+def main():
+    print('%7s  %6s  %7s  %7s  %9s  %5s  %10s  %10s  %9s' % (
+        'maxsize', 'block', 'opened', 'reused', 'discarded', 'peak',
+        'mean wait', 'max wait', 'wall sec',
+    ))
+    for block in (False, True):
+        for maxsize in (1, 4, 16):
+            pool, wall = run(maxsize, block)
+            print('%7d  %6s  %7d  %7d  %9d  %5d  %8.1fms  %8.1fms  %9.2f' % (
+                maxsize, block, pool.opened, pool.reused, pool.discarded,
+                pool.peak, pool.mean_wait * 1e3, pool.max_wait * 1e3, wall,
+            ))
+
+
+if __name__ == '__main__':
+    main()
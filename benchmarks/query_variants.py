@@ -0,0 +1,45 @@
+"""Benchmark superset lookups against many query-string variants
+registered for a single method and path.
+
+Run with: python benchmarks/query_variants.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.utils import URL, Registry
+
+
+SIZES = (10, 100, 1000, 10000)
+LOOKUPS = 2000
+
+
+def build_registry(size):
+    registry = Registry()
+    for i in range(size):
+        registry[URL('http://api/search', q='term%d' % i)] = i
+        registry[URL('http://api/search', q='term%d' % i, page='2')] = i
+    return registry
+
+
+def main():
+    print('%10s  %14s' % ('variants', 'usec / lookup'))
+    for size in SIZES:
+        registry = build_registry(size)
+        probes = [URL('http://api/search?q=term%d&page=2&api_key=0123' % i)
+                  for i in range(0, size, max(size // LOOKUPS, 1))]
+        probes = (probes * (LOOKUPS // len(probes) + 1))[:LOOKUPS]
+
+        def run():
+            for probe in probes:
+                registry[probe]
+
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        print('%10d  %14.2f' % (size * 2, best / LOOKUPS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
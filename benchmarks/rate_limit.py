@@ -0,0 +1,65 @@
+"""Benchmark a client working through hours of quota against a rate
+limit, on a virtual clock.
+
+A greedy client retries refused requests every second; a polite one
+sleeps for their `Retry-After`. Each must complete the same number of
+requests; the table shows how many were refused, the (virtual) time
+taken, and the wall time the simulation took.
+
+Run with: python benchmarks/rate_limit.py
+"""
+from __future__ import division, print_function, unicode_literals
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+from fauxquests.limits import SlidingWindow, TokenBucket
+from fauxquests.timing import VirtualClock
+from requests import Session
+
+
+REQUESTS = 2000
+LIMITS = (
+    ('token bucket', lambda: TokenBucket(0.5, burst=100)),
+    ('sliding window', lambda: SlidingWindow(500, 3600)),
+)
+
+
+def run(limit, polite):
+    clock = VirtualClock()
+    adapter = FauxAdapter(journal='count', clock=clock, limit=limit)
+    adapter.register('http://api/items', 'ok')
+    session = Session()
+    session.trust_env = False
+    session.mount('http://', adapter)
+
+    started = time.time()
+    done = 0
+    while done < REQUESTS:
+        response = session.get('http://api/items')
+        if response.status_code == 200:
+            done += 1
+        elif polite:
+            clock.sleep(int(response.headers['Retry-After']))
+        else:
+            clock.sleep(1)
+    return limit.limited, clock.time() / 3600, time.time() - started
+
+
+def main():
+    print('%16s  %8s  %10s  %12s  %10s' % ('limit', 'client', 'refused',
+                                          'virtual hrs', 'wall sec'))
+    for name, limit in LIMITS:
+        for polite in (False, True):
+            refused, hours, wall = run(limit(), polite)
+            print('%16s  %8s  %10d  %12.1f  %10.2f' % (
+                name, 'polite' if polite else 'greedy', refused, hours,
+                wall,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Benchmark superset lookups against registries of increasing size.
+
+Every lookup carries an extra `api_key` query parameter, so it can never
+be satisfied by the exact-match dict probe and must go through the
+superset matching path.
+
+Run with: python benchmarks/registry_lookup.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.utils import URL, Registry
+
+
+SIZES = (10, 100, 1000, 10000, 100000)
+LOOKUPS = 2000
+
+
+def build_registry(size):
+    registry = Registry()
+    for i in range(size):
+        registry[URL('http://api/items/%d' % i, q='kitties')] = i
+    return registry
+
+
+def main():
+    print('%10s  %14s' % ('routes', 'usec / lookup'))
+    for size in SIZES:
+        registry = build_registry(size)
+        probes = [URL('http://api/items/%d?q=kitties&api_key=0123' % i)
+                  for i in range(0, size, max(size // LOOKUPS, 1))]
+        probes = (probes * (LOOKUPS // len(probes) + 1))[:LOOKUPS]
+
+        def run():
+            for probe in probes:
+                registry[probe]
+
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        print('%10d  %14.2f' % (size, best / LOOKUPS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark requests that match no registration, against registries of
+increasing size.
+
+A miss raises UnregisteredRequest. The first column is the cost of the
+miss alone, as paid by code probing for URLs that may not be
+registered; the second includes rendering the exception's message.
+
+Run with: python benchmarks/registry_miss.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.exceptions import UnregisteredRequest
+from fauxquests.utils import URL, Registry
+import six
+
+
+SIZES = (10, 1000, 50000)
+MISSES = 200
+
+
+def build_registry(size):
+    registry = Registry()
+    for i in range(size):
+        registry[URL('http://api/items/%d' % i, q='kitties')] = i
+    return registry
+
+
+def main():
+    print('%10s  %14s  %14s' % ('routes', 'usec / miss', 'usec / shown'))
+    for size in SIZES:
+        registry = build_registry(size)
+        probes = [URL('http://api/missing/%d' % i) for i in range(MISSES)]
+
+        def run(show):
+            for probe in probes:
+                try:
+                    registry[probe]
+                except UnregisteredRequest as ex:
+                    if show:
+                        six.text_type(ex)
+
+        silent = min(timeit.repeat(lambda: run(False), number=1, repeat=3))
+        shown = min(timeit.repeat(lambda: run(True), number=1, repeat=3))
+        print('%10d  %14.2f  %14.2f' % (size, silent / MISSES * 1e6,
+                                        shown / MISSES * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Benchmark bulk registration of many URLs sharing one path.
+
+Every registration carries the same `api_key` query parameter alongside
+one that is unique to it, so they all share a single posting list. The
+time per registration should stay flat as the registry grows.
+
+Run with: python benchmarks/registry_register.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.utils import URL, Registry
+
+
+SIZES = (10000, 20000, 40000, 80000)
+
+
+def main():
+    print('%10s  %14s  %18s' % ('routes', 'seconds total',
+                                 'usec / register'))
+    for size in SIZES:
+        urls = [URL('http://api/items?api_key=k&page=%d' % i)
+                for i in range(size)]
+
+        def run():
+            registry = Registry()
+            for i, url in enumerate(urls):
+                registry[url] = i
+
+        best = min(timeit.repeat(run, number=1, repeat=3))
+        print('%10d  %14.2f  %18.2f' % (size, best, best / size * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark route template lookups against registries holding an
+increasing number of templates.
+
+Each registry holds templates for several resources under each of many
+API versions, plus a catch-all; every lookup must fall through the
+literal index to the router.
+
+Run with: python benchmarks/route_lookup.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.utils import URL, Registry
+
+
+SIZES = (10, 100, 1000, 10000, 100000)
+LOOKUPS = 2000
+RESOURCES = ('users/{id:int}', 'users/{id:int}/orders/{order_id}',
+             'files/{name}.json', 'tags/{tag:[a-z]+}', 'static/{rest:path}')
+
+
+def build_registry(size):
+    registry = Registry()
+    for i in range(size):
+        version, resource = divmod(i, len(RESOURCES))
+        registry[URL('http://api/v%d/%s' % (version, RESOURCES[resource]))] = i
+    registry[URL('http://api/{anything:path}')] = None
+    return registry
+
+
+def main():
+    print('%10s  %14s' % ('templates', 'usec / lookup'))
+    for size in SIZES:
+        registry = build_registry(size)
+        versions = max(size // len(RESOURCES), 1)
+        probes = []
+        for i in range(LOOKUPS):
+            version = i * 7919 % versions
+            probes.append(URL('http://api/v%d/users/%d/orders/abc-%d' % (
+                version, i, i,
+            )))
+
+        def run():
+            for probe in probes:
+                registry.resolve(probe)
+
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        print('%10d  %14.2f' % (size + 1, best / LOOKUPS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Benchmark the per-request overhead of FauxAdapter.send, from
+a prepared request to a fully read `requests.Response`, for a few kinds
+of registration.
+
+The registry holds a single route, and the journal only counts, so
+almost all of the time measured is spent opening the response and
+building the `requests.Response` around it.
+
+Run with: python benchmarks/send_overhead.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+from requests import Request
+
+
+SENDS = 20000
+CASES = (
+    ('text', 'Hello, world.', {'Content-Type': 'text/plain'}),
+    ('json', '{"id": 1}', {'Content-Type': 'application/json'}),
+    ('cookie', 'Hello, world.', {'Content-Type': 'text/plain',
+                                 'Set-Cookie': 'session=abc; Path=/'}),
+    ('64 KiB', b'x' * 65536, {'Content-Type': 'application/octet-stream'}),
+)
+
+
+def main():
+    print('%10s  %14s' % ('response', 'usec / send'))
+    for name, body, headers in CASES:
+        adapter = FauxAdapter(journal='count')
+        adapter.register('http://api/thing', body, headers=headers)
+        request = Request('GET', 'http://api/thing').prepare()
+
+        def run():
+            for _ in range(SENDS):
+                adapter.send(request).content
+
+        best = min(timeit.repeat(run, number=1, repeat=3))
+        print('%10s  %14.2f' % (name, best / SENDS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Benchmark entering and exiting a FauxServer context manager with
+an increasing number of server-level registrations.
+
+Run with: python benchmarks/server_start.py
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests import FauxServer
+
+
+SIZES = (10, 100, 1000, 10000)
+CONTEXTS = 200
+
+
+def main():
+    print('%10s  %16s' % ('routes', 'usec / context'))
+    for size in SIZES:
+        server = FauxServer()
+        for i in range(size):
+            server.register_json('http://api/items/%d' % i, {'id': i})
+
+        def run():
+            for _ in range(CONTEXTS):
+                with server as adapter:
+                    adapter.register('http://api/extra', 'extra')
+
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        print('%10d  %16.2f' % (size, best / CONTEXTS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Stress a single FauxAdapter from a growing number of worker threads,
+while another thread keeps registering new routes, and report the
+requests per second served.
+
+Run with: python benchmarks/threaded_send.py
+"""
+from __future__ import print_function, unicode_literals
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+from requests import Session
+
+
+ROUTES = 1000
+REQUESTS = 20000
+WORKERS = (1, 2, 4, 8, 16)
+
+
+def main():
+    adapter = FauxAdapter(journal='count')
+    for i in range(ROUTES):
+        adapter.register_json('http://api/items/%d' % i, {'id': i})
+    session = Session()
+    session.trust_env = False  # Skip proxy and netrc lookups.
+    session.mount('http://', adapter)
+
+    # Keep registering routes in the background for the whole run.
+    done = threading.Event()
+
+    def register():
+        i = ROUTES
+        while not done.wait(0.001):
+            adapter.register_json('http://api/items/%d' % i, {'id': i})
+            i += 1
+
+    registrar = threading.Thread(target=register)
+    registrar.start()
+
+    def fetch(i):
+        url = 'http://api/items/%d?api_key=0123' % (i % ROUTES)
+        return session.get(url).status_code
+
+    print('%8s  %14s' % ('workers', 'requests / sec'))
+    try:
+        for workers in WORKERS:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                start = time.time()
+                statuses = list(executor.map(fetch, range(REQUESTS)))
+                elapsed = time.time() - start
+            assert statuses == [200] * REQUESTS
+            print('%8d  %14.0f' % (workers, REQUESTS / elapsed))
+    finally:
+        done.set()
+        registrar.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark streamed uploads: a generator body of increasing size is
+sent through requests to a FauxAdapter, which drains it, and the wall
+time and peak memory of each upload are reported.
+
+Bodies are never held in memory, so the peak should stay flat however
+large the upload.
+
+Run with: python benchmarks/upload_drain.py
+"""
+from __future__ import division, print_function, unicode_literals
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.realpath(os.path.dirname(__file__) + '/../'))
+
+from fauxquests.adapter import FauxAdapter
+from requests import Session
+
+
+SIZES = (16, 256, 1024)
+CHUNK = b'u' * (1024 * 1024)
+
+
+def main():
+    adapter = FauxAdapter(journal='summary')
+    adapter.register('http://api/upload', 'ok', method='PUT')
+    session = Session()
+    session.trust_env = False
+    session.mount('http://', adapter)
+
+    print('%10s  %10s  %10s  %10s' % ('MiB', 'seconds', 'MiB / sec',
+                                      'peak KiB'))
+    for size in SIZES:
+        def body():
+            for _ in range(size):
+                yield CHUNK
+
+        tracemalloc.start()
+        started = time.time()
+        session.put('http://api/upload', data=body())
+        elapsed = time.time() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert adapter.requests[-1].body_size == size * len(CHUNK)
+        print('%10d  %10.2f  %10.0f  %10.0f' % (size, elapsed,
+                                                size / elapsed, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,25 @@
-from __future__ import unicode_literals
-from copy import copy
-from fauxquests.response import Resp
+from __future__ import division, unicode_literals
+from fauxquests import cassette
+from fauxquests.exceptions import InjectedFault, UnregisteredRequest
+from fauxquests.faults import ERRORS, Fault
+from fauxquests.journal import Journal, Upload, body_size, drain, \
+                               is_streamed
+from fauxquests.matching import Match, MatchSet
+from fauxquests.messages import CALL_COUNT, NOT_CALLED_WITH, NOT_MATCHED
+from fauxquests.pool import PoolManager
+from fauxquests.response import Call, Dynamic, Resp, Template, \
+                                urllib3_response
+from fauxquests.timing import REAL_CLOCK, connect_timeout, read_timeout, \
+                              sample
 from fauxquests.utils import URL, Registry
-from requests.adapters import HTTPAdapter
-from requests.compat import quote
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, \
+                              HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.exceptions import ConnectionError, ConnectTimeout, \
+                                ReadTimeout
+from requests.compat import quote, urlsplit
 from unittest import TestCase
 import json
 import six
@@ -13,26 +29,170 @@ class FauxAdapter(HTTPAdapter):
     """A subclass to HTTPAdapter that delivers pre-registered
     content in response to a request, or else raises an exception.
     """
-    def __init__(self, url_pattern='%s'):
+    def __init__(self, url_pattern='%s', base=None, journal='full',
+                                         journal_size=None, latency=None,
+                                         ttfb=None, bandwidth=None,
+                                         ranges=False, conditional=False,
+                                         encodings=None, chunked=False,
+                                         record=None, passthrough=None,
+                                         upload_bandwidth=None, limit=None,
+                                         host_limits=None, faults=None,
+                                         pool_connections=DEFAULT_POOLSIZE,
+                                         pool_maxsize=DEFAULT_POOLSIZE,
+                                         pool_block=DEFAULT_POOLBLOCK,
+                                         pool_timeout=None,
+                                         clock=REAL_CLOCK):
         """Initialize a FauxAdapter.
 
         This method is explicitly defined in order to **drop** support
-        for the keyword arguments supported by HTTPAdapter (which no longer
-        make sense in FauxAdapter's case).
+        for the keyword arguments supported by HTTPAdapter which no longer
+        make sense in FauxAdapter's case. Its pool settings
+        (`pool_connections`, `pool_maxsize` and `pool_block`) are
+        honoured by an emulated pool of connections to each host, which
+        counts connections opened and reused, and the time spent waiting
+        for one; see `fauxquests.pool`. If the pool blocks, and
+        `pool_timeout` is given, requests waiting longer than that for
+        a connection raise urllib3's `EmptyPoolError`. Only requests sent
+        with `send` use the pool; asynchronous clients (see
+        `fauxquests.aio`) keep their own.
 
         It adds support for a `url_pattern` argument, which if provided
         is used to interpolate URLs sent to `register` (but not `send`).
+
+        If a `base` registry is provided, this adapter serves everything
+        registered there in addition to what is registered on the adapter
+        itself. The base registry is frozen, and is never modified.
+
+        The `journal` and `journal_size` arguments control what is kept
+        about each request sent through this adapter, and how many are
+        kept; see `fauxquests.journal.Journal`.
+
+        The `latency`, `ttfb` and `bandwidth` arguments make responses
+        take time to arrive (see `fauxquests.response.Resp`), unless a
+        registration provides its own settings. `latency` and `ttfb` may
+        be a number of seconds, or a callable returning one, such as the
+        distributions in `fauxquests.timing`. Time is told by `clock`;
+        use a `fauxquests.timing.VirtualClock` to simulate latency
+        without actually waiting.
+
+        If `ranges` is set, GET requests with a `Range` header are given
+        only the parts of the body they ask for (see
+        `fauxquests.response.Template.open`), unless a registration
+        says otherwise.
+
+        If `conditional` is set, an `ETag` and `Last-Modified` date are
+        computed for each response when it is registered (unless the
+        registration says otherwise), and conditional GET and HEAD
+        requests which they satisfy are answered with a 304.
+
+        If `encodings` are given (such as `('gzip', 'deflate')`), each
+        response is also compressed with each of them when it is
+        registered, and requests are sent the variant their
+        `Accept-Encoding` header prefers. If `chunked` is set, responses
+        are sent with chunked transfer encoding. Registrations may
+        override either setting.
+
+        Request bodies which are streamed (file objects, generators and
+        other iterables) are drained a chunk at a time, as a server would
+        read them, and are never held in memory; the journal records
+        their size, digest and upload rate instead. If `upload_bandwidth`
+        is given, request bodies arrive at that many bytes per second:
+        streamed ones are read no faster, and the time others would take
+        is added to the response's latency.
+
+        If a `limit` is given (see `fauxquests.limits`), requests beyond
+        it are refused (with a 429, by default) without being answered;
+        `host_limits` may give a limit for each host (as in
+        `api.example.com:8080`). Registrations may also have their own
+        limits, which apply as well.
+
+        If `faults` are given (a `fauxquests.faults.Fault`, or a list of
+        them), they are injected into the requests they choose: refusing
+        connections, timing out, or breaking off or stalling the body.
+        Registrations may also have their own faults, which are tried
+        first; at most one fault is injected into each request.
+
+        If `record` is given (the path of a JSON lines cassette),
+        requests which match no registration are forwarded to the
+        `passthrough` adapter (by default, a real `HTTPAdapter`) rather
+        than raising UnregisteredRequest. The exchange is appended to the
+        cassette, and its response registered, so that later requests
+        are answered without forwarding them; see
+        `fauxquests.cassette.Recorder`.
         """
-        super(FauxAdapter, self).__init__()
-        self._registry = Registry()
+        self.clock = clock
+        self.pool_timeout = pool_timeout
+        super(FauxAdapter, self).__init__(pool_connections=pool_connections,
+                                          pool_maxsize=pool_maxsize,
+                                          pool_block=pool_block)
+        if base is not None:
+            self._registry = base.overlay()
+        else:
+            self._registry = Registry()
         self._url_pattern = url_pattern
-        self.requests = []
+        self.journal = Journal(journal, maxlen=journal_size, clock=clock)
+        self.latency = latency
+        self.ttfb = ttfb
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.conditional = conditional
+        self.encodings = encodings
+        self.chunked = chunked
+        self.upload_bandwidth = upload_bandwidth
+        self.limit = limit
+        self.host_limits = host_limits or {}
+        self.faults = _faults(faults)
+        self.recorder = None
+        if record is not None:
+            self.recorder = cassette.Recorder(record, passthrough)
+
+    @property
+    def requests(self):
+        """Return the requests (or request summaries) recorded by this
+        adapter's journal, oldest first.
+        """
+        return self.journal.entries
+
+    @requests.setter
+    def requests(self, entries):
+        """Replace the requests recorded by this adapter's journal with
+        the given ones (so `adapter.requests = []` forgets every request).
+        The journal's counts and statistics start again from zero.
+        """
+        entries = list(entries)
+        self.journal.clear()
+        self.journal.entries.extend(entries)
+
+    def init_poolmanager(self, connections, maxsize,
+                               block=DEFAULT_POOLBLOCK, **pool_kwargs):
+        """Set up the emulated pools of connections to each host (see
+        `fauxquests.pool`), in place of urllib3's.
+        """
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = PoolManager(connections, maxsize, block,
+                                       timeout=self.pool_timeout,
+                                       clock=self.clock)
+
+    def pool(self, url):
+        """Return the `fauxquests.pool.Pool` of connections to the host
+        of the given URL (whose counts show how well it is sized), or
+        None if no request has been sent to it.
+        """
+        return self.poolmanager.pool(url)
 
     def clear(self):
         self._registry.clear()
 
     def register(self, url, response, status_code=200, method='GET',
-                                      headers=None, **kwargs):
+                                      headers=None, latency=None, ttfb=None,
+                                      bandwidth=None, ranges=None,
+                                      conditional=None, encodings=None,
+                                      chunked=None, cache=None,
+                                      match_headers=None, match_body=None,
+                                      match_json=None, json_subset=False,
+                                      limit=None, faults=None, **kwargs):
         """Add the given URL to the registry, and assign the response
         to it.
 
@@ -40,13 +200,40 @@ class FauxAdapter(HTTPAdapter):
         string for the URL. Query string keys and values must be present
         in order for a URL to match (but callers can send a superset and
         still match).
-        """
-        # Interpolate the provided URL pattern.
-        # (This defaults to '%s', which will effectively be a no-op.)
-        url = self._url_pattern % url
 
+        The URL may be a route template, such as `/users/{id:int}`, which
+        matches any URL of that shape; see `fauxquests.routing.Segment`.
+
+        The response may be bytes or text, or (for large bodies) a file,
+        a memoryview from `fauxquests.response.mapped`, or an iterable of
+        chunks; see `Template`.
+
+        The response may also be a function, which is called with
+        a `fauxquests.response.Call` for each request, and returns the
+        response's body (and optionally its status and headers); see
+        `Dynamic`. The call's `params` are the values captured by the
+        route template, if any. If `cache` is given, up to that many of
+        its answers are cached, and reused for requests with the same URL
+        and body.
+
+        The `latency`, `ttfb`, `bandwidth`, `ranges`, `conditional`,
+        `encodings` and `chunked` arguments override the adapter's
+        settings for this registration. A `limit` (see
+        `fauxquests.limits`) applies to this registration, in addition to
+        any limits on the adapter, and so do its `faults` (see
+        `fauxquests.faults`).
+
+        A registration may also require that requests carry certain
+        headers (`match_headers`, a mapping of names to values), or have
+        a certain body: exactly (`match_body`), or as JSON (`match_json`,
+        compared canonically; or, with `json_subset`, only required to be
+        contained in the request's JSON). Several such registrations may
+        be made for the same URL, and method, along with one without any
+        conditions, which answers requests matching none of them; see
+        `fauxquests.matching.MatchSet`.
+        """
         # Create a URL object from the URL and keyword arguments.
-        url = URL(url, method=method.upper(), **kwargs)
+        url = self._route(url, method, kwargs)
 
         # If the response is a string object, convert it to a bytes object.
         if isinstance(response, six.text_type):
@@ -54,7 +241,51 @@ class FauxAdapter(HTTPAdapter):
 
         # Add this response to the registry.
         headers = headers or {}
-        self._registry[url] = Resp(response, status_code, headers)
+        settings = dict(
+            latency=latency,
+            ttfb=ttfb,
+            bandwidth=bandwidth,
+            ranges=ranges,
+            conditional=_first(conditional, self.conditional),
+            encodings=_first(encodings, self.encodings),
+            chunked=chunked,
+            limit=limit,
+            faults=_faults(faults) or None,
+        )
+        if callable(response):
+            response = Dynamic(response, status_code, headers, cache=cache,
+                               **settings)
+        else:
+            response = Template(response, status_code, headers,
+                                modified=self.clock.time(), **settings)
+
+        # Responses registered for particular headers or bodies are kept,
+        # alongside the rest for the same URL, in a match set. Match sets
+        # made for this (unfrozen) registry are changed in place, rather
+        # than copied on every registration.
+        match = Match(match_headers, match_body, match_json, json_subset)
+        existing = self._registry.get(url)
+        owner = None if self._registry.frozen else self._registry
+        if match:
+            if not isinstance(existing, MatchSet):
+                existing = MatchSet(existing, owner)
+            response = existing.add(match, response, owner)
+        elif isinstance(existing, MatchSet):
+            response = existing.replace_default(response, owner)
+        self._registry[url] = response
+
+    def load(self, path, format=None):
+        """Register every exchange recorded in the cassette (a HAR file,
+        or JSON lines) at `path`.
+
+        Only the method and URL of each exchange are read now; each
+        response is read from the cassette the first time it is
+        requested. See `fauxquests.cassette`.
+        """
+        settings = dict(conditional=self.conditional,
+                        encodings=self.encodings)
+        for url, recorded in cassette.entries(path, format, **settings):
+            self._registry[url] = recorded
 
     def register_json(self, url, response, status_code=200,
                             method='GET', headers=None, **kwargs):
@@ -72,15 +303,47 @@ class FauxAdapter(HTTPAdapter):
         return self.register(url, response, status_code=status_code,
                              method=method.upper(), headers=headers, **kwargs)
 
-    def send(self, request, stream=False, **kwargs):
+    def send(self, request, stream=False, timeout=None, **kwargs):
         """Return the appropriate pre-registered response when a request
         is made.
 
         If the URL is not matched, the registry raises UnregisteredURL.
+        If a fault keeping the response from arriving is injected, the
+        exception requests would raise is raised.
+
+        Each request checks a connection out of the pool for its host,
+        which the response releases once it has been read or closed.
         """
-        # Get the pre-registered response from our registry.
-        url = URL(request.url, method=request.method)
-        response = copy(self._registry[url])
+        # Get the pre-registered response, over a pooled connection.
+        connection = self.poolmanager.connection_from_url(request.url)
+        try:
+            response = self.dispatch(request.method, request.url,
+                                     request=request, body=request.body,
+                                     headers=request.headers)
+        except InjectedFault as fault:
+            connection.release(reusable=False)
+            self._fail(fault.kind, request, timeout)
+        except Exception:
+            connection.release()
+            raise
+        response.connection = connection
+
+        # Wait for the response to "arrive", giving up if that would take
+        # longer than the read timeout.
+        timeout = read_timeout(timeout)
+        if timeout is not None and response.latency > timeout:
+            self.clock.sleep(timeout)
+            connection.release(reusable=False)
+            raise ReadTimeout('Read timed out. (read timeout=%s)' % timeout,
+                              request=request)
+        self.clock.sleep(response.latency)
+
+        # If the body is encoded (or faulty), have urllib3 read it, so
+        # that it is decoded (or fails) just as a real response would.
+        names = [name.lower() for name in response.headers]
+        if response.chunk_size or response.fault or \
+           'content-encoding' in names:
+            response = urllib3_response(response, method=request.method)
 
         # Use requests to build the response object.
         r = self.build_response(request, response)
@@ -88,13 +351,324 @@ class FauxAdapter(HTTPAdapter):
         # If this isn't a streaming request, pre-load the content.
         #
         # This is taken from `requests_testadapter`; I'm blindly assuming
-        # he has a good reason.
+        # he has a good reason. Our own responses can be read in one go,
+        # rather than in requests' small chunks.
         if not stream:
+            if isinstance(response, Resp):
+                r._content = response.read()
+                r._content_consumed = True
             r.content
 
+        # Return the response object
+        return r
+
+    def _fail(self, kind, request, timeout):
+        """Raise the exception requests would raise for the given kind
+        of fault (one of `fauxquests.faults.ERRORS`), once the given
+        timeout has passed, if need be.
+        """
+        if kind == 'connect_timeout':
+            timeout = connect_timeout(timeout)
+            if timeout is not None:
+                self.clock.sleep(timeout)
+            raise ConnectTimeout('Connection timed out. (connect '
+                                 'timeout=%s)' % timeout, request=request)
+        if kind == 'read_timeout':
+            timeout = read_timeout(timeout)
+            if timeout is not None:
+                self.clock.sleep(timeout)
+            raise ReadTimeout('Read timed out. (read timeout=%s)' % timeout,
+                              request=request)
+        raise ConnectionError('Connection refused.', request=request)
+
+    def build_response(self, req, resp):
+        """Return a `requests.Response` for the given prepared request
+        and response.
+
+        Our own `Resp` objects already carry everything requests would
+        work out for itself (case-insensitive headers, the reason phrase
+        and text encoding, computed once per registration), so they are
+        used as-is; cookies are only extracted if the response sets any.
+        Anything else (such as a urllib3 response decoding an encoded
+        body) is left to `HTTPAdapter`.
+        """
+        if not isinstance(resp, Resp):
+            return super(FauxAdapter, self).build_response(req, resp)
+        response = Response()
+        response.status_code = resp.status
+        response.headers = resp.headers
+        response.encoding = resp.encoding
+        response.raw = resp
+        response.reason = resp.reason
+        response.url = req.url
+        if isinstance(req.url, six.binary_type):
+            response.url = req.url.decode('utf8')
+        if 'Set-Cookie' in resp.headers or 'Set-Cookie2' in resp.headers:
+            extract_cookies_to_jar(response.cookies, req, resp)
+        response.request = req
+        response.connection = self
+        return response
+
+    def dispatch(self, method, url, request=None, body=None, headers=None,
+                       upload=None):
+        """Return a `Resp` object for the pre-registered response to
+        a request with the given method and URL, and record the request
+        in the journal.
+
+        This does not depend on the HTTP client in use; `send` uses it
+        for requests, and `fauxquests.aio` uses it for asynchronous
+        clients. The `request` is the client's own request object, and
+        is only used by the journal; `headers` are the request headers.
+
+        If a fault which keeps any response from arriving is injected
+        into the request, `InjectedFault` is raised, for the caller to
+        raise its client's own exception instead.
+
+        A caller which has already received a streamed body (as
+        `fauxquests.aio` does, without blocking its event loop) passes
+        the `Upload` describing it as `upload`, rather than the body.
+        """
+        # Get the pre-registered response from our registry, and open
+        # a fresh reader over its (shared, immutable) body. The time
+        # the response takes to arrive is left for the caller to wait.
+        raw_url, url = url, URL(url, method=method)
+        headers = CaseInsensitiveDict(headers or {})
+
+        # Requests beyond the adapter's (or the host's) rate limits are
+        # refused without looking for a registration at all; those beyond
+        # the registration's own limit, once it is found.
+        route, params, fault = None, {}, None
+        template = self._throttle(self.limit, self._host_limit(url))
+        if template is None:
+            route, template, params = self._lookup(raw_url, url, headers,
+                                                   body)
+            template = self._throttle(template.limit) or template
+            fault = self._fault(template)
+            if fault is not None and fault.kind in ERRORS:
+                self.journal.record(request, url, route, body,
+                                    fault=fault.kind)
+                raise InjectedFault(fault.kind, url)
+        upload_time = 0
+        if upload is None:
+            upload, upload_time = self._receive(body)
+        if isinstance(template, Dynamic):
+            call = Call(url.method, url, headers, body, request, params)
+            template = template.render(call, modified=self.clock.time())
+        conditions = {}
+        if url.method in ('GET', 'HEAD'):
+            conditions['if_none_match'] = headers.get('If-None-Match')
+            conditions['if_modified_since'] = headers.get('If-Modified-Since')
+            if url.method == 'GET':
+                conditions['range_header'] = headers.get('Range')
+        response = template.open(
+            accept_encoding=headers.get('Accept-Encoding'),
+            ranges=_first(template.ranges, self.ranges),
+            chunked=_first(template.chunked, self.chunked),
+            latency=sample(_first(template.latency, self.latency)) +
+                    upload_time,
+            ttfb=sample(_first(template.ttfb, self.ttfb)),
+            bandwidth=_first(template.bandwidth, self.bandwidth),
+            clock=self.clock,
+            **conditions
+        )
+        if fault is not None:
+            fault.apply(response)
+
         # Track information about this call, so that asserts can be made
         # against what was done on this object.
-        self.requests.append(request)
+        self.journal.record(request, url, route, body,
+                            status=response.status, upload=upload,
+                            fault=response.fault)
 
         # Return the response object
-        return r
+        return response
+
+    def _lookup(self, raw_url, url, headers, body):
+        """Return a `(registered_key, value, params)` tuple for the
+        registration answering a request, as from `Registry.resolve`,
+        recording the request if it matches nothing (and this adapter is
+        recording), and choosing between registrations that match on
+        headers and bodies.
+
+        If none of a registration's headers and bodies match (and it has
+        no default), the next best registration answers instead, if
+        there is one.
+        """
+        try:
+            route, template, params = self._registry.resolve(url)
+        except UnregisteredRequest:
+            if self.recorder is None:
+                raise
+            route, template, params = self._record(raw_url, url, headers,
+                                                   body)
+        rejected = ()
+        while isinstance(template, MatchSet):
+            selected = template.select(headers, body)
+            if selected is not None:
+                return route, selected, params
+            rejected += (route,)
+            try:
+                route, template, params = self._registry.resolve(url,
+                                                                 rejected)
+            except UnregisteredRequest:
+                raise UnregisteredRequest(url, lambda: NOT_MATCHED.format(
+                    request=url,
+                    route=rejected[0],
+                ))
+        return route, template, params
+
+    def _host_limit(self, url):
+        """Return the rate limit for the host of the given URL, if any."""
+        if not self.host_limits:
+            return None
+        return self.host_limits.get(urlsplit(url.uri).netloc)
+
+    def _throttle(self, *limits):
+        """Take a request against each of the given rate limits (any of
+        which may be None), and return a `Template` refusing it if any
+        is exceeded, or None if it is allowed.
+        """
+        now = self.clock.time()
+        for limit in limits:
+            if limit is not None:
+                refusal = limit.check(now)
+                if refusal is not None:
+                    return refusal
+        return None
+
+    def _fault(self, template):
+        """Return the first of the registration's faults, and then the
+        adapter's, chosen to be injected into a request, or None.
+
+        Every fault sees every request, so that each keeps to its own
+        schedule, even if another is chosen.
+        """
+        faults = template.faults
+        if not faults and not self.faults:
+            return None
+        chosen = [f for f in (faults or ()) + self.faults if f.fires()]
+        return chosen[0] if chosen else None
+
+    def _receive(self, body):
+        """Receive the given request body, and return a tuple of the
+        `Upload` describing it (or None, if there is no body) and the
+        seconds, not yet waited for, that it takes to arrive.
+
+        Streamed bodies are drained (see `fauxquests.journal.drain`),
+        taking as long as they take. Bodies already in memory are left
+        alone, but still take time to arrive at the upload bandwidth.
+        """
+        if is_streamed(body):
+            return drain(body, self.upload_bandwidth, self.clock), 0
+        size = body_size(body)
+        if not size:
+            return None, 0
+        seconds = 0
+        if self.upload_bandwidth:
+            seconds = size / self.upload_bandwidth
+        return Upload(size, None, seconds), seconds
+
+    def _record(self, raw_url, url, headers, body):
+        """Forward a request which matched no registration to the real
+        adapter, recording the exchange, and register its response.
+
+        Return a `(registered_key, value, params)` tuple, as from
+        `Registry.resolve`.
+        """
+        response, status, response_headers = self.recorder.forward(
+            url.method, raw_url, headers, body,
+        )
+        template = Template(response, status, response_headers,
+                            conditional=self.conditional,
+                            encodings=self.encodings,
+                            modified=self.clock.time())
+        self._registry[url] = template
+        return url, template, {}
+
+    def response_cache(self, url, method='GET', **kwargs):
+        """Return the `LRUCache` of the function registered for the
+        given URL, method, and query string keyword arguments (whose
+        `hits` and `misses` show how well it is working), or None if
+        its answers are not cached.
+        """
+        response = self._registry.get(self._route(url, method, kwargs))
+        return getattr(response, 'cache', None)
+
+    def call_count(self, url, method='GET', **kwargs):
+        """Return the number of requests answered by the registration for
+        the given URL, method, and query string keyword arguments.
+        """
+        stats = self.journal.stats(self._route(url, method, kwargs))
+        if stats is None:
+            return 0
+        return stats.count
+
+    def assert_called(self, url, times=None, method='GET', **kwargs):
+        """Assert that the registration for the given URL, method, and
+        query string keyword arguments answered at least one request,
+        or exactly `times` requests if `times` is provided.
+        """
+        route = self._route(url, method, kwargs)
+        count = self.call_count(route)
+        if (times is None and count == 0) or times not in (None, count):
+            raise AssertionError(CALL_COUNT.format(
+                count=count,
+                expected='at least 1' if times is None else times,
+                route=route,
+            ))
+
+    def assert_not_called(self, url, method='GET', **kwargs):
+        """Assert that the registration for the given URL, method, and
+        query string keyword arguments has not answered any requests.
+        """
+        self.assert_called(url, 0, method, **kwargs)
+
+    def assert_called_with(self, url, query, method='GET', **kwargs):
+        """Assert that the registration for the given URL, method, and
+        query string keyword arguments answered at least one request
+        whose query string included every key and value in `query`.
+        """
+        route = self._route(url, method, kwargs)
+        stats = self.journal.stats(route)
+        if stats is None or not stats.called_with(**query):
+            # URLs are not kept in `count` mode; show the query pairs
+            # seen instead.
+            calls = []
+            if stats is not None and stats.urls:
+                calls = [six.text_type(i) for i in stats.urls]
+            elif stats is not None:
+                calls = ['%s=%s' % pair for pair in stats.pairs]
+            raise AssertionError(NOT_CALLED_WITH.format(
+                calls='\n    - '.join(sorted(calls)) or '(None)',
+                query=query,
+                route=route,
+            ))
+
+    def _route(self, url, method, kwargs):
+        """Return the URL object that a registration for the given URL,
+        method, and query string keyword arguments is stored under.
+        """
+        if isinstance(url, URL):
+            return url
+
+        # Interpolate the provided URL pattern.
+        # (This defaults to '%s', which will effectively be a no-op.)
+        url = self._url_pattern % url
+        return URL(url, method=method.upper(), **kwargs)
+
+
+def _faults(value):
+    """Return the given fault (or list of faults) as a tuple."""
+    if value is None:
+        return ()
+    if isinstance(value, Fault):
+        return (value,)
+    return tuple(value)
+
+
+def _first(*args):
+    """Return the first of the given arguments that is not None."""
+    for arg in args:
+        if arg is not None:
+            return arg
+    return None
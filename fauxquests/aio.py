@@ -0,0 +1,539 @@
+"""Fake asynchronous HTTP clients (httpx and aiohttp) using the same
+registry and journal as a FauxAdapter.
+
+Lookups are done entirely in memory, so serving a request never blocks
+the event loop, and any number of concurrent coroutines can be served
+without threads. Simulated latency and bandwidth are waited for with
+`asyncio.sleep` (or not at all, on a virtual clock).
+
+Faults injected by the adapter (see `fauxquests.faults`) are raised as
+each library's own exceptions.
+
+Streamed request bodies are drained a chunk at a time, as the adapter
+drains them (see `fauxquests.journal.drain`), but with any upload
+bandwidth waited for without blocking the event loop.
+
+Responses sent with a `Content-Encoding` (see the adapter's `encodings`)
+are decompressed as each library would: httpx decodes them itself, and
+aiohttp's responses are decoded here, unless `auto_decompress` is off.
+aiohttp requests carry the headers aiohttp would send: the session's
+defaults, the request's own, and its automatic ones (`Accept-Encoding`
+among them).
+
+This module requires Python 3, and each client library is optional;
+support for a library is only available if it is installed.
+"""
+from __future__ import unicode_literals
+from fauxquests.compat import mock
+from fauxquests.exceptions import InjectedFault
+from fauxquests.journal import UPLOAD_CHUNK_SIZE, Upload, is_streamed
+from fauxquests.response import brotli
+from fauxquests.timing import REAL_CLOCK
+from http.client import IncompleteRead
+import asyncio
+import hashlib
+import io
+import json as _json
+import zlib
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import aiohttp
+    from multidict import CIMultiDict, CIMultiDictProxy
+    from yarl import URL as YarlURL
+except ImportError:
+    aiohttp = None
+
+
+# The size of the chunks that response bodies are streamed in.
+CHUNK_SIZE = 64 * 1024
+
+
+class FauxTransport(httpx.AsyncBaseTransport if httpx else object):
+    """An httpx transport that answers requests from a FauxAdapter.
+
+    Use it directly with `httpx.AsyncClient(transport=...)`, or let
+    `FauxServer` patch it in for every client.
+    """
+    def __init__(self, adapter):
+        self.adapter = adapter
+
+    async def handle_async_request(self, request):
+        # Streamed bodies are drained rather than read into memory.
+        body, upload = None, None
+        try:
+            body = request.content
+        except httpx.RequestNotRead:
+            upload = await drain(request.stream,
+                                 self.adapter.upload_bandwidth,
+                                 self.adapter.clock)
+        timeouts = request.extensions.get('timeout', {})
+        try:
+            resp = self.adapter.dispatch(request.method, str(request.url),
+                                         request=request, body=body,
+                                         headers=request.headers,
+                                         upload=upload)
+        except InjectedFault as fault:
+            await self._fail(fault.kind, request, timeouts)
+
+        # Wait for the response to "arrive", giving up if that would take
+        # longer than the read timeout.
+        timeout = timeouts.get('read')
+        if timeout is not None and resp.latency > timeout:
+            await wait(resp.clock, timeout)
+            raise httpx.ReadTimeout('Read timed out.', request=request)
+        await wait(resp.clock, resp.latency)
+
+        return httpx.Response(
+            resp.status,
+            headers=list(resp.headers.items()),
+            stream=_HttpxStream(resp),
+            request=request,
+        )
+
+    async def _fail(self, kind, request, timeouts):
+        """Raise the exception httpx would raise for the given kind of
+        fault (see `FauxAdapter._fail`).
+        """
+        clock = self.adapter.clock
+        if kind == 'connect_timeout':
+            await wait(clock, timeouts.get('connect') or 0)
+            raise httpx.ConnectTimeout('Connection timed out.',
+                                       request=request)
+        if kind == 'read_timeout':
+            await wait(clock, timeouts.get('read') or 0)
+            raise httpx.ReadTimeout('Read timed out.', request=request)
+        raise httpx.ConnectError('Connection refused.', request=request)
+
+
+class _HttpxStream(httpx.AsyncByteStream if httpx else object):
+    """An httpx byte stream reading from a `Resp`."""
+    def __init__(self, resp):
+        self._resp = resp
+
+    async def __aiter__(self):
+        while True:
+            chunk = await read(self._resp, CHUNK_SIZE, _httpx_broken)
+            if not chunk:
+                break
+            yield chunk
+
+    async def aclose(self):
+        self._resp.close()
+
+
+class FauxClientResponse(object):
+    """A stand-in for `aiohttp.ClientResponse`, reading from a `Resp`.
+
+    As with aiohttp, the body is decompressed according to its
+    `Content-Encoding` if `decompress` is True.
+    """
+    def __init__(self, method, url, resp, request_info, decompress=True):
+        self.method = method
+        self.url = url
+        self.real_url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = CIMultiDictProxy(CIMultiDict(resp.headers))
+        encoding = self.headers.get('Content-Encoding')
+        self.content = FauxStreamReader(resp,
+                                        encoding if decompress else None)
+        self.request_info = request_info
+        self.history = ()
+        self._body = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    @property
+    def content_type(self):
+        return self.headers.get('Content-Type', 'application/octet-stream')\
+                           .split(';')[0].strip()
+
+    @property
+    def closed(self):
+        return self.content._resp.closed
+
+    def get_encoding(self):
+        for param in self.headers.get('Content-Type', '').split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'charset' and value:
+                return value.strip('"\'')
+        return 'utf-8'
+
+    def raise_for_status(self):
+        if not self.ok:
+            self.release()
+            raise aiohttp.ClientResponseError(
+                self.request_info,
+                self.history,
+                status=self.status,
+                message=self.reason,
+                headers=self.headers,
+            )
+
+    async def read(self):
+        if self._body is None:
+            self._body = await self.content.read()
+        return self._body
+
+    async def text(self, encoding=None, errors='strict'):
+        body = await self.read()
+        return body.decode(encoding or self.get_encoding(), errors)
+
+    async def json(self, encoding=None, loads=_json.loads,
+                         content_type='application/json'):
+        body = await self.read()
+        if not body.strip():
+            return None
+        return loads(body.decode(encoding or self.get_encoding()))
+
+    def release(self):
+        self.content._resp.release_conn()
+
+    def close(self):
+        self.content._resp.close()
+
+
+class FauxStreamReader(object):
+    """A stand-in for `aiohttp.StreamReader`, reading from a `Resp`,
+    and decompressing what is read according to the given content
+    `encoding`, if any.
+    """
+    def __init__(self, resp, encoding=None):
+        self._resp = resp
+        self._buffer = b''
+        self._eof = False
+        self._encoding = encoding
+        self._decoder = _decoder(encoding)
+
+    def __aiter__(self):
+        return self._lines()
+
+    def at_eof(self):
+        return self._eof and not self._buffer
+
+    async def read(self, n=-1):
+        if self._buffer:
+            chunk = self._buffer if n < 0 else self._buffer[:n]
+            self._buffer = self._buffer[len(chunk):]
+            if n < 0:
+                chunk += await self.read()
+            return chunk
+        chunk = await self._read(n)
+        if n >= 0 and len(chunk) > n:
+            chunk, self._buffer = chunk[:n], chunk[n:]
+        if not chunk or n < 0:
+            self._eof = True
+        return chunk
+
+    async def readany(self):
+        return await self.read(CHUNK_SIZE)
+
+    async def readline(self):
+        while b'\n' not in self._buffer and not self._eof:
+            chunk = await self._read(CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+            self._buffer += chunk
+        index = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        line, self._buffer = self._buffer[:index], self._buffer[index:]
+        return line
+
+    async def iter_chunked(self, n):
+        while True:
+            chunk = await self.read(n)
+            if not chunk:
+                break
+            yield chunk
+
+    def iter_any(self):
+        return self.iter_chunked(CHUNK_SIZE)
+
+    async def _lines(self):
+        while True:
+            line = await self.readline()
+            if not line:
+                break
+            yield line
+
+    async def _read(self, n=-1):
+        """Read up to `n` bytes of the body (or all of it, if `n` is
+        negative), and return them decompressed; a chunk decompresses to
+        any number of bytes.
+        """
+        while True:
+            chunk = await read(self._resp, n, _aiohttp_broken)
+            if self._decoder is None:
+                return chunk
+            try:
+                answer = self._decoder.decompress(chunk)
+                if not chunk or n < 0:
+                    answer += self._decoder.flush()
+                    self._decoder = None
+            except Exception as exc:
+                raise aiohttp.ClientPayloadError(
+                    'Can not decode content-encoding: %s (%s)'
+                    % (self._encoding, exc),
+                )
+            if answer or self._decoder is None:
+                return answer
+
+
+class _BrotliDecoder(object):
+    """Decompresses brotli, with whichever brotli library is installed."""
+    def __init__(self):
+        decompressor = brotli.Decompressor()
+        self.decompress = getattr(decompressor, 'decompress', None) or \
+                          decompressor.process
+
+    def flush(self):
+        return b''
+
+
+def _decoder(encoding):
+    """Return an object with `decompress` and `flush` methods which
+    decompresses the given content encoding, as aiohttp would, or None
+    if it is not one that aiohttp decodes.
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding == 'br' and brotli is not None:
+        return _BrotliDecoder()
+    return None
+
+
+async def read(resp, n=-1, broken=None):
+    """Read up to `n` bytes from the given `Resp`, taking as long as
+    the response's bandwidth settings dictate.
+
+    If the body breaks off (see `fauxquests.faults`), the exception
+    returned by `broken`, given the `IncompleteRead`, is raised.
+    """
+    try:
+        chunk, delay = resp.read_timed(n)
+    except IncompleteRead as exc:
+        if broken is None:
+            raise
+        raise broken(exc)
+    await wait(resp.clock, delay)
+    return chunk
+
+
+async def drain(body, bandwidth=None, clock=REAL_CLOCK,
+                      chunk_size=UPLOAD_CHUNK_SIZE):
+    """Consume the given streamed request body a chunk at a time, and
+    return an `Upload` describing it, as `fauxquests.journal.drain` does,
+    but waiting for the `bandwidth` without blocking the event loop.
+
+    The body may also be an asynchronous iterable of chunks (such as an
+    httpx request's stream).
+    """
+    digest = hashlib.sha1()
+    size = 0
+    started = clock.time()
+    async for chunk in _chunks(body, chunk_size):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf8')
+        digest.update(chunk)
+        size += len(chunk)
+        if bandwidth:
+            await wait(clock, len(chunk) / bandwidth)
+    return Upload(size, digest.hexdigest(), clock.time() - started)
+
+
+async def _chunks(body, chunk_size):
+    """Yield the chunks of the given streamed request body: a file
+    object, or an iterable (or asynchronous iterable) of chunks.
+    """
+    if hasattr(body, '__aiter__'):
+        async for chunk in body:
+            yield chunk
+    elif isinstance(body, io.IOBase):
+        for chunk in iter(lambda: body.read(chunk_size) or b'', b''):
+            yield chunk
+    else:
+        for chunk in body:
+            yield chunk
+
+
+async def wait(clock, seconds):
+    """Wait for the given number of seconds, as measured by `clock`,
+    without blocking the event loop.
+    """
+    if seconds <= 0:
+        return
+    if clock.virtual:
+        clock.sleep(seconds)
+    else:
+        await asyncio.sleep(seconds)
+
+
+def _httpx_broken(exc):
+    """Return the exception httpx raises for a body which breaks off
+    partway.
+    """
+    return httpx.RemoteProtocolError('peer closed connection without '
+                                     'sending complete message body: %s'
+                                     % exc)
+
+
+def _aiohttp_broken(exc):
+    """Return the exception aiohttp raises for a body which breaks off
+    partway.
+    """
+    return aiohttp.ClientPayloadError('Response payload is not completed: '
+                                      '%r' % exc)
+
+
+def patchers(adapter):
+    """Return a list of patchers which, once started, make every
+    asynchronous client that is installed send its requests to the
+    given adapter.
+    """
+    answer = []
+
+    # httpx: Replace the default transport's request handling.
+    if httpx is not None:
+        transport = FauxTransport(adapter)
+
+        async def handle_async_request(self, request):
+            return await transport.handle_async_request(request)
+
+        answer.append(mock.patch.object(
+            httpx.AsyncHTTPTransport,
+            'handle_async_request',
+            new=handle_async_request,
+        ))
+
+    # aiohttp: Replace the session's request method.
+    if aiohttp is not None:
+        answer.append(mock.patch.object(
+            aiohttp.ClientSession,
+            '_request',
+            new=_aiohttp_request(adapter),
+        ))
+
+    return answer
+
+
+def _aiohttp_request(adapter):
+    """Return a replacement for `aiohttp.ClientSession._request` that
+    answers requests from the given adapter.
+    """
+    async def _request(session, method, str_or_url, params=None, data=None,
+                       json=None, headers=None, **kwargs):
+        # Build the full URL, as aiohttp would.
+        url = YarlURL(str_or_url)
+        if getattr(session, '_base_url', None) and not url.is_absolute():
+            url = session._base_url.join(url)
+        if params:
+            url = url.extend_query(params)
+
+        # Determine the request body, for the journal's benefit; streamed
+        # bodies are drained rather than read into memory.
+        body, upload = data, None
+        if json is not None:
+            body = _json.dumps(json)
+        elif is_streamed(data) or hasattr(data, '__aiter__'):
+            body = None
+            upload = await drain(data, adapter.upload_bandwidth,
+                                 adapter.clock)
+
+        # Answer the request.
+        headers = _aiohttp_headers(session, headers,
+                                   kwargs.get('skip_auto_headers'))
+        request_info = aiohttp.RequestInfo(url, method.upper(),
+                                           CIMultiDictProxy(headers))
+        timeouts = kwargs.get('timeout') or getattr(session, '_timeout',
+                                                    None)
+        try:
+            resp = adapter.dispatch(method.upper(), str(url),
+                                    request=request_info, body=body,
+                                    headers=request_info.headers,
+                                    upload=upload)
+        except InjectedFault as fault:
+            await _aiohttp_fail(adapter.clock, fault.kind, timeouts)
+
+        # Wait for the response to "arrive", giving up if that would take
+        # longer than the read timeout.
+        timeout = getattr(timeouts, 'sock_read', None) or \
+                  getattr(timeouts, 'total', timeouts)
+        if isinstance(timeout, (int, float)) and resp.latency > timeout:
+            await wait(resp.clock, timeout)
+            raise aiohttp.ServerTimeoutError('Timeout on reading data '
+                                             'from socket')
+        await wait(resp.clock, resp.latency)
+
+        decompress = kwargs.get('auto_decompress')
+        if decompress is None:
+            decompress = getattr(session, '_auto_decompress', True)
+        return FauxClientResponse(method.upper(), url, resp, request_info,
+                                  decompress)
+
+    return _request
+
+
+def _aiohttp_headers(session, headers, skip_auto_headers=None):
+    """Return the headers aiohttp would send for a request made through
+    `session` with the given `headers`, as a `CIMultiDict`.
+
+    As with `aiohttp.ClientRequest`, the session's default headers are
+    overridden by those given, and the headers aiohttp adds by itself
+    (such as `Accept-Encoding`) are added unless either sets them or
+    they are skipped (by `skip_auto_headers`, or by the session).
+    """
+    answer = CIMultiDict(getattr(session, '_default_headers', None) or {})
+    given = set()
+    for key, value in CIMultiDict(headers or {}).items():
+        if key.lower() in given:
+            answer.add(key, value)
+        else:
+            answer[key] = value
+            given.add(key.lower())
+    skip = set([i.lower() for i in skip_auto_headers or ()])
+    skip |= set([i.lower() for i in
+                 getattr(session, '_skip_auto_headers', None) or ()])
+    auto = dict(aiohttp.ClientRequest.DEFAULT_HEADERS)
+    auto['User-Agent'] = aiohttp.http.SERVER_SOFTWARE
+    for key, value in auto.items():
+        if key not in answer and key.lower() not in skip:
+            answer[key] = value
+    return answer
+
+
+async def _aiohttp_fail(clock, kind, timeouts):
+    """Raise the exception aiohttp would raise for the given kind of
+    fault (see `FauxAdapter._fail`), given the request's `ClientTimeout`.
+    """
+    if kind == 'connect_timeout':
+        timeout = getattr(timeouts, 'sock_connect', None) or \
+                  getattr(timeouts, 'connect', None) or \
+                  getattr(timeouts, 'total', timeouts)
+        if isinstance(timeout, (int, float)):
+            await wait(clock, timeout)
+        error = getattr(aiohttp, 'ConnectionTimeoutError',
+                        aiohttp.ServerTimeoutError)
+        raise error('Connection timeout to host')
+    if kind == 'read_timeout':
+        timeout = getattr(timeouts, 'sock_read', None) or \
+                  getattr(timeouts, 'total', timeouts)
+        if isinstance(timeout, (int, float)):
+            await wait(clock, timeout)
+        raise aiohttp.ServerTimeoutError('Timeout on reading data from '
+                                         'socket')
+    raise aiohttp.ClientConnectionError('Connection refused')
@@ -0,0 +1,343 @@
+"""Serve recorded traffic (HAR files, or JSON lines) without loading it.
+
+Loading a cassette makes a single streaming pass over the file, keeping
+only the method, URL and location in the file of each exchange. Each
+exchange is registered as a `Recorded` response, which reads and parses
+its own part of the (memory-mapped) file the first time it is requested.
+Loading is therefore cheap, and memory grows only with the exchanges
+actually served.
+
+Cassettes can also be recorded, by forwarding requests to a real
+adapter with a `Recorder`, which appends each exchange to a JSON lines
+cassette.
+
+Two formats are understood:
+  - `har`: A HAR file, as saved by browsers and proxies.
+  - `jsonl`: One exchange per line, either as a HAR entry (with
+    `request` and `response` objects), or as a flat object with `method`
+    (default GET), `url`, `status` (default 200), `headers` (an object,
+    or a HAR-style list of names and values) and either `body` (text)
+    or `body_base64`.
+"""
+from __future__ import unicode_literals
+from fauxquests.response import Dynamic, Template
+from fauxquests.utils import URL, Registry
+from requests.adapters import HTTPAdapter
+from requests.compat import OrderedDict
+from requests.models import Request
+import base64
+import json
+import mmap
+import re
+import threading
+
+
+# Response headers which describe how the recorded body was sent, rather
+# than the body itself (which HAR files store decoded), and so are not
+# replayed.
+TRANSPORT_HEADERS = frozenset((
+    'content-encoding', 'content-length', 'transfer-encoding', 'connection',
+    'keep-alive',
+))
+
+# JSON strings and brackets, for finding the entries of a HAR file without
+# parsing it.
+_TOKENS = re.compile(br'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+
+# A decoder for single JSON values, and the whitespace between them, for
+# reading the first few members of a JSON lines exchange.
+_DECODER = json.JSONDecoder()
+_SPACE = re.compile(r'[ \t\n\r]*')
+
+
+class Recorded(Dynamic):
+    """A response recorded in a cassette, which is only read from the
+    cassette the first time it is requested.
+
+    Keyword arguments are the settings given to the `Template` built
+    from the recording.
+    """
+    def __init__(self, source, start, end, **kwargs):
+        super(Recorded, self).__init__(None, **kwargs)
+        self.source = source
+        self.start = start
+        self.end = end
+        self._template = None
+
+    def render(self, call, modified=None):
+        """Return a `Template` for the recorded response, reading it from
+        the cassette if this is the first request for it.
+        """
+        if self._template is None:
+            body, status, headers = self.source.exchange(self.start,
+                                                         self.end)
+            self._template = Template(body, status, headers,
+                                      modified=modified, **self._kwargs)
+        return self._template
+
+
+class Source(object):
+    """A cassette file, mapped into memory the first time an exchange
+    is read from it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._view = None
+        self._lock = threading.Lock()
+
+    def read(self, start, end):
+        """Return the bytes of the file between the given offsets."""
+        if self._view is None:
+            with self._lock:
+                if self._view is None:
+                    with open(self.path, 'rb') as file_:
+                        self._view = memoryview(mmap.mmap(
+                            file_.fileno(), 0, access=mmap.ACCESS_READ,
+                        ))
+        return self._view[start:end].tobytes()
+
+    def exchange(self, start, end):
+        """Return the `(body, status, headers)` of the response recorded
+        between the given offsets.
+        """
+        return response(json.loads(self.read(start, end).decode('utf8')))
+
+
+class Recorder(object):
+    """Forwards requests to a real adapter (by default, requests' own
+    `HTTPAdapter`), and appends each exchange to the JSON lines cassette
+    at `path`, so that it can be replayed later with `load`.
+
+    Exchanges are written in the flat JSON lines format, one line each,
+    without the headers in `TRANSPORT_HEADERS`. Bodies are written as
+    text if they are valid UTF-8, and in base64 otherwise.
+    """
+    def __init__(self, path, adapter=None):
+        self.path = path
+        self.adapter = adapter or HTTPAdapter()
+        self._lock = threading.Lock()
+
+    def forward(self, method, url, headers=None, body=None):
+        """Send the given request through this recorder's adapter,
+        record the exchange, and return the response's
+        `(body, status, headers)`.
+        """
+        # Send the request.
+        request = Request(method, url, headers=dict(headers or {}),
+                          data=body or None).prepare()
+        resp = self.adapter.send(request)
+        body = resp.content
+        headers = dict([(k, v) for k, v in resp.headers.items()
+                        if k.lower() not in TRANSPORT_HEADERS])
+
+        # Record the exchange, as a single line.
+        exchange = OrderedDict([
+            ('method', method), ('url', url), ('status', resp.status_code),
+        ])
+        if headers:
+            exchange['headers'] = headers
+        try:
+            exchange['body'] = body.decode('utf8')
+        except UnicodeDecodeError:
+            exchange['body_base64'] = base64.b64encode(body).decode('ascii')
+        line = json.dumps(exchange, separators=(',', ':')) + '\n'
+        with self._lock:
+            with open(self.path, 'ab') as file_:
+                file_.write(line.encode('utf8'))
+        return body, resp.status_code, headers
+
+
+def load(path, format=None, **kwargs):
+    """Return a `Registry` of every exchange in the cassette at `path`.
+
+    The format is `har` or `jsonl`; if it is not given, files ending
+    in `.har` are taken to be HAR files, and anything else JSON lines.
+
+    Keyword arguments are the settings given to each `Recorded` response.
+    """
+    registry = Registry()
+    for url, recorded in entries(path, format, **kwargs):
+        registry[url] = recorded
+    return registry
+
+
+def entries(path, format=None, **kwargs):
+    """Yield a `(URL, Recorded)` tuple for each exchange in the cassette
+    at `path`; see `load`.
+
+    When the same request was recorded more than once, the last
+    recording wins, once registered.
+    """
+    if format is None:
+        format = 'har' if path.lower().endswith('.har') else 'jsonl'
+    if format not in ('har', 'jsonl'):
+        raise ValueError('Unknown cassette format %r; expected har or '
+                         'jsonl.' % format)
+
+    # Find the exchanges, and read the method and URL of each, parsing
+    # only the request (and leaving the response to be read later).
+    source = Source(path)
+    with open(path, 'rb') as file_:
+        if format == 'har':
+            view = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+            offsets = _har_offsets(view)
+        else:
+            view = None
+            offsets = _line_offsets(file_)
+        try:
+            for start, end, data in offsets:
+                if view is None:
+                    method, url = _line_request(data.decode('utf8'))
+                else:
+                    method, url = request(json.loads(
+                        view[data[0]:data[1]].decode('utf8'),
+                    ))
+                yield (URL(url, method=method),
+                       Recorded(source, start, end, **kwargs))
+        finally:
+            if view is not None:
+                view.close()
+
+
+def request(exchange):
+    """Return the `(method, url)` of the given recorded exchange."""
+    if 'request' in exchange:
+        exchange = exchange['request']
+    return exchange.get('method', 'GET'), exchange['url']
+
+
+def response(exchange):
+    """Return the `(body, status, headers)` of the given recorded
+    exchange.
+    """
+    # HAR entries keep their response separately, with the body (which
+    # may be base64 encoded) as the text of its content.
+    if 'response' in exchange:
+        answer = exchange['response']
+        content = answer.get('content', {})
+        body = content.get('text', '')
+        if content.get('encoding') == 'base64':
+            body = base64.b64decode(body)
+        headers = answer.get('headers', [])
+        if content.get('mimeType'):
+            headers = [{'name': 'Content-Type',
+                        'value': content['mimeType']}] + list(headers)
+        status = answer.get('status', 200)
+    else:
+        body = exchange.get('body', '')
+        if 'body_base64' in exchange:
+            body = base64.b64decode(exchange['body_base64'])
+        headers = exchange.get('headers', {})
+        status = exchange.get('status', 200)
+
+    # Headers may be a mapping, or a HAR-style list of names and values.
+    if isinstance(headers, dict):
+        headers = [{'name': k, 'value': v} for k, v in headers.items()]
+    headers = dict([(i['name'], i['value']) for i in headers
+                    if i['name'].lower() not in TRANSPORT_HEADERS])
+    return body, status, headers
+
+
+def _line_request(line):
+    """Return the `(method, url)` of the exchange on the given JSON
+    line, decoding its members only until both are found (or a HAR-style
+    `request` is), so that the bodies which follow them (as `Recorder`
+    writes them) are not parsed. Other strings, such as bodies before
+    them, are skipped over rather than decoded.
+    """
+    end = _SPACE.match(line).end()
+    if line[end:end + 1] != '{':
+        return request(json.loads(line))
+    found = {}
+    end += 1
+    while 'method' not in found or 'url' not in found:
+        end = _SPACE.match(line, end).end()
+        if line[end:end + 1] == '}':
+            break
+        if line[end:end + 1] == ',':
+            end = _SPACE.match(line, end + 1).end()
+        key, end = _DECODER.raw_decode(line, end)
+        end = _SPACE.match(line, end).end()
+        if line[end:end + 1] != ':':
+            raise ValueError('Expected a colon at character %d of an '
+                             'exchange.' % end)
+        end = _SPACE.match(line, end + 1).end()
+        if key not in ('method', 'url', 'request') and \
+           line[end:end + 1] == '"':
+            end = _string_end(line, end)
+            continue
+        value, end = _DECODER.raw_decode(line, end)
+        if key == 'request':
+            return request(value)
+        found[key] = value
+    return request(found)
+
+
+def _string_end(text, start):
+    """Return the offset just past the end of the JSON string starting
+    at `start` in the given text.
+    """
+    end = start
+    while True:
+        end = text.find('"', end + 1)
+        if end < 0:
+            raise ValueError('Unterminated string starting at character '
+                             '%d of an exchange.' % start)
+
+        # A quote is escaped by an odd number of backslashes.
+        escapes = 0
+        while text[end - escapes - 1] == '\\':
+            escapes += 1
+        if not escapes % 2:
+            return end + 1
+
+
+def _line_offsets(file_):
+    """Yield a `(start, end, line)` tuple for each non-blank line of
+    the given file.
+    """
+    start = 0
+    for line in file_:
+        end = start + len(line)
+        if line.strip():
+            yield start, end, line
+        start = end
+
+
+def _har_offsets(view):
+    """Yield a `(start, end, request)` tuple for each entry in the given
+    HAR file, where `request` is the `(start, end)` of the entry's
+    request object, by scanning for the brackets around them (and
+    skipping over strings), without parsing anything.
+    """
+    depth = 0
+    in_entries = False
+    previous = None
+    start = None
+    request_start = None
+    request_end = None
+    for token in _TOKENS.finditer(view):
+        text = token.group()
+        if text in (b'{', b'['):
+            depth += 1
+            if text == b'[' and depth == 3 and previous == b'"entries"':
+                in_entries = True
+            elif in_entries and depth == 4:
+                start = token.start()
+            elif depth == 5 and start is not None and \
+                 previous == b'"request"':
+                request_start = token.start()
+        elif text in (b'}', b']'):
+            depth -= 1
+            if depth == 4 and request_start is not None and \
+               request_end is None:
+                request_end = token.end()
+            elif in_entries and depth == 3 and start is not None:
+                if request_end is None:
+                    yield start, token.end(), (start, token.end())
+                else:
+                    yield start, token.end(), (request_start, request_end)
+                start = request_start = request_end = None
+            elif in_entries and depth == 2:
+                return
+        previous = text
@@ -1,5 +1,44 @@
+import six
+
+
+@six.python_2_unicode_compatible
 class UnregisteredRequest(AssertionError):
-    pass
+    """Raised when a request matches no registration.
+
+    Misses may be expected (by code probing for URLs, say), so the
+    message is only built when the exception is rendered, by calling
+    `render`, if one is given.
+    """
+    def __init__(self, request, render=None):
+        super(UnregisteredRequest, self).__init__(request)
+        self.request = request
+        self._render = render
+        self._message = None
+
+    def __str__(self):
+        if self._message is None:
+            if self._render is None:
+                self._message = six.text_type(self.request)
+            else:
+                self._message = self._render()
+        return self._message
+
+
+class InjectedFault(Exception):
+    """Raised by `FauxAdapter.dispatch` when a fault which keeps any
+    response from arriving (see `fauxquests.faults`) is injected into
+    a request. Each client raises its own exception in its place.
+    """
+    def __init__(self, kind, request):
+        super(InjectedFault, self).__init__(kind, request)
+        self.kind = kind
+        self.request = request
+
+
+class ConsumedBody(RuntimeError):
+    """Raised when a response whose body is an iterator (such as
+    a generator) is served again, once the iterator has been consumed.
+    """
 
 
 # Deprecated.
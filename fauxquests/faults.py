@@ -0,0 +1,138 @@
+"""Faults injected into some of the requests sent to a registration (or to
+any registration), to exercise retries and circuit breakers.
+
+A fault may be injected into every request, into requests chosen at
+random (with a seeded generator, so that runs can be repeated), or into
+requests chosen by a schedule. The kinds of fault are:
+  - `connection_error`: The connection is refused, and no response
+    arrives.
+  - `connect_timeout`: The connection is never established; the client
+    gives up after its connect timeout.
+  - `read_timeout`: The response never arrives; the client gives up
+    after its read timeout.
+  - `truncate`: The body breaks off partway through (at `at`), as if
+    the connection were lost, while the headers promise all of it.
+  - `content_length`: The `Content-Length` header is wrong, by `extra`
+    bytes.
+  - `stall`: The body stops arriving partway through (at `at`) for
+    `seconds`, and then resumes.
+
+The first three are raised from the client (as requests' own
+`ConnectionError`, `ConnectTimeout` and `ReadTimeout`, say); the rest
+are only noticed as the body is read.
+
+Every fault counts the requests it has `seen` and those it has `chosen`
+to inject itself into; the journal counts the faults actually injected,
+by kind (see `fauxquests.journal.Journal`).
+"""
+from __future__ import division, unicode_literals
+import random
+import six
+import threading
+
+
+# Faults which keep any response from arriving.
+ERRORS = frozenset(('connection_error', 'connect_timeout', 'read_timeout'))
+
+
+class Fault(object):
+    """A fault of the given `kind` (see above), injected into some of
+    the requests this fault sees.
+
+    Which requests are chosen by a schedule, a probability, or both:
+      - `on`: The numbers of the requests (counting from 1) to inject
+        the fault into.
+      - `every`: Inject the fault into every `every`th request.
+      - `probability`: Inject the fault into each (scheduled) request
+        with this probability, drawn from a generator seeded with
+        `seed`.
+    If none of these are given, the fault is injected into every request.
+
+    Where the body of a response breaks off (`truncate`) or stalls
+    (`stall`) is given by `at`: a number of bytes if it is an integer,
+    or else a fraction of the body. Fractions of a body whose length is
+    not known in advance (a stream, without a `Content-Length`) cannot
+    be taken, and so such responses are left alone, as they are by
+    `content_length`. Responses without a body are always left alone.
+    """
+    KINDS = ('connection_error', 'connect_timeout', 'read_timeout',
+             'truncate', 'content_length', 'stall')
+
+    def __init__(self, kind, probability=None, every=None, on=None,
+                       seed=None, at=0.5, seconds=1, extra=1):
+        if kind not in self.KINDS:
+            raise ValueError('Unknown fault %r; expected one of: %s.'
+                             % (kind, ', '.join(self.KINDS)))
+        self.kind = kind
+        self.probability = probability
+        self.every = every
+        self.on = frozenset(on) if on is not None else None
+        self.at = at
+        self.seconds = seconds
+        self.extra = extra
+        self.seen = 0
+        self.chosen = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Fault: %s>' % self.kind
+
+    def fires(self):
+        """Take a request, and return True if this fault is to be
+        injected into it.
+        """
+        with self._lock:
+            self.seen += 1
+            if self.on is not None:
+                answer = self.seen in self.on
+            elif self.every:
+                answer = self.seen % self.every == 0
+            else:
+                answer = True
+            if answer and self.probability is not None:
+                answer = self._random.random() < self.probability
+            if answer:
+                self.chosen += 1
+            return answer
+
+    def apply(self, resp):
+        """Make the given `Resp` faulty, as this fault dictates, and
+        return True, or return False if this fault cannot be injected
+        into it.
+
+        Faults in `ERRORS` keep the response from arriving at all, and
+        so are raised (see `InjectedFault`) rather than applied.
+        """
+        length = resp.length
+        if length == 0:
+            return False
+        if self.kind == 'content_length':
+            if length is None:
+                return False
+            resp.headers['Content-Length'] = '%d' % (length + self.extra)
+            resp.reusable = False
+        else:
+            offset = self.offset(length)
+            if offset is None:
+                return False
+            if self.kind == 'truncate':
+                resp.break_at = offset
+                if length is not None and not resp.chunk_size:
+                    resp.headers['Content-Length'] = '%d' % length
+            else:
+                resp.stall_at = offset
+                resp.stall = self.seconds
+        resp.fault = self.kind
+        return True
+
+    def offset(self, length):
+        """Return the offset, in a body of the given length (which may
+        be None, if it is not known), given by `at`, or None if it
+        cannot be determined.
+        """
+        if isinstance(self.at, six.integer_types):
+            return self.at
+        if length is None:
+            return None
+        return int(length * self.at)
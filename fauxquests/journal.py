@@ -0,0 +1,347 @@
+from __future__ import division, unicode_literals
+from collections import deque, namedtuple
+from fauxquests.timing import REAL_CLOCK
+from fauxquests.utils import URL
+from requests.compat import OrderedDict
+import hashlib
+import io
+import six
+import threading
+
+
+class Journal(object):
+    """A record of the requests sent through a FauxAdapter, so that
+    asserts can be made against what was done.
+
+    The journal's `mode` determines what is kept for each request:
+      - `full`: the request object itself.
+      - `summary`: a `Summary` of the request (method, canonical URL,
+        matched route and body size, for streamed bodies, their digest
+        and upload rate, and any fault injected), which does not hold on
+        to the request's body or headers.
+      - `count`: nothing; only the total count is kept.
+
+    If `maxlen` is provided, only the most recent `maxlen` entries are
+    kept, so memory stays bounded however many requests are sent. Either
+    way, `entries` can be indexed and sliced like a list.
+
+    Times are told by `clock`.
+
+    Alongside the entries, the journal keeps a `RouteStats` object for
+    every route (registry key) that has answered a request, so that
+    questions about a single route never require scanning the journal.
+
+    The journal and each route also count the requests answered with
+    a 304 (`not_modified`), so that a client's cache hit ratio can be
+    measured whatever the mode. Both also count the bytes of request
+    bodies received (`uploaded`) and the faults injected into requests
+    (`faults`, by kind; see `fauxquests.faults`), and each route keeps
+    the `Upload` describing each request's body (`uploads`), whatever
+    the mode.
+
+    Recording is serialized by a lock, so a journal may be shared by
+    adapters serving requests from several threads.
+    """
+    MODES = ('full', 'summary', 'count')
+
+    def __init__(self, mode='full', maxlen=None, clock=REAL_CLOCK):
+        if mode not in self.MODES:
+            raise ValueError('Unknown journal mode %r; expected one of: %s.'
+                             % (mode, ', '.join(self.MODES)))
+        self.mode = mode
+        self.maxlen = maxlen
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def clear(self):
+        """Forget every request recorded so far."""
+        self.count = 0
+        self.not_modified = 0
+        self.uploaded = 0
+        self.faults = {}
+        self.routes = {}
+        if self.maxlen is None:
+            self.entries = []
+        else:
+            self.entries = Entries(maxlen=self.maxlen)
+
+    def record(self, request, url, route, body=None, status=None,
+                     upload=None, fault=None):
+        """Record that `request` was sent, for the (canonical) `url`,
+        with the given `body`, and was answered by the registration
+        for `route` with the given `status`.
+
+        If the body was received, `upload` is the `Upload` describing it
+        (see `drain`); for streamed bodies, which have been consumed, this
+        is all that is known about them. Requests
+        refused before a registration was found have no `route`. If
+        a fault was injected into the request, `fault` is its kind;
+        requests which got no response at all have no `status`.
+        """
+        # Build the entry for this request, as dictated by our mode.
+        entry = None
+        if self.mode == 'full':
+            entry = request
+        elif self.mode == 'summary':
+            entry = Summary(
+                method=url.method,
+                url=url,
+                route=route,
+                body_size=upload.size if upload else body_size(body),
+                status=status,
+                body_digest=upload.digest if upload else None,
+                upload_rate=upload.rate if upload else None,
+                fault=fault,
+            )
+
+        # Add the entry to the journal and to the route's statistics.
+        with self._lock:
+            self.count += 1
+            if upload is not None:
+                self.uploaded += upload.size
+            if status == 304:
+                self.not_modified += 1
+            if fault is not None:
+                self.faults[fault] = self.faults.get(fault, 0) + 1
+            if route is not None:
+                stats = self.routes.get(route)
+                if stats is None:
+                    stats = self.routes[route] = RouteStats(
+                        route, self.maxlen, self.mode,
+                    )
+                stats.record(url, entry, self.clock.time(), status, fault,
+                             upload)
+            if entry is not None:
+                self.entries.append(entry)
+
+    def stats(self, route):
+        """Return the `RouteStats` for the given route, or None if the
+        route has not answered any requests.
+        """
+        return self.routes.get(route)
+
+
+# The most query string pairs a route keeps counts for in `count` mode,
+# when the journal is not otherwise bounded; see `RouteStats`.
+COUNT_MODE_PAIRS = 1000
+
+
+class RouteStats(object):
+    """Statistics about the requests answered by a single route.
+
+    This holds the number of requests (and how many were answered with
+    a 304, and the faults injected into them, by kind), when the first
+    and last of them were received, the journal
+    entries for them (bounded in the same way as the journal itself),
+    how many requests carried each query string `(key, value)` pair
+    (`pairs`), and how many times each distinct URL was requested
+    (`urls`, which is not kept in `count` mode).
+
+    It also holds the bytes of request bodies received (`uploaded`),
+    and the `Upload` describing each request's body, or None if it had
+    none (`uploads`). These line up with `entries`, so `uploads[-1]`
+    describes the body of `entries[-1]`; in `count` mode, which keeps
+    no entries, only the most recent upload is kept unless `maxlen` is
+    given.
+
+    If `maxlen` is provided, only the `maxlen` most recently requested
+    pairs and URLs are kept, so that routes which see endless distinct
+    query strings (such as cache busters) stay bounded too. In `count`
+    mode, which keeps memory constant whatever is sent, pairs are bounded
+    even without `maxlen`, to the `COUNT_MODE_PAIRS` most recent.
+    """
+    def __init__(self, route, maxlen=None, mode='full'):
+        self.route = route
+        self.maxlen = maxlen
+        self.mode = mode
+        self._limit = maxlen
+        if maxlen is None and mode == 'count':
+            self._limit = COUNT_MODE_PAIRS
+        self.count = 0
+        self.not_modified = 0
+        self.uploaded = 0
+        self.faults = {}
+        self.first = None
+        self.last = None
+        self.pairs = OrderedDict()
+        self.urls = OrderedDict()
+        self._postings = {}
+        if maxlen is None:
+            self.entries = []
+        else:
+            self.entries = Entries(maxlen=maxlen)
+        if maxlen is None and mode != 'count':
+            self.uploads = []
+        else:
+            self.uploads = Entries(maxlen=maxlen or 1)
+
+    def record(self, url, entry=None, now=None, status=None, fault=None,
+                     upload=None):
+        """Record a request for `url`, with the given journal entry,
+        received at the time `now` and answered with `status`, into
+        which the given kind of `fault` was injected (if any), and whose
+        body is described by `upload` (if it had one).
+        """
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.count += 1
+        if status == 304:
+            self.not_modified += 1
+        if fault is not None:
+            self.faults[fault] = self.faults.get(fault, 0) + 1
+        if upload is not None:
+            self.uploaded += upload.size
+        self.uploads.append(upload)
+        for pair in url.pairs:
+            self._count(self.pairs, pair)
+        if self.mode != 'count':
+            if url not in self.urls:
+                for pair in url.pairs:
+                    self._postings.setdefault(pair, set()).add(url)
+            for evicted in self._count(self.urls, url):
+                for pair in evicted.pairs:
+                    _discard(self._postings, pair, evicted)
+        if entry is not None:
+            self.entries.append(entry)
+
+    def called_with(self, **kwargs):
+        """Return True if any request answered by this route carried
+        every one of the given query string keys and values.
+
+        This is answered from the pairs (and URLs) kept, so only recent
+        requests are considered if `maxlen` was given, or in `count` mode
+        once more than `COUNT_MODE_PAIRS` pairs were seen. In `count`
+        mode, where URLs are not kept, this tells whether every pair was
+        seen, but not whether they were seen together.
+        """
+        wanted = URL(self.route.uri, method=self.route.method, **kwargs)
+        if not wanted.pairs:
+            return self.count > 0
+        if any([pair not in self.pairs for pair in wanted.pairs]):
+            return False
+        if self.mode == 'count' or len(wanted.pairs) == 1:
+            return True
+
+        # Check the URLs carrying the rarest of the pairs for the others.
+        postings = sorted([self._postings.get(pair, ())
+                           for pair in wanted.pairs], key=len)
+        return any([wanted.pairs <= url.pairs for url in postings[0]])
+
+    def _count(self, counts, key):
+        """Count `key` in the given ordered dictionary, as the most
+        recent, and return a list of the keys evicted to stay within
+        this route's limit.
+        """
+        counts[key] = counts.pop(key, 0) + 1
+        evicted = []
+        while self._limit is not None and len(counts) > self._limit:
+            evicted.append(counts.popitem(last=False)[0])
+        return evicted
+
+
+class Entries(deque):
+    """A bounded deque of journal entries, which (like a list, but unlike
+    a deque) can be sliced.
+    """
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return super(Entries, self).__getitem__(index)
+
+
+Summary = namedtuple('Summary', ['method', 'url', 'route', 'body_size',
+                                 'status', 'body_digest', 'upload_rate',
+                                 'fault'])
+Summary.__new__.__defaults__ = (None, None, None, None)
+
+
+# The size of the chunks that streamed request bodies are read in.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class Upload(namedtuple('Upload', ['size', 'digest', 'seconds'])):
+    """A request body, as received: its size in bytes, its SHA-1 digest
+    (if it was computed), and the seconds it took to arrive.
+    """
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """Return the rate, in bytes per second, at which the body
+        arrived, or None if it took no time at all.
+        """
+        if not self.seconds:
+            return None
+        return self.size / self.seconds
+
+
+def is_streamed(body):
+    """Return True if the given request body is streamed: a file object
+    or an iterator (such as a generator) yielding chunks.
+    """
+    if isinstance(body, io.IOBase):
+        return True
+    return hasattr(body, '__next__') or hasattr(body, 'next')
+
+
+def drain(body, bandwidth=None, clock=REAL_CLOCK,
+                chunk_size=UPLOAD_CHUNK_SIZE):
+    """Consume the given streamed request body (a file object, or an
+    iterable of chunks) a chunk at a time, as a server would, and return
+    an `Upload` describing it. The body is digested as it is read, and
+    is never held in memory.
+
+    If `bandwidth` is given, each chunk takes as long to arrive (as
+    measured by `clock`) as that many bytes per second dictates, so
+    whatever produces the body is held back accordingly.
+    """
+    if isinstance(body, io.IOBase):
+        chunks = iter(lambda: body.read(chunk_size) or b'', b'')
+    else:
+        chunks = iter(body)
+    digest = hashlib.sha1()
+    size = 0
+    started = clock.time()
+    for chunk in chunks:
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+        digest.update(chunk)
+        size += len(chunk)
+        if bandwidth:
+            clock.sleep(len(chunk) / bandwidth)
+    return Upload(size, digest.hexdigest(), clock.time() - started)
+
+
+def _discard(index, key, value):
+    """Remove `value` from the set stored under `key` in the given
+    index, removing the set once it is empty.
+    """
+    values = index.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del index[key]
+
+
+def body_size(body):
+    """Return the size, in bytes, of the given request body, or None if
+    it cannot be determined without consuming the body.
+    """
+    if body is None:
+        return 0
+    if isinstance(body, six.text_type):
+        return len(body.encode('utf8'))
+    if isinstance(body, (six.binary_type, bytearray)):
+        return len(body)
+    return None
@@ -0,0 +1,109 @@
+"""Rate limits, which answer requests beyond a quota with an error (a 429,
+by default) rather than the registered response.
+
+A limit may be attached to a single registration, to a host, or to
+a whole `FauxAdapter` (or `FauxServer`); see `FauxAdapter`. Limits are
+told the time by the adapter's clock, so with a `VirtualClock`, quotas
+over long windows can be tested without waiting for them.
+
+Every limit counts the requests it has `allowed` and `limited`.
+"""
+from __future__ import division, unicode_literals
+from collections import deque
+from fauxquests.response import Template
+import math
+import threading
+
+
+class Limit(object):
+    """The base class for rate limits.
+
+    Requests beyond the limit are answered with the given `status`,
+    `headers` and `body`, along with a `Retry-After` header giving the
+    (whole) seconds until a request would be allowed, and the limit's
+    `X-RateLimit-Limit` and `X-RateLimit-Remaining`.
+
+    Subclasses implement `_acquire`.
+    """
+    def __init__(self, status=429, headers=None, body=''):
+        self.status = status
+        self.headers = dict(headers or {})
+        self.body = body
+        self.allowed = 0
+        self.limited = 0
+        self._lock = threading.Lock()
+
+    def check(self, now):
+        """Take a request made at the time `now` against this limit,
+        and return None if it is allowed, or else a `Template` for the
+        response refusing it.
+        """
+        with self._lock:
+            retry_after = self._acquire(now)
+            if retry_after is None:
+                self.allowed += 1
+                return None
+            self.limited += 1
+
+        headers = dict(self.headers)
+        headers['Retry-After'] = '%d' % math.ceil(retry_after)
+        headers['X-RateLimit-Limit'] = '%d' % self.quota
+        headers['X-RateLimit-Remaining'] = '0'
+        return Template(self.body, self.status, headers)
+
+    def _acquire(self, now):
+        """Take a request made at the time `now`, and return None if it
+        is allowed, or else the seconds until one would be.
+
+        This is called with the limit's lock held.
+        """
+        raise NotImplementedError
+
+
+class TokenBucket(Limit):
+    """A limit allowing `rate` requests per second on average, in bursts
+    of up to `burst` requests (by default, a second's worth).
+
+    The bucket starts full, and refills continuously; each request takes
+    a token, and requests finding it empty are refused.
+    """
+    def __init__(self, rate, burst=None, **kwargs):
+        super(TokenBucket, self).__init__(**kwargs)
+        self.rate = rate
+        self.quota = burst or max(int(rate), 1)
+        self.tokens = self.quota
+        self._updated = None
+
+    def _acquire(self, now):
+        # Refill the bucket for the time since the last request.
+        if self._updated is not None:
+            self.tokens = min(self.quota, self.tokens +
+                                          (now - self._updated) * self.rate)
+        self._updated = now
+
+        # Take a token, if there is one.
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / self.rate
+
+
+class SlidingWindow(Limit):
+    """A limit allowing at most `limit` requests in any `window` seconds.
+    """
+    def __init__(self, limit, window, **kwargs):
+        super(SlidingWindow, self).__init__(**kwargs)
+        self.quota = limit
+        self.window = window
+        self._times = deque()
+
+    def _acquire(self, now):
+        # Forget requests that have left the window.
+        while self._times and self._times[0] <= now - self.window:
+            self._times.popleft()
+
+        # Count this request, if there is room for it.
+        if len(self._times) < self.quota:
+            self._times.append(now)
+            return None
+        return self._times[0] + self.window - now
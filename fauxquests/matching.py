@@ -0,0 +1,237 @@
+"""Telling apart requests for the same URL by their headers and bodies.
+
+A registration may require that a request carries certain headers, or
+has a certain body: either exactly, or as JSON (compared canonically, so
+that key order and whitespace do not matter), or as JSON of which the
+registered JSON is a subset. Such registrations for the same URL are
+gathered into a single `MatchSet`, which is what the registry holds.
+
+Bodies are never compared one pair at a time. Registered bodies (and
+the canonical form of registered JSON) are digested once, when they are
+registered; each request's body is digested (and, if need be, parsed
+and digested as JSON) once, and the digests find the candidates.
+"""
+from __future__ import unicode_literals
+from fauxquests.response import body_digest
+import json
+import six
+
+
+# Marks a request body which is not JSON.
+NOT_JSON = object()
+
+
+class Match(object):
+    """The headers and body a request must have to be answered by
+    a registration.
+
+    `headers` is a mapping of header names (in any case) to the exact
+    values required. At most one of `body` (bytes or text, compared
+    exactly) and `json` (any JSON-serializable value, compared
+    canonically) may be given; if `subset` is set, the request's JSON
+    need only contain `json` (see `json_subset`).
+    """
+    def __init__(self, headers=None, body=None, json=None, subset=False):
+        if body is not None and json is not None:
+            raise ValueError('A registration may match on a body, or on '
+                             'JSON, but not both.')
+        self.headers = tuple(sorted([
+            (k.lower(), v) for k, v in (headers or {}).items()
+        ]))
+        self.expected = json
+        if body is not None:
+            self.kind = 'body'
+            self.digest = body_digest(body)
+        elif json is not None:
+            self.kind = 'subset' if subset else 'json'
+            self.digest = body_digest(canonical_json(json))
+        else:
+            self.kind = None
+            self.digest = None
+
+        # Registrations with the same conditions replace one another.
+        self.key = (self.kind, self.digest, self.headers)
+
+    def __bool__(self):
+        return bool(self.kind or self.headers)
+    __nonzero__ = __bool__
+
+    def headers_match(self, headers):
+        """Return True if the given (case-insensitive) request headers
+        include every header this match requires.
+        """
+        for name, value in self.headers:
+            if headers.get(name) != value:
+                return False
+        return True
+
+
+class MatchSet(object):
+    """The responses registered for a single URL, told apart by the
+    headers and bodies of requests (see `Match`).
+
+    A match set belongs to the registry (its `owner`) that it was made
+    for. `add` and `replace_default` change a match set in place only
+    when asked to by its owner, publishing each change with a single
+    assignment so that lookups in progress are unaffected; otherwise
+    they return a new one, so that match sets shared with other
+    registries (such as the base of an overlay) never change.
+
+    Requests are answered by the most specific registration they match:
+    one matching the body exactly, then one matching the body's
+    canonical JSON, then one matching a subset of it, and then one only
+    requiring headers. Within each, registrations requiring more headers
+    win, and then the one made first.
+    Requests matching none of them are answered by the `default`
+    response (registered with no conditions), if there is one.
+    """
+    def __init__(self, default=None, owner=None):
+        self.default = default
+        self.owner = owner
+        self._bodies = {}
+        self._json = {}
+        self._subsets = ()
+        self._headers = ()
+
+    def add(self, match, response, owner=None):
+        """Return a match set, owned by `owner`, with `response`
+        registered for requests satisfying `match` (replacing any
+        response registered for the same conditions).
+
+        If `owner` owns this match set, it is changed in place (and the
+        owner must serialize such changes); otherwise a copy is made.
+        """
+        answer = self._for(owner)
+        answer._put(match, response)
+        return answer
+
+    def replace_default(self, response, owner=None):
+        """Return a match set, owned by `owner`, with `response` as its
+        default (changing this one in place if `owner` owns it).
+        """
+        answer = self._for(owner)
+        answer.default = response
+        return answer
+
+    def select(self, headers, body):
+        """Return the response for a request with the given
+        (case-insensitive) headers and body, or None if there is not one.
+        """
+        # Look for the request's body, as-is.
+        if self._bodies:
+            digest = body_digest(body)
+            for match, response in self._bodies.get(digest, ()):
+                if match.headers_match(headers):
+                    return response
+
+        # Look for the request's body, as JSON.
+        if self._json or self._subsets:
+            parsed = parse_json(body)
+            if parsed is not NOT_JSON:
+                digest = body_digest(canonical_json(parsed))
+                for match, response in self._json.get(digest, ()):
+                    if match.headers_match(headers):
+                        return response
+                for match, response in self._subsets:
+                    if match.headers_match(headers) and \
+                       json_subset(match.expected, parsed):
+                        return response
+
+        # Look for the request's headers alone.
+        for match, response in self._headers:
+            if match.headers_match(headers):
+                return response
+        return self.default
+
+    def _for(self, owner):
+        """Return this match set if `owner` owns it, or else a copy of it
+        owned by `owner`.
+        """
+        if owner is not None and owner is self.owner:
+            return self
+        answer = self.__class__(self.default, owner)
+        answer._bodies = dict(self._bodies)
+        answer._json = dict(self._json)
+        answer._subsets = self._subsets
+        answer._headers = self._headers
+        return answer
+
+    def _put(self, match, response):
+        """Register `response` for requests satisfying `match`, in place,
+        replacing any response registered for the same conditions.
+
+        Only the tuple of entries being changed is rebuilt, and it is
+        swapped in with a single assignment.
+        """
+        def put(entries):
+            return _ranked([i for i in entries if i[0].key != match.key],
+                           (match, response))
+
+        if match.kind == 'body':
+            self._bodies[match.digest] = put(
+                self._bodies.get(match.digest, ()),
+            )
+        elif match.kind == 'json':
+            self._json[match.digest] = put(self._json.get(match.digest, ()))
+        elif match.kind == 'subset':
+            self._subsets = put(self._subsets)
+        else:
+            self._headers = put(self._headers)
+
+
+def canonical_json(value):
+    """Return the canonical JSON text for the given value, with sorted
+    keys and no insignificant whitespace.
+    """
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def parse_json(body):
+    """Return the given request body parsed as JSON, or `NOT_JSON` if it
+    is not JSON (or is not held in memory).
+    """
+    if isinstance(body, (six.binary_type, bytearray)):
+        try:
+            body = bytes(body).decode('utf8')
+        except UnicodeDecodeError:
+            return NOT_JSON
+    if not isinstance(body, six.text_type):
+        return NOT_JSON
+    try:
+        return json.loads(body)
+    except ValueError:
+        return NOT_JSON
+
+
+def json_subset(expected, actual):
+    """Return True if `actual` contains `expected`: every key of each
+    object, with a value containing the expected one, and arrays of the
+    same length, whose items each contain the expected one.
+    """
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict):
+            return False
+        for key, value in expected.items():
+            if key not in actual or not json_subset(value, actual[key]):
+                return False
+        return True
+    if isinstance(expected, list):
+        if not isinstance(actual, list) or len(expected) != len(actual):
+            return False
+        for value, other in zip(expected, actual):
+            if not json_subset(value, other):
+                return False
+        return True
+    return expected == actual
+
+
+def _ranked(entries, entry):
+    """Return a tuple of the given `(match, response)` pairs (which are
+    already ranked, those requiring the most headers first) with `entry`
+    inserted after every pair requiring at least as many headers.
+    """
+    position = len(entries)
+    while position and \
+            len(entries[position - 1][0].headers) < len(entry[0].headers):
+        position -= 1
+    return tuple(entries[:position]) + (entry,) + tuple(entries[position:])
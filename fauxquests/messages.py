@@ -1,5 +1,22 @@
 NOT_FOUND = """{request}
 
-Registered requests are:
+The closest registered requests ({shown} of {count}) are:
     - {registered_requests}
 """
+
+
+NOT_MATCHED = """{request}
+
+Requests for {route} are registered, but only for other headers or
+bodies.
+"""
+
+
+CALL_COUNT = """{route} was called {count} time(s); expected {expected}."""
+
+
+NOT_CALLED_WITH = """{route} was never called with {query}.
+
+Calls to it were:
+    - {calls}
+"""
@@ -0,0 +1,248 @@
+"""Emulated connection pools, so that pool sizes can be tuned against
+a FauxAdapter as they would be against a real server.
+
+As with requests' own `HTTPAdapter` (whose `pool_connections`,
+`pool_maxsize` and `pool_block` settings are honoured), there is a pool
+of connections for each host (scheme, host and port), and at most
+`num_pools` of them are kept open; the least recently used is closed,
+along with its idle connections, to make room for another.
+
+Each request checks a connection out of its host's pool, and returns it
+once its response has been read (or closed), so that responses which
+are streamed, and never read or closed, hold on to their connections.
+Up to `maxsize` connections returned are kept for reuse. When every one
+is checked out, a pool which does not `block` opens another, which is
+discarded when it is returned, as urllib3 does; one which blocks waits
+for a connection to be returned, raising urllib3's `EmptyPoolError` if
+none is within `timeout` seconds (of real time, since it is other
+threads that are being waited for).
+
+No connections are actually made; pools only count them. Each `Pool`
+counts its checkouts, the connections it `opened`, `reused` and
+`discarded`, those `in_use` (and the `peak` of that), and the time (as
+told by `clock`) that checkouts waited for a connection.
+"""
+from __future__ import division, unicode_literals
+from fauxquests.timing import REAL_CLOCK
+from requests.compat import OrderedDict, urlsplit
+from urllib3.exceptions import EmptyPoolError
+import threading
+import time
+
+
+# The ports used by each scheme, when a URL does not give one.
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# The number of URL prefixes whose pool keys are remembered.
+MAX_KEYS = 1024
+
+
+class PoolManager(object):
+    """Keeps a `Pool` of connections for each host (see above)."""
+    def __init__(self, num_pools=10, maxsize=1, block=False, timeout=None,
+                       clock=REAL_CLOCK):
+        self.num_pools = num_pools
+        self.maxsize = maxsize
+        self.block = block
+        self.timeout = timeout
+        self.clock = clock
+        self.evicted = 0
+        self.pools = {}
+        self._open = OrderedDict()
+        self._recent = None
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Close every pool, discarding its idle connections."""
+        with self._lock:
+            for pool in self._open.values():
+                pool.close()
+            self._open.clear()
+            self._recent = None
+
+    def connection_from_url(self, url):
+        """Check a connection out of the pool for the host of the given
+        URL, and return it; it must be released once the response has
+        been read.
+        """
+        # Requests for the host used most recently need not touch the
+        # order in which pools were used.
+        key = self._key(url)
+        if key == self._recent:
+            return self.pools[key].get()
+        with self._lock:
+            self._recent = key
+            pool = self._open.pop(key, None)
+            if pool is None:
+                pool = self.pools.get(key)
+                if pool is None:
+                    pool = self.pools[key] = Pool(key, self.maxsize,
+                                                  self.block, self.timeout,
+                                                  self.clock)
+                if len(self._open) >= self.num_pools:
+                    self._open.popitem(last=False)[1].close()
+                    self.evicted += 1
+            self._open[key] = pool
+        return pool.get()
+
+    def pool(self, url):
+        """Return the `Pool` for the host of the given URL, or None if no
+        request has been sent to it.
+        """
+        return self.pools.get(self._key(url))
+
+    def _key(self, url):
+        """Return the key of the pool for the host of the given URL (see
+        `pool_key`), remembering it for the URL's scheme and host.
+        """
+        end = url.find('/', url.find('//') + 2)
+        prefix = url if end < 0 else url[:end]
+        key = self._keys.get(prefix)
+        if key is None:
+            if len(self._keys) >= MAX_KEYS:
+                self._keys = {}
+            key = self._keys[prefix] = pool_key(prefix)
+        return key
+
+
+class Pool(object):
+    """The connections to a single host; see above."""
+    def __init__(self, key, maxsize=1, block=False, timeout=None,
+                       clock=REAL_CLOCK):
+        self.key = key
+        self.maxsize = maxsize
+        self.block = block
+        self.timeout = timeout
+        self.clock = clock
+        self.checkouts = 0
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self.waited = 0
+        self.max_wait = 0
+
+        # The pool holds up to `maxsize` slots, each of which is either an
+        # idle connection or room for a new one; connections returned
+        # after the pool was closed belong to an earlier generation.
+        self._slots = maxsize
+        self._idle = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+
+    def __repr__(self):
+        return '<Pool: %s>' % self.key
+
+    @property
+    def mean_wait(self):
+        """Return the mean time a checkout waited for a connection."""
+        if not self.checkouts:
+            return 0
+        return self.waited / self.checkouts
+
+    def get(self):
+        """Check a connection out of this pool, and return it."""
+        with self._lock:
+            # If every connection is checked out, wait for one (if this
+            # pool blocks), or else open another.
+            waited = 0
+            if not self._slots and self.block:
+                started = self.clock.time()
+                self._wait()
+                waited = self.clock.time() - started
+            if self._slots:
+                self._slots -= 1
+                reused = self._idle > 0
+                if reused:
+                    self._idle -= 1
+            else:
+                reused = False
+
+            # Count the checkout.
+            self.checkouts += 1
+            if reused:
+                self.reused += 1
+            else:
+                self.opened += 1
+            if waited > 0:
+                self.waits += 1
+                self.waited += waited
+                self.max_wait = max(self.max_wait, waited)
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+            return Connection(self, self._generation)
+
+    def put(self, connection, reusable=True):
+        """Return the given connection to this pool, keeping it for reuse
+        if it is `reusable` and there is room for it.
+        """
+        with self._lock:
+            self.in_use -= 1
+            if connection.generation != self._generation or \
+               self._slots >= self.maxsize:
+                self.discarded += 1
+                return
+            self._slots += 1
+            if reusable:
+                self._idle += 1
+            if self.block:
+                self._ready.notify()
+
+    def close(self):
+        """Discard this pool's idle connections, and any returned later."""
+        with self._lock:
+            self._generation += 1
+            self._slots = self.maxsize
+            self._idle = 0
+            self._ready.notify_all()
+
+    def _wait(self):
+        """Wait for a connection to be returned, raising EmptyPoolError if
+        none is within this pool's timeout.
+
+        This is called with the pool's lock held.
+        """
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        while not self._slots:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise EmptyPoolError(self, 'Pool is empty and a new '
+                                               'connection can\'t be opened '
+                                               'due to blocking mode.')
+            self._ready.wait(remaining)
+
+
+class Connection(object):
+    """A connection checked out of a `Pool`."""
+    __slots__ = ('pool', 'generation', 'released')
+
+    def __init__(self, pool, generation):
+        self.pool = pool
+        self.generation = generation
+        self.released = False
+
+    def release(self, reusable=True):
+        """Return this connection to its pool, if it has not been already;
+        see `Pool.put`.
+        """
+        if not self.released:
+            self.released = True
+            self.pool.put(self, reusable)
+
+
+def pool_key(url):
+    """Return the key of the pool for the host of the given URL: its
+    scheme, host and port, as in `http://example.com:80`.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    port = parts.port or DEFAULT_PORTS.get(scheme)
+    return '%s://%s:%s' % (scheme, (parts.hostname or '').lower(), port)
@@ -26,19 +26,459 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from six import BytesIO
+from __future__ import division
+from collections import namedtuple
+from email.utils import formatdate, mktime_tz, parsedate_tz
+from fauxquests.exceptions import ConsumedBody
+from fauxquests.timing import REAL_CLOCK
+from fauxquests.utils import LRUCache
+from six.moves.http_client import IncompleteRead
+import hashlib
+import io
+import mmap
+import os
+import six
+import time
+import uuid
+import zlib
 
 import requests.status_codes
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3 import HTTPResponse
 
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
 
-class Resp(BytesIO):
-    def __init__(self, stream, status=200, headers=None):
+
+# The size of the chunks that chunked responses are sent in, by default.
+CHUNK_SIZE = 8192
+
+
+# Marks a text encoding that has not been worked out yet.
+UNKNOWN = object()
+
+
+# The response headers which are repeated in a 304 (Not Modified) response.
+NOT_MODIFIED_HEADERS = frozenset((
+    'cache-control', 'content-location', 'date', 'etag', 'expires',
+    'last-modified', 'vary',
+))
+
+
+class Template(object):
+    """An immutable, registered response.
+
+    The body is stored exactly once, as immutable bytes; every request
+    gets its own lightweight `Resp` cursor over it (see `open`), so
+    serving a response never copies the body, and concurrent readers
+    cannot interfere with one another.
+
+    The body may also be given as:
+      - a read-only memoryview (such as one returned by `mapped`), which
+        is served as-is;
+      - a file object, which is mapped into memory rather than read;
+      - any other iterable of chunks (such as a generator), which is
+        only iterated as the response is read. A fresh iterator is taken
+        for each response, so an iterator or generator can only be
+        served once; serving it again raises `ConsumedBody`, rather
+        than sending an empty body.
+
+    A template may also carry its own `latency`, `ttfb`, `bandwidth`
+    and `ranges` settings (see `Resp` and `open`); a setting of None
+    means that the adapter's setting applies.
+
+    If `conditional` is set, the template computes validators for its
+    body, once: a strong `ETag` (a digest of the body) and
+    a `Last-Modified` date (the time `modified`, defaulting to now),
+    unless the headers already provide them. Conditional requests which
+    these validators satisfy are then answered with a 304 (see `open`).
+    Bodies which are iterables of chunks cannot be digested without
+    consuming them, and so never get an `ETag`.
+
+    If `encodings` are given (any of the names in `ENCODERS`), the body
+    is also compressed with each of them, once, and kept alongside the
+    original; each request is sent the variant it prefers (see `open`).
+    As with validators, iterables of chunks are never compressed.
+
+    A template may also carry its own `chunked` setting (see `open`);
+    as with `ranges`, None means that the adapter's setting applies. Its
+    `limit` (see `fauxquests.limits`) applies along with the adapter's,
+    and its `faults` (see `fauxquests.faults`) are tried before them.
+
+    Everything about the response that does not depend on the request
+    (its reason phrase, case-insensitive headers, and the text encoding
+    they declare) is worked out once, here, rather than for each
+    response built from it.
+    """
+    __slots__ = ('body', 'status', 'reason', '_store', 'latency', 'ttfb',
+                 'bandwidth', 'ranges', 'etag', 'modified', 'variants',
+                 'chunked', '_etag_header', 'encoding', 'limit', 'faults')
+
+    def __init__(self, body, status=200, headers=None, latency=None,
+                       ttfb=None, bandwidth=None, ranges=None,
+                       conditional=False, modified=None, encodings=None,
+                       chunked=None, limit=None, faults=None):
+        _set = super(Template, self).__setattr__
+        _set('body', _body(body))
+        _set('status', status)
+        _set('reason', reason_phrase(status))
+        _set('latency', latency)
+        _set('ttfb', ttfb)
+        _set('bandwidth', bandwidth)
+        _set('ranges', ranges)
+        _set('chunked', chunked)
+        _set('limit', limit)
+        _set('faults', faults)
+
+        # Compute the validators for this body, if requested.
+        headers = dict(headers or {})
+        etag = None
+        modified_at = None
+        _set('_etag_header', None)
+        if conditional:
+            names = dict((k.lower(), k) for k in headers)
+            if 'etag' not in names and isinstance(self.body, memoryview):
+                headers['ETag'] = '"%s"' % hashlib.sha1(self.body).hexdigest()
+                names['etag'] = 'ETag'
+            if 'last-modified' not in names:
+                if modified is None:
+                    modified = time.time()
+                headers['Last-Modified'] = formatdate(modified, usegmt=True)
+                names['last-modified'] = 'Last-Modified'
+            etag = headers.get(names.get('etag'))
+            modified_at = http_date(headers[names['last-modified']])
+            _set('_etag_header', names.get('etag'))
+        _set('etag', etag)
+        _set('modified', modified_at)
+        headers = CaseInsensitiveDict(headers)
+        _set('_store', headers._store)
+        _set('encoding', get_encoding_from_headers(headers))
+
+        # Compress the body with each of the requested encodings. Each
+        # variant is a distinct representation, and so gets its own tag.
+        variants = []
+        if isinstance(self.body, memoryview):
+            for encoding in encodings or ():
+                encoder = ENCODERS.get(encoding)
+                if encoder is None:
+                    raise ValueError('Unsupported content encoding %r; '
+                                     'expected one of: %s.' % (
+                                         encoding, ', '.join(ENCODERS),
+                                     ))
+                variant_etag = None
+                if etag is not None:
+                    variant_etag = '%s-%s"' % (etag.rstrip('"'), encoding)
+                variants.append((encoding, memoryview(encoder(self.body)),
+                                 variant_etag))
+        _set('variants', tuple(variants))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Template objects are immutable.')
+
+    @property
+    def headers(self):
+        """Return a copy of the headers for this response."""
+        return dict(self._store.values())
+
+    def open(self, range_header=None, ranges=False, if_none_match=None,
+                   if_modified_since=None, accept_encoding=None,
+                   chunked=False, **kwargs):
+        """Return a new `Resp` object for reading this response.
+
+        If this template has encoded variants of its body (see above),
+        the variant which best matches `accept_encoding` (the value of
+        a request's `Accept-Encoding` header) is sent.
+
+        If this template has validators (see above), and the values of
+        a request's `If-None-Match` or `If-Modified-Since` headers show
+        that the client already has this response, the response is a 304
+        with no body.
+
+        If `ranges` is set, and this is a successful response with
+        a body of known length, the response advertises that it accepts
+        byte ranges, and a `range_header` (the value of a request's
+        `Range` header) is honoured: the response is a 206 with only
+        the requested parts of the body (sliced, not copied), or a 416
+        if none of the requested ranges can be satisfied. A header that
+        cannot be parsed is ignored, as HTTP requires.
+
+        If `chunked` is set, the response is sent with chunked transfer
+        encoding, in chunks of `chunked` bytes (or `CHUNK_SIZE` bytes,
+        if it is simply True); see `ChunkedReader`.
+
+        Other keyword arguments are passed on to `Resp`.
+        """
+        # Select the variant of the body to send.
+        body, etag = self.body, self.etag
+        headers = _copy_headers(self._store)
+        if self.variants:
+            headers['Vary'] = ', '.join(filter(None, (
+                headers.pop('Vary', None), 'Accept-Encoding',
+            )))
+            encoding = choose_encoding(accept_encoding,
+                                       [v[0] for v in self.variants])
+            for name, variant, variant_etag in self.variants:
+                if name == encoding:
+                    body, etag = variant, variant_etag
+                    headers['Content-Encoding'] = encoding
+                    if etag is not None:
+                        headers[self._etag_header] = etag
+
+        # Answer conditional requests, if the client is up to date.
+        if self.status == 200 and self._not_modified(etag, if_none_match,
+                                                     if_modified_since):
+            headers = dict((k, v) for k, v in headers.items()
+                           if k.lower() in NOT_MODIFIED_HEADERS)
+            return Resp(b'', 304, headers, **kwargs)
+
+        # Open the body (or the requested parts of it).
+        if ranges and self.status == 200 and isinstance(body, memoryview):
+            resp = self._open_range(body, headers, range_header, **kwargs)
+        elif not isinstance(body, memoryview):
+            resp = StreamResp(body, self.status, headers, reason=self.reason,
+                              encoding=self.encoding, **kwargs)
+        else:
+            resp = Resp(body, self.status, headers, reason=self.reason,
+                        encoding=self.encoding, **kwargs)
+
+        # Send the body in chunks, if requested.
+        if chunked:
+            resp.headers.pop('Content-Length', None)
+            resp.headers['Transfer-Encoding'] = 'chunked'
+            resp.chunk_size = CHUNK_SIZE if chunked is True else chunked
+        return resp
+
+    def _not_modified(self, etag, if_none_match, if_modified_since):
+        """Return True if the given values of a request's `If-None-Match`
+        and `If-Modified-Since` headers match this response, with the
+        given entity tag.
+        """
+        # If-None-Match takes precedence; weak tags match strong ones.
+        if if_none_match:
+            if etag is None:
+                return False
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or _strong(etag) in map(_strong, tags)
+
+        # Otherwise, compare dates (to the second).
+        if if_modified_since and self.modified is not None:
+            since = http_date(if_modified_since)
+            return since is not None and self.modified <= since
+        return False
+
+    def _open_range(self, body, headers, range_header, **kwargs):
+        """Return a new `Resp` object for reading the parts of the given
+        body requested by the given `Range` header.
+        """
+        headers['Accept-Ranges'] = 'bytes'
+        length = len(body)
+        spans = None
+        if range_header:
+            spans = byte_ranges(range_header, length)
+
+        # If there is no (intelligible) Range header, send everything.
+        if spans is None:
+            return Resp(body, self.status, headers, reason=self.reason,
+                        encoding=self.encoding, **kwargs)
+
+        # If none of the requested ranges overlap the body, the request
+        # cannot be satisfied.
+        if not spans:
+            headers['Content-Range'] = 'bytes */%d' % length
+            headers['Content-Length'] = '0'
+            return Resp(b'', 416, headers, **kwargs)
+
+        # A single range is sent as-is.
+        if len(spans) == 1:
+            start, stop = spans[0]
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1,
+                                                          length)
+            headers['Content-Length'] = '%d' % (stop - start)
+            return Resp(body[start:stop], 206, headers,
+                        encoding=self.encoding, **kwargs)
+
+        # Several ranges are sent as the parts of a multipart body.
+        boundary = uuid.uuid4().hex
+        content_type = headers.pop('Content-Type', None)
+        chunks = []
+        for start, stop in spans:
+            head = '--%s\r\n' % boundary
+            if content_type:
+                head += 'Content-Type: %s\r\n' % content_type
+            head += 'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+                start, stop - 1, length,
+            )
+            chunks += [head.encode('ascii'), body[start:stop], b'\r\n']
+        chunks.append(('--%s--\r\n' % boundary).encode('ascii'))
+        headers['Content-Type'] = 'multipart/byteranges; boundary=%s' % \
+                                  boundary
+        headers['Content-Length'] = '%d' % sum(len(c) for c in chunks)
+        return StreamResp(chunks, 206, headers, **kwargs)
+
+
+class Dynamic(object):
+    """A registered response which is computed from each request, by
+    calling a function.
+
+    The function is given a `Call` describing the request, and returns
+    a body (anything `Template` accepts), or a tuple of a body and
+    a status code, or of a body, a status code and headers. Headers
+    returned are added to (or replace) the registered ones.
+
+    Other keyword arguments are the settings given to every `Template`
+    built from the function's answers.
+
+    If `cache` is given, up to that many templates are kept in an
+    `LRUCache` (see `cache`), keyed by the request's canonical URL and
+    a digest of its body; requests with the same URL and body are then
+    answered without calling the function again. Answers which are
+    iterables of chunks can only be served once, and so are not cached.
+    """
+    def __init__(self, callback, status=200, headers=None, cache=None,
+                       **kwargs):
+        self.callback = callback
         self.status = status
-        self.headers = headers or {}
-        self.reason = requests.status_codes._codes.get(
-            status, ['']
-        )[0].upper().replace('_', ' ')
-        BytesIO.__init__(self, stream)
+        self._headers = tuple((headers or {}).items())
+        self.cache = LRUCache(cache) if cache else None
+        self._kwargs = kwargs
+
+    @property
+    def limit(self):
+        """Return the rate limit for this registration, if any."""
+        return self._kwargs.get('limit')
+
+    @property
+    def faults(self):
+        """Return the faults injected into this registration's
+        responses, if any.
+        """
+        return self._kwargs.get('faults')
+
+    def render(self, call, modified=None):
+        """Return a `Template` answering the given `Call`, from the cache
+        if possible.
+
+        If validators are computed (see `Template`), the response was
+        last modified at the time `modified`.
+        """
+        # Look for an answer to the same request in the cache.
+        key = None
+        if self.cache is not None:
+            digest = body_digest(call.body)
+            if digest is not None:
+                key = (six.text_type(call.url), digest)
+                template = self.cache.get(key)
+                if template is not None:
+                    return template
+
+        # Call the function, and make sense of what it returns.
+        result = self.callback(call)
+        if not isinstance(result, tuple):
+            result = (result,)
+        body, status, headers = (result + (None, None))[:3]
+        if status is None:
+            status = self.status
+        headers = dict(self._headers, **dict(headers or {}))
+        template = Template(body, status, headers, modified=modified,
+                            **self._kwargs)
+
+        # Cache the answer, if it can be served more than once.
+        if key is not None and isinstance(template.body, memoryview):
+            self.cache.set(key, template)
+        return template
+
+
+# A request, as given to the function of a `Dynamic` response: its method,
+# canonical `URL`, headers and body, the client's own request object, and
+# the parameters captured by the route template that matched, if any.
+Call = namedtuple('Call', ['method', 'url', 'headers', 'body', 'request',
+                           'params'])
+Call.__new__.__defaults__ = (None,)
+
+
+class Resp(io.RawIOBase):
+    """A read cursor over a response body, which also quacks enough like
+    urllib3's response object for requests to build a response from it.
+
+    The body is never copied; `stream` may be a memoryview shared with
+    other `Resp` objects.
+
+    Reads may also be made to take time, as measured by `clock`:
+      - `latency`: The seconds taken for the response to arrive. This is
+        not waited for by `Resp` itself, but by the adapter sending it.
+      - `ttfb`: The seconds taken for the first byte of the body to
+        arrive, once the response has.
+      - `bandwidth`: The rate, in bytes per second, at which the body
+        arrives.
+
+    Headers are kept in a `CaseInsensitiveDict` (which is used as-is, if
+    one is given). The text `encoding` declared by the headers may be
+    given, if it is already known; otherwise it is worked out from the
+    headers when it is first needed.
+
+    A response may also be made faulty (see `fauxquests.faults`), in
+    which case `fault` names the fault:
+      - `break_at`: The offset at which the body breaks off. Reads stop
+        there, and reading any further raises `IncompleteRead`, as it
+        would if the connection were lost.
+      - `stall_at` and `stall`: The offset at which the body stops
+        arriving, and the seconds before it resumes. Reads stop there,
+        and the next read takes that much longer.
+
+    A response sent over a pooled `connection` (see `fauxquests.pool`)
+    releases it once the body has been read, or the response closed.
+    The connection is thrown away, rather than reused, if the body
+    breaks off, or if the response is not `reusable` (as when its
+    `Content-Length` is wrong).
+    """
+    def __init__(self, stream, status=200, headers=None, reason=None,
+                       latency=0, ttfb=0, bandwidth=None, clock=REAL_CLOCK,
+                       encoding=UNKNOWN):
+        self.connection = None
+        self.status = status
+        if not isinstance(headers, CaseInsensitiveDict):
+            headers = CaseInsensitiveDict(headers)
+        self.headers = headers
+        if reason is None:
+            reason = reason_phrase(status)
+        self.reason = reason
+        self._encoding = encoding
+        if not isinstance(stream, memoryview):
+            stream = memoryview(bytes(stream))
+        self._body = stream
+        self._position = 0
+        self.chunk_size = None
+        self.fault = None
+        self.break_at = None
+        self.stall_at = None
+        self.stall = 0
+        self.reusable = True
+        self.latency = latency
+        self.ttfb = ttfb
+        self.bandwidth = bandwidth
+        self.clock = clock
+
+    @property
+    def encoding(self):
+        """Return the text encoding declared by this response's headers,
+        if any.
+        """
+        if self._encoding is UNKNOWN:
+            self._encoding = get_encoding_from_headers(self.headers)
+        return self._encoding
+
+    @property
+    def length(self):
+        """Return the length of the body, in bytes, or None if it is not
+        known in advance.
+        """
+        return len(self._body)
 
     @property
     def _original_response(self):
@@ -48,8 +488,109 @@ class Resp(BytesIO):
     def msg(self):
         return self
 
-    def read(self, chunk_size, **kwargs):
-        return BytesIO.read(self, chunk_size)
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, chunk_size=-1, **kwargs):
+        chunk, delay = self.read_timed(chunk_size)
+        self.clock.sleep(delay)
+        return chunk
+
+    def read_timed(self, chunk_size=-1):
+        """Read from the body without waiting, and return a tuple of the
+        chunk read and the number of seconds the read should take.
+
+        This allows asynchronous callers to do their own waiting.
+        """
+        if self.break_at is not None or self.stall_at is not None:
+            chunk, delay = self._read_faulty(chunk_size)
+        else:
+            chunk, delay = self._read(chunk_size)
+
+        # Once the body has been read, its connection is free again.
+        if self.connection is not None and \
+           (not chunk or chunk_size is None or chunk_size < 0):
+            self._release()
+        return chunk, delay
+
+    def _read(self, chunk_size=-1):
+        """Read from the body as `read_timed` does, disregarding any
+        faults.
+        """
+        self._checkClosed()
+        end = len(self._body)
+        if chunk_size is not None and chunk_size >= 0:
+            end = min(self._position + chunk_size, end)
+        chunk = self._body[self._position:end].tobytes()
+        self._position = max(self._position, end)
+
+        # Determine how long this read should take.
+        delay = self.ttfb
+        self.ttfb = 0
+        if self.bandwidth:
+            delay += len(chunk) / self.bandwidth
+        return chunk, delay
+
+    def _read_faulty(self, chunk_size=-1):
+        """Read from the body as `read_timed` does, stopping where it
+        stalls or breaks off.
+        """
+        if chunk_size is None or chunk_size < 0:
+            chunk_size = -1
+        start = self._position
+        expected = None
+        if self.break_at is not None and self.length is not None:
+            expected = self.length - self.break_at
+        if self.break_at is not None and start >= self.break_at:
+            self._release(reusable=False)
+            raise IncompleteRead(b'', expected)
+
+        # Reading everything that is left gets whatever arrives before
+        # the body breaks off, and then fails, as http.client does.
+        if chunk_size < 0 and self.break_at is not None:
+            chunk, _ = self._read(self.break_at - start)
+            self._release(reusable=False)
+            raise IncompleteRead(chunk, expected)
+
+        # Otherwise, stop at the next offset where anything happens.
+        if chunk_size >= 0:
+            for stop in (self.stall_at, self.break_at):
+                if stop is not None and start < stop < start + chunk_size:
+                    chunk_size = stop - start
+        chunk, delay = self._read(chunk_size)
+
+        # The read which reaches the stall waits for it to end.
+        if self.stall_at is not None and \
+           start <= self.stall_at < start + len(chunk):
+            delay += self.stall
+            self.stall_at = None
+        return chunk, delay
+
+    def readinto(self, b):
+        chunk = self.read(len(b))
+        b[:len(chunk)] = chunk
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._body)
+        if offset < 0:
+            raise ValueError('Negative seek position %d.' % offset)
+        self._position = offset
+        return offset
+
+    def tell(self):
+        self._checkClosed()
+        return self._position
+
+    def getvalue(self):
+        return self._body.tobytes()
 
     def info(self):
         return self
@@ -65,3 +606,354 @@ class Resp(BytesIO):
 
     def release_conn(self):
         self.close()
+
+    def close(self):
+        self._release()
+        super(Resp, self).close()
+
+    def _release(self, reusable=True):
+        """Release this response's connection, if it has one."""
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            connection.release(reusable and self.reusable)
+
+    def isclosed(self):
+        return self.closed
+
+
+class StreamResp(Resp):
+    """A `Resp` which reads its body from an iterable of chunks, pulling
+    chunks only as they are read, so that the full body is never held
+    in memory (unless it is read all at once).
+
+    Chunks may be bytes or text (which is encoded as UTF-8). A stream
+    can only be read forwards, and cannot be seeked.
+    """
+    def __init__(self, chunks, *args, **kwargs):
+        super(StreamResp, self).__init__(b'', *args, **kwargs)
+        self._chunks = iter(chunks)
+        self._pending = b''
+
+    @property
+    def length(self):
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            return None
+        return int(length)
+
+    def seekable(self):
+        return False
+
+    def _read(self, chunk_size=-1):
+        self._checkClosed()
+        if chunk_size is None:
+            chunk_size = -1
+
+        # Pull chunks until there are enough bytes to answer the read,
+        # keeping anything beyond that for the next one.
+        parts = [self._pending]
+        size = len(self._pending)
+        while chunk_size < 0 or size < chunk_size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            if isinstance(chunk, six.text_type):
+                chunk = chunk.encode('utf8')
+            parts.append(chunk)
+            size += len(chunk)
+        chunk = parts[0] if len(parts) == 1 else b''.join(parts)
+        if 0 <= chunk_size < size:
+            chunk, self._pending = chunk[:chunk_size], chunk[chunk_size:]
+        else:
+            self._pending = b''
+        self._position += len(chunk)
+
+        # Determine how long this read should take.
+        delay = self.ttfb
+        self.ttfb = 0
+        if self.bandwidth:
+            delay += len(chunk) / self.bandwidth
+        return bytes(chunk), delay
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        raise io.UnsupportedOperation('Streamed responses are not seekable.')
+
+    def getvalue(self):
+        return self.read()
+
+
+class ChunkedReader(io.RawIOBase):
+    """A reader which frames the body of a `Resp` with chunked transfer
+    encoding, and quacks enough like `http.client.HTTPResponse` for
+    urllib3 to read it as it would a real chunked response.
+
+    The body is read from the `Resp`, one chunk at a time, only as the
+    framed body is read.
+    """
+    def __init__(self, resp, chunk_size=CHUNK_SIZE):
+        self.resp = resp
+        self.fp = self
+        self.chunk_size = chunk_size
+        self._buffer = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        while (size < 0 or len(self._buffer) < size) and not self._done:
+            self._frame()
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readline(self, limit=-1):
+        while b'\n' not in self._buffer and not self._done:
+            self._frame()
+        index = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if limit is not None and limit >= 0:
+            index = min(index, limit)
+        line, self._buffer = self._buffer[:index], self._buffer[index:]
+        return line
+
+    def _safe_read(self, size):
+        return self.read(size)
+
+    def close(self):
+        self.fp = None
+        self.resp.close()
+        super(ChunkedReader, self).close()
+
+    def _frame(self):
+        """Read the next chunk of the body, and add it to the buffer with
+        its framing; after the last chunk, add the terminating chunk.
+        """
+        chunk = self.resp.read(self.chunk_size)
+        if not chunk:
+            self._buffer += b'0\r\n\r\n'
+            self._done = True
+            return
+        self._buffer += ('%x\r\n' % len(chunk)).encode('ascii') + chunk + \
+                        b'\r\n'
+
+
+def choose_encoding(header, encodings):
+    """Return the one of the given content encodings which is most
+    acceptable according to the given `Accept-Encoding` header, or None
+    if the body should be sent unencoded.
+
+    Ties go to the encoding listed first.
+    """
+    if not header:
+        return None
+
+    # Parse the quality of each encoding from the header.
+    qualities = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    # Choose the best encoding; anything not mentioned is only
+    # acceptable if "*" is.
+    answer = None
+    best = 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best:
+            answer, best = encoding, quality
+    return answer
+
+
+def byte_ranges(header, length):
+    """Return a list of `(start, stop)` tuples for the satisfiable byte
+    ranges in the given `Range` header, for a body of the given length.
+
+    Return None if the header cannot be parsed, in which case it should
+    be ignored; an empty list means that none of the ranges can be
+    satisfied.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    answer = []
+    for part in spec.split(','):
+        first, dash, last = part.strip().partition('-')
+        if not dash or not (first or last) or \
+                       not (first.isdigit() or not first) or \
+                       not (last.isdigit() or not last):
+            return None
+
+        # Ranges are either `first-last` (inclusive), `first-` (to the
+        # end), or `-suffix` (the last `suffix` bytes).
+        if first:
+            start = int(first)
+            stop = int(last) + 1 if last else length
+            if last and stop <= start:
+                return None
+        else:
+            start = max(length - int(last), 0)
+            stop = length if int(last) else 0
+        if start < min(stop, length):
+            answer.append((start, min(stop, length)))
+    return answer
+
+
+def body_digest(body):
+    """Return a digest of the given request body, or None if it cannot
+    be determined without consuming the body.
+    """
+    if body is None:
+        body = b''
+    if isinstance(body, six.text_type):
+        body = body.encode('utf8')
+    if not isinstance(body, (six.binary_type, bytearray, memoryview)):
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+
+def urllib3_response(resp, method='GET'):
+    """Return a urllib3 response reading from the given `Resp`, so that
+    urllib3 decodes its body (undoing any content and chunked transfer
+    encoding) exactly as it would a real response.
+    """
+    resp._method = method
+    body = resp
+    if resp.chunk_size:
+        body = ChunkedReader(resp, resp.chunk_size)
+    return HTTPResponse(
+        body=body,
+        headers=resp.headers,
+        status=resp.status,
+        reason=resp.reason,
+        preload_content=False,
+        decode_content=True,
+        original_response=resp,
+    )
+
+
+def _copy_headers(store):
+    """Return a new `CaseInsensitiveDict` holding the items of the given
+    store (the `_store` of another `CaseInsensitiveDict`), copying the
+    store rather than rebuilding it key by key.
+    """
+    headers = CaseInsensitiveDict.__new__(CaseInsensitiveDict)
+    headers._store = store.copy()
+    return headers
+
+
+def _gzip(data):
+    """Return the given data, compressed in the gzip format."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def http_date(value):
+    """Return the timestamp for the given HTTP date, or None if it
+    cannot be parsed.
+    """
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return mktime_tz(parsed)
+
+
+def _strong(tag):
+    """Return the given entity tag, without any weak indicator."""
+    if tag.startswith('W/'):
+        return tag[2:]
+    return tag
+
+
+def mapped(path):
+    """Return a read-only memoryview of the file at the given path.
+
+    The file is mapped into memory rather than read, so a large file
+    costs nothing to register, and only the parts of it that are
+    actually served are ever paged in.
+    """
+    with open(path, 'rb') as file_:
+        return _map(file_.fileno())
+
+
+def _map(fileno):
+    """Return a read-only memoryview of the given file descriptor."""
+    if not os.fstat(fileno).st_size:
+        # Empty files cannot be mapped.
+        return memoryview(b'')
+    return memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+
+
+def _body(body):
+    """Return the given response body as either a read-only memoryview
+    or an iterable of chunks.
+    """
+    if isinstance(body, memoryview) and body.readonly:
+        return body
+    if isinstance(body, six.text_type):
+        return memoryview(body.encode('utf8'))
+    if isinstance(body, (six.binary_type, bytearray, memoryview)):
+        return memoryview(bytes(body))
+
+    # Map real files into memory; other file-like objects (such as
+    # `io.BytesIO`) are already in memory, and are simply read.
+    if hasattr(body, 'read'):
+        try:
+            return _map(body.fileno())
+        except (AttributeError, io.UnsupportedOperation):
+            return _body(body.read())
+
+    # Iterators (such as generators) can only be iterated once.
+    if iter(body) is body:
+        return _OneShot(body)
+    return body
+
+
+class _OneShot(object):
+    """An iterator of chunks which may only be served once, raising
+    `ConsumedBody` if it is served again, rather than silently serving
+    an empty body.
+    """
+    __slots__ = ('_chunks', '_served')
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._served = False
+
+    def __iter__(self):
+        if self._served:
+            raise ConsumedBody(
+                'This response body is an iterator (such as a generator), '
+                'and was already served. Register a list of chunks, or a '
+                'callable returning a new generator for each request, to '
+                'serve it more than once.'
+            )
+        self._served = True
+        return iter(self._chunks)
+
+
+def reason_phrase(status):
+    """Return the reason phrase (e.g. "NOT FOUND") for the given
+    status code.
+    """
+    return requests.status_codes._codes.get(
+        status, ['']
+    )[0].upper().replace('_', ' ')
+
+
+# The functions which compress a body for each supported content coding.
+# Brotli is only supported if a brotli library is installed.
+ENCODERS = {'gzip': _gzip, 'deflate': zlib.compress}
+if brotli is not None:
+    ENCODERS['br'] = brotli.compress
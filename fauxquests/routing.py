@@ -0,0 +1,275 @@
+from __future__ import unicode_literals
+import re
+
+
+class Router(object):
+    """A tree of templated routes, such as `http://api/users/{id}`,
+    which finds the route matching a URL without considering the routes
+    one at a time.
+
+    Routes are split into segments at each `/`, and stored in a tree
+    (a radix tree keyed by segment), so that a lookup walks one node per
+    segment of the URL, however many routes are registered. At each node,
+    literal segments are tried first, then templated segments (see
+    `Segment`) from the most specific to the least, so the most specific
+    route wins. Registrations for the same route, with different methods
+    and query strings, share a node, where a `QueryIndex` tells them
+    apart just as `Registry` does for literal URLs.
+
+    Each node's registrations are kept in a `bucket`, a new instance of
+    the given class (`QueryIndex`, as used by `Registry`).
+
+    As with `Registry`, lookups never take a lock. Changes must be
+    serialized by the caller, and only ever publish fully built nodes,
+    with a single assignment.
+    """
+    def __init__(self, bucket):
+        self._bucket = bucket
+        self._root = _Node()
+        self._counter = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key, url):
+        """Add the registry key `key`, whose URL object is `url`."""
+        # Find (or build) the node for this route.
+        node = self._root
+        for source in url.uri.split('/'):
+            if '{' not in source:
+                child = node.static.get(source)
+                if child is None:
+                    child = node.static[source] = _Node()
+            else:
+                child = node.find(source)
+                if child is None:
+                    self._counter += 1
+                    child = _Node()
+                    node.dynamic = tuple(sorted(
+                        node.dynamic + ((Segment(source, self._counter),
+                                         child),),
+                        key=lambda i: i[0].rank,
+                    ))
+            node = child
+
+        # Index the key under its method.
+        bucket = node.leaves.get(url.method)
+        if bucket is None:
+            bucket = self._bucket()
+            bucket.add(key, url)
+            node.leaves[url.method] = bucket
+        else:
+            bucket.add(key, url)
+        self._count += 1
+
+    def remove(self, key, url):
+        """Remove the registry key `key`, whose URL object is `url`."""
+        node = self._root
+        for source in url.uri.split('/'):
+            if '{' not in source:
+                node = node.static[source]
+            else:
+                node = node.find(source)
+        bucket = node.leaves[url.method]
+        bucket.remove(key)
+        if not bucket:
+            del node.leaves[url.method]
+        self._count -= 1
+
+    def best(self, url, exclude=()):
+        """Return a `(rank, key, params)` tuple for the most specific
+        route matching `url`, or None if there is not one. Registrations
+        whose keys are in `exclude` are passed over.
+
+        `params` is a dictionary of the values captured by the route's
+        templated segments. Lower ranks are more specific.
+        """
+        if not self._count:
+            return None
+        return self._best(self._root, url.uri.split('/'), 0, url, (), (),
+                          exclude)
+
+    def routes(self):
+        """Yield a `(method, uri, bucket)` tuple for each route in the
+        tree, where `bucket` holds the registrations for that route and
+        method.
+        """
+        stack = [(self._root, ())]
+        while stack:
+            node, sources = stack.pop()
+            for method, bucket in list(node.leaves.items()):
+                yield method, '/'.join(sources), bucket
+            for source, child in list(node.static.items()):
+                stack.append((child, sources + (source,)))
+            for segment, child in node.dynamic:
+                stack.append((child, sources + (segment.source,)))
+
+    def _best(self, node, segments, i, url, ranks, params, exclude=()):
+        """Return the best match for `url` below the given node, which
+        has matched its first `i` segments.
+        """
+        # If every segment has been matched, the route is here, if it
+        # is registered for this method and query string.
+        if i == len(segments):
+            bucket = node.leaves.get(url.method)
+            if bucket is None:
+                return None
+            match = bucket.best(url, exclude)
+            if match is None:
+                return None
+            return (ranks, match[0]), match[1], dict(params)
+
+        # Try a literal segment first, and then the templated ones.
+        child = node.static.get(segments[i])
+        if child is not None:
+            answer = self._best(child, segments, i + 1, url,
+                                ranks + ((0, 0),), params, exclude)
+            if answer is not None:
+                return answer
+        for segment, child in node.dynamic:
+            if segment.path:
+                # This segment captures the remainder of the path.
+                value = '/'.join(segments[i:])
+                if not value:
+                    continue
+                answer = self._best(child, segments, len(segments), url,
+                                    ranks + (segment.rank,),
+                                    params + ((segment.names[0], value),),
+                                    exclude)
+            else:
+                captured = segment.match(segments[i])
+                if captured is None:
+                    continue
+                answer = self._best(child, segments, i + 1, url,
+                                    ranks + (segment.rank,),
+                                    params + captured, exclude)
+            if answer is not None:
+                return answer
+        return None
+
+
+class Segment(object):
+    """A templated segment of a route, such as `{id}` or `{name}.json`.
+
+    Each `{...}` placeholder captures part of a URL's segment, and may
+    give a type or a regular expression after a colon:
+      - `{name}` or `{name:str}`: Any non-empty text.
+      - `{name:int}`: Digits, captured as an integer.
+      - `{name:path}`: The whole remainder of the path, including any
+        slashes. This must be the entire segment.
+      - `{name:<regex>}`: Text matching the regular expression.
+    """
+    CONVERTERS = {
+        'str': ('[^/]+', None),
+        'int': ('[0-9]+', int),
+        'path': ('.+', None),
+    }
+
+    def __init__(self, source, order=0):
+        self.source = source
+        self.names = []
+        self.path = False
+        self._converters = []
+        pattern = ''
+        typed = False
+        for literal, name, spec in _placeholders(source):
+            pattern += re.escape(literal)
+            if not name:
+                continue
+            if spec == 'path':
+                if source != '{%s:path}' % name:
+                    raise ValueError('A path placeholder must be a whole '
+                                     'segment: %r.' % source)
+                self.path = True
+            regex, converter = self.CONVERTERS.get(spec or 'str',
+                                                   (spec, None))
+            typed = typed or spec not in (None, 'str')
+            pattern += '(?P<%s>%s)' % (name, regex)
+            self.names.append(name)
+            self._converters.append((name, converter))
+        self._regex = re.compile(pattern + r'\Z')
+
+        # Segments with literal text or typed placeholders are more
+        # specific than those capturing anything; ties go to the segment
+        # added first.
+        if self.path:
+            kind = 3
+        elif typed or len(source) > len('{%s}' % self.names[0]):
+            kind = 1
+        else:
+            kind = 2
+        self.rank = (kind, order)
+
+    def match(self, value):
+        """Return a tuple of `(name, value)` pairs captured from the given
+        segment of a URL, or None if it does not match.
+        """
+        match = self._regex.match(value)
+        if match is None:
+            return None
+        answer = []
+        for name, converter in self._converters:
+            captured = match.group(name)
+            if converter is not None:
+                captured = converter(captured)
+            answer.append((name, captured))
+        return tuple(answer)
+
+
+class _Node(object):
+    """A node of a `Router`'s tree."""
+    __slots__ = ('static', 'dynamic', 'leaves')
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = ()
+        self.leaves = {}
+
+    def find(self, source):
+        """Return the child for the given templated segment, or None."""
+        for segment, child in self.dynamic:
+            if segment.source == source:
+                return child
+        return None
+
+
+def is_template(uri):
+    """Return True if the given URI is a route template."""
+    return '{' in uri
+
+
+def _placeholders(source):
+    """Yield `(literal, name, spec)` tuples for each placeholder in the
+    given segment, preceded by the literal text before it. The last
+    tuple has only the trailing literal text, with empty name and spec.
+
+    Placeholders may contain (balanced) braces, as in `{id:[0-9]{3}}`.
+    """
+    start = 0
+    while True:
+        opening = source.find('{', start)
+        if opening < 0:
+            yield source[start:], None, None
+            return
+
+        # Find the matching closing brace.
+        depth = 0
+        for closing in range(opening, len(source)):
+            if source[closing] == '{':
+                depth += 1
+            elif source[closing] == '}':
+                depth -= 1
+                if not depth:
+                    break
+        else:
+            raise ValueError('Unbalanced braces in route segment %r.'
+                             % source)
+
+        # Split the placeholder into its name and (optional) spec.
+        name, _, spec = source[opening + 1:closing].partition(':')
+        if not re.match(r'[A-Za-z_][A-Za-z0-9_]*\Z', name):
+            raise ValueError('Invalid placeholder name %r in route '
+                             'segment %r.' % (name, source))
+        yield source[start:opening], name, spec or None
+        start = closing + 1
@@ -5,32 +5,53 @@ from fauxquests.compat import mock
 from requests.compat import OrderedDict
 from requests.sessions import Session
 from sdict import AlphaSortedDict
+import os
+
+# Asynchronous clients can only be faked on Python 3.
+try:
+    from fauxquests import aio
+except (ImportError, SyntaxError):
+    aio = None
 
 
 class FauxServer(Session):
     """A class that can register certain endpoints to have false
     responses returned.
     """
-    def __init__(self, adapter_class=FauxAdapter, url_pattern='%s'):
+    def __init__(self, adapter_class=FauxAdapter, url_pattern='%s',
+                       **adapter_kwargs):
         """Create a new Fauxquests instance, which knows how to
         mock out requests.session.Session and insert itself.
 
         If a `url_pattern` is provided, then all URLs registered
         are interpolated through the `url_pattern`.
+
+        Any other keyword arguments (such as `journal` or `latency`) are
+        passed to each adapter this object creates; see `FauxAdapter`.
+
+        In particular, with `record` (the path of a cassette), requests
+        which match no registration are forwarded to a real adapter (or
+        `passthrough`), and recorded. Whatever the cassette already
+        holds is loaded, and replayed without forwarding anything.
         """
         # Initialize this object.
         super(FauxServer, self).__init__()
         self.patcher = mock.patch('requests.sessions.Session',
                                   return_value=self)
+        self.async_patchers = []
         self.adapters = OrderedDict()
 
         # Write settings to this object.
         self.adapter_class = adapter_class
         self.url_pattern = url_pattern
+        self.adapter_kwargs = adapter_kwargs
 
         # Save a list of registrations to apply to any FauxAdapter
-        # that this FauxServer creates.
+        # that this FauxServer creates. These are compiled into a single
+        # registry (once), which every such adapter uses as its base.
         self.registrations = {}
+        self.cassettes = []
+        self._compiled = None
 
     def __enter__(self):
         """Mock out `requests.session.Session`, replacing it with this
@@ -52,8 +73,10 @@ class FauxServer(Session):
         This method, however, is run before the context manager is applied,
         and applies universally to all adapters this object creates.
         """
-        self.registrations[url] = Registration('', response, status_code,
-                                              method, headers, kwargs)
+        self.registrations[self._key(url, kwargs)] = Registration(
+            '', response, status_code, method, headers, kwargs,
+        )
+        self._compiled = None
 
     def register_json(self, url, response, status_code=200,
                             method='GET', headers=None, **kwargs):
@@ -66,22 +89,42 @@ class FauxServer(Session):
         This method, however, is run before the context manager is applied,
         and applies universally to all adapters this object creates.
         """
-        self.registrations[url] = Registration('json', response, status_code,
-                                               method, headers, kwargs)
+        self.registrations[self._key(url, kwargs)] = Registration(
+            'json', response, status_code, method, headers, kwargs,
+        )
+        self._compiled = None
 
-    def start(self):
-        """Institute the patching process, meaining requests sent to
-        requests (how meta) are caught and handled by our adapter instead.
+    def load(self, path, format=None):
+        """Register every exchange recorded in the cassette at `path`
+        with this FauxServer; see `FauxAdapter.load`.
+
+        Registrations made with `register` take precedence over recorded
+        exchanges for the same request.
         """
-        # Mount the Fauxquests adapter, which handles delivery of
-        # responses based on the provided URL.
-        adapter = self.adapter_class(url_pattern=self.url_pattern)
-        self.mount('https://', adapter)
-        self.mount('http://', adapter)
+        self.cassettes.append((path, format))
+        self._compiled = None
+
+    def compile(self):
+        """Apply every registration saved on this FauxServer to a new
+        adapter, and return that adapter's (frozen) registry.
+
+        This is done once, rather than on every `start`; the result is
+        reused until another registration is made on this object.
+        """
+        if self._compiled is not None:
+            return self._compiled
 
         # Iterate over any registrations that are saved as part of this
-        # FauxServer object and register them to the Adapter.
-        for url, reg in self.registrations.items():
+        # FauxServer object and register them to an adapter.
+        adapter = self.adapter_class(url_pattern=self.url_pattern,
+                                     **self.adapter_kwargs)
+        for path, format in self.cassettes:
+            adapter.load(path, format)
+        record = self.adapter_kwargs.get('record')
+        if record is not None and os.path.exists(record):
+            adapter.load(record, 'jsonl')
+        for key, reg in self.registrations.items():
+            url = key[0] if isinstance(key, tuple) else key
             # Is this a plain registration or a JSON registration?
             method_name = 'register'
             if reg.type:
@@ -91,8 +134,47 @@ class FauxServer(Session):
             getattr(adapter, method_name)(url, reg.response, reg.status_code,
                                           reg.method, reg.headers, **reg.kwargs)
 
-        # Start the patcher.
+        # Freeze and save the registry, so that adapters created by
+        # `start` can be layered over it.
+        self._compiled = adapter._registry.freeze()
+        return self._compiled
+
+    def _key(self, url, kwargs):
+        """Return the key that a registration for the given URL and
+        keyword arguments is saved under.
+
+        Registrations replace earlier ones for the same URL, unless they
+        only match certain headers or bodies (see `FauxAdapter.register`),
+        in which case each is kept.
+        """
+        if any(kwargs.get(i) is not None for i in ('match_headers',
+                                                    'match_body',
+                                                    'match_json')):
+            return url, len(self.registrations)
+        return url
+
+    def start(self):
+        """Institute the patching process, meaining requests sent to
+        requests (how meta) are caught and handled by our adapter instead.
+        """
+        # Mount the Fauxquests adapter, which handles delivery of
+        # responses based on the provided URL. Registrations saved on
+        # this FauxServer come from the compiled base registry; anything
+        # registered on the adapter is layered over it.
+        adapter = self.adapter_class(url_pattern=self.url_pattern,
+                                     base=self.compile(),
+                                     **self.adapter_kwargs)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        # Start the patcher, along with patchers for any asynchronous
+        # clients that are installed, which are answered by the same
+        # adapter.
         self.patcher.start()
+        if aio is not None:
+            self.async_patchers = aio.patchers(adapter)
+        for patcher in self.async_patchers:
+            patcher.start()
 
         # Return the adapter object, which can accept registred
         # URLs with responses
@@ -103,8 +185,16 @@ class FauxServer(Session):
         set this object back to having no adapters.
         """
         self.patcher.stop()
+        for patcher in self.async_patchers:
+            patcher.stop()
+        self.async_patchers = []
         self.adapters = OrderedDict()
 
+        # Anything recorded was registered on the adapter, which is now
+        # discarded, so the cassette must be loaded again.
+        if self.adapter_kwargs.get('record') is not None:
+            self._compiled = None
+
 
 Registration = namedtuple('Registration', ['type', 'response', 'status_code',
                                            'method', 'headers', 'kwargs'])
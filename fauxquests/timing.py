@@ -0,0 +1,188 @@
+from __future__ import division, unicode_literals
+import random
+import threading
+import time
+import weakref
+
+try:
+    import asyncio
+    import contextvars
+except ImportError:
+    asyncio = contextvars = None
+
+
+class Clock(object):
+    """A clock that tells, and waits for, real time."""
+    virtual = False
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """A clock whose time only moves when it is told to.
+
+    Sleeping on a virtual clock returns immediately, having moved the
+    clock forward, so simulated latency costs no real time and tests
+    using it are deterministic.
+
+    Each asyncio task keeps its own time, so that concurrent requests
+    wait concurrently: a task starts at the time its parent had when it
+    was created, and its parent catches up with it once it finishes.
+    Tasks created outside of any task (or by one which had not used the
+    clock yet) start once those before them have finished, as if they
+    were run one after another. The clock's time, as told outside of
+    any task (and in `now`), is the latest that any task has reached.
+
+    Threads, on the other hand, share a single time, so requests sent
+    from several threads at once move the clock forward one after
+    another.
+    """
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self._lock = threading.Lock()
+        self._sequential = start
+        self._tasks = weakref.WeakKeyDictionary()
+        self._joined = weakref.WeakKeyDictionary()
+        self._spawned = None
+        if contextvars is not None:
+            self._spawned = contextvars.ContextVar('spawned', default=None)
+
+    def time(self):
+        task = _current_task()
+        if task is None:
+            return self.now
+        with self._lock:
+            return self._task_time(task)
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.advance(seconds)
+
+    def advance(self, seconds):
+        """Move the clock (or, within an asyncio task, the task's own
+        time) forward by the given number of seconds.
+        """
+        task = _current_task()
+        with self._lock:
+            if task is None:
+                self.now += seconds
+                self._sequential = self.now
+                return
+            now = self._task_time(task) + seconds
+            self._tasks[task] = now
+            self._spawned.set((task, now))
+            self.now = max(self.now, now)
+
+    def _task_time(self, task):
+        """Return the time of the given (current) task, starting it as
+        described above if it has not used this clock before, and
+        catching it up with any tasks it created that have finished.
+
+        This is called with the clock's lock held.
+        """
+        now = self._tasks.get(task)
+        if now is None:
+            spawned = self._spawned.get()
+            parent, now = spawned or (None, self._sequential)
+            task.add_done_callback(
+                lambda task, parent=parent: self._finish(task, parent),
+            )
+        now = max(now, self._joined.pop(task, now))
+        self._tasks[task] = now
+        self._spawned.set((task, now))
+        return now
+
+    def _finish(self, task, parent):
+        """Let the parent of the given finished task (or, if it has none,
+        the tasks created after it) catch up with it.
+        """
+        with self._lock:
+            now = self._tasks.pop(task, None)
+            if now is None:
+                return
+            if parent is None:
+                self._sequential = max(self._sequential, now)
+            else:
+                self._joined[parent] = max(now, self._joined.get(parent,
+                                                                 now))
+
+
+def _current_task():
+    """Return the asyncio task running in this thread, or None."""
+    # Most of the time there is no event loop at all; finding that out
+    # need not cost an exception.
+    if asyncio is None or asyncio._get_running_loop() is None:
+        return None
+    return asyncio.current_task()
+
+
+def sample(value):
+    """Return a number of seconds from the given latency setting, which
+    may be None (no latency), a number, or a callable returning a number
+    (such as one of the distributions in this module).
+    """
+    if value is None:
+        return 0
+    if callable(value):
+        value = value()
+    return max(value, 0)
+
+
+def uniform(low, high, seed=None):
+    """Return a latency distribution drawing uniformly from between
+    `low` and `high` seconds.
+    """
+    rng = random.Random(seed)
+    return lambda: rng.uniform(low, high)
+
+
+def normal(mean, stddev, seed=None):
+    """Return a latency distribution drawing from a normal distribution
+    (truncated at zero) with the given mean and standard deviation.
+    """
+    rng = random.Random(seed)
+    return lambda: max(rng.normalvariate(mean, stddev), 0)
+
+
+def exponential(mean, seed=None):
+    """Return a latency distribution drawing from an exponential
+    distribution with the given mean.
+    """
+    rng = random.Random(seed)
+    return lambda: rng.expovariate(1 / mean)
+
+
+def read_timeout(timeout):
+    """Return the read timeout, in seconds, from a timeout as given to
+    `requests` (a number, a `(connect, read)` tuple, or a urllib3
+    `Timeout` object), or None if there is not one.
+    """
+    if isinstance(timeout, tuple):
+        timeout = timeout[1]
+    timeout = getattr(timeout, 'read_timeout', timeout)
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        return None
+    return timeout
+
+
+def connect_timeout(timeout):
+    """Return the connect timeout, in seconds, from a timeout as given
+    to `requests` (see `read_timeout`), or None if there is not one.
+    """
+    if isinstance(timeout, tuple):
+        timeout = timeout[0]
+    timeout = getattr(timeout, 'connect_timeout', timeout)
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        return None
+    return timeout
+
+
+# The clock used when no other is provided.
+REAL_CLOCK = Clock()
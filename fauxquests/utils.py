@@ -1,59 +1,578 @@
+from collections import OrderedDict
 from fauxquests.exceptions import UnregisteredRequest
 from fauxquests.messages import NOT_FOUND
+from fauxquests.routing import Router, is_template
 from requests.compat import quote
 from sdict import AlphaSortedDict
+from six.moves import intern
 from six.moves.urllib.parse import parse_qs
+import itertools
 import six
+import threading
 
 
 class Registry(dict):
     """A dict subclass that understands how to handle URLs with
     keyword argument subsets for lookups.
+
+    In addition to the underlying dict, the registry keeps an index
+    of its keys bucketed by `(method, uri)`, so that superset lookups
+    only need to consider registrations for the same method and path.
+    Each bucket is a `QueryIndex`, which finds the most specific
+    registration whose query string the request satisfies.
+
+    Keys whose URI is a route template, such as `http://api/users/{id}`,
+    are kept in a `Router` instead, which is consulted only when no
+    literal URL matches; see `resolve`.
+
+    A registry may also be frozen and used as the base of any number
+    of overlays (see `overlay`). An overlay behaves as a registry
+    holding everything in its base plus its own registrations, but
+    creating one costs nothing, and the base is never modified.
+
+    Lookups never take a lock, so a registry may be shared between
+    threads. Changes are serialized by a lock, and are made copy-on-write:
+    new index structures are built to one side and swapped in with a
+    single assignment, so readers see either the old or the new state.
     """
+    def __init__(self, *args, **kwargs):
+        super(Registry, self).__init__()
+        self._lock = threading.RLock()
+        self._index = {}
+        self._router = Router(QueryIndex)
+        self._base = None
+        self._depth = 0
+        self._frozen = False
+        self._shadowed = 0
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        """Set the value for the given key, indexing the key if it
+        has not been seen before.
+        """
+        with self._lock:
+            self._check_mutable()
+
+            # If this key is new, store it before indexing it, so that
+            # readers never find a key in the index without its value.
+            is_new = not super(Registry, self).__contains__(key)
+            super(Registry, self).__setitem__(key, value)
+            if not is_new:
+                return
+            if self._base is not None and key in self._base:
+                self._shadowed += 1
+
+            # Index the key. New buckets are populated before they are
+            # published.
+            url = _as_url(key)
+            if is_template(url.uri):
+                self._router.add(key, url)
+                return
+            bucket = self._index.get((url.method, url.uri))
+            if bucket is None:
+                bucket = QueryIndex()
+                bucket.add(key, url)
+                self._index[(url.method, url.uri)] = bucket
+            else:
+                bucket.add(key, url)
+
+    def __delitem__(self, key):
+        """Remove the given key from both the dict and the index."""
+        with self._lock:
+            self._check_mutable()
+
+            # A key that is present in the base registry cannot simply be
+            # removed from this layer; take a private copy of the base
+            # first.
+            if self._base is not None and key in self._base:
+                self._detach()
+
+            # Remove the key from the index before removing its value.
+            if not super(Registry, self).__contains__(key):
+                raise KeyError(key)
+            url = _as_url(key)
+            if is_template(url.uri):
+                self._router.remove(key, url)
+                super(Registry, self).__delitem__(key)
+                return
+            bucket_key = (url.method, url.uri)
+            bucket = self._index[bucket_key]
+            bucket.remove(key)
+            if not bucket:
+                del self._index[bucket_key]
+            super(Registry, self).__delitem__(key)
+
     def __getitem__(self, key):
         """Return a response corresponding to the given key."""
+        return self.lookup(key)[1]
+
+    def lookup(self, key):
+        """Return a `(registered_key, value)` tuple for the registration
+        that the given key matches, raising UnregisteredRequest if there
+        is not one.
+        """
+        return self.resolve(key)[:2]
+
+    def resolve(self, key, exclude=()):
+        """Return a `(registered_key, value, params)` tuple for the
+        registration that the given key matches, raising
+        UnregisteredRequest if there is not one.
+
+        `params` is a dictionary of the values captured from the key by
+        a route template; it is empty if a literal URL matched.
 
+        Registrations whose keys are in `exclude` are passed over, so
+        that the next best registration can be found when the best one
+        turns a request away.
+        """
         # Sanity check: This might be easy.
         # If the URL is an exact match via. the regular `dict` lookup,
         # then just return that.
         no = object()
-        super_answer = super(Registry, self).get(key, no)
-        if super_answer != no:
-            return super_answer
+        super_answer = self.get(key, no)
+        if super_answer is not no and key not in exclude:
+            return key, super_answer, {}
 
         # Convert the key to a URL object if it is not already one.
         if isinstance(key, (six.text_type, six.binary_type)):
             key = URL(key)
 
         # It's still possible we have a match.
-        # Iterate over each key and see if our key is an exact superset of
-        # the given key.  If any are, return its value immediately.
-        for contender in self.keys():
-            if key.is_exact_superset_of(contender):
-                return self[contender]
+        # Ask the indexes for this method and URI for the most specific
+        # registration that our key is an exact superset of.
+        match = self._best(key, exclude)
+        if match is not None:
+            return match[1], self.get(match[1]), {}
+
+        # Failing that, find the most specific route template which
+        # matches.
+        match = self._best_route(key, exclude)
+        if match is not None:
+            return match[1], self.get(match[1]), match[2]
 
         # Nope, no match. :(
-        # Now, we need to raise an exception.
-        # First, Get a list of the registered URLs in a nice format.
-        registered_requests = '\n    - '.join(
-            [six.text_type(i) for i in six.iterkeys(self)],
-        )
-        if not registered_requests:
-            registered_requests = '(None)'
-
-        # Raise an exception.
         # UnregisteredURL inherits from AssertionError rather than KeyError,
-        # which should give more attractive failures in tests.
-        raise UnregisteredRequest(NOT_FOUND.format(
-            registered_requests=registered_requests,
-            request=key,
-        ))
+        # which should give more attractive failures in tests. Its message
+        # is only built if it is shown.
+        def render():
+            nearest = self.nearest(key)
+            return NOT_FOUND.format(
+                count=len(self),
+                registered_requests='\n    - '.join(
+                    [six.text_type(i) for i in nearest],
+                ) or '(None)',
+                request=key,
+                shown=len(nearest),
+            )
+        raise UnregisteredRequest(key, render)
+
+    def nearest(self, key, count=5):
+        """Return up to `count` registered keys that are closest to the
+        given key (for suggesting what a request that matched nothing
+        might have meant), closest first.
+
+        Routes (each method and URI) are closer the more leading path
+        segments they share with the key's URI, and then if they have
+        the same method; within a route, registrations sharing more query
+        keys with the key come first.
+        """
+        # Other threads may be registering; the indexes are changed in
+        # place, so they are only read with the lock held. (The base is
+        # frozen, and never changes.)
+        with self._lock:
+            url = _as_url(key)
+            names = frozenset([name for name, _ in url.pairs])
+
+            # Find the closest routes, rather than registrations, so that
+            # routes with many query string variants cost no more than those
+            # with one. Narrow the routes down to those sharing ever longer
+            # prefixes of the URI (from the host onwards), and then take
+            # routes from the narrowest set that has any.
+            indexes = self._indexes()
+            levels = [[route for index in indexes for route in index]]
+            cuts = [i + 1 for i, char in enumerate(url.uri) if char == '/']
+            if '://' in url.uri:
+                cuts = cuts[2:]
+            for prefix in [url.uri[:i] for i in cuts] + [url.uri]:
+                found = [i for i in levels[-1] if i[1].startswith(prefix)]
+                if not found:
+                    break
+                levels.append(found)
+            chosen = []
+            for level in reversed(levels):
+                if len(chosen) >= count:
+                    break
+                same = [i for i in level if i[0] == url.method]
+                for routes in (same, level):
+                    for route in routes:
+                        if len(chosen) >= count:
+                            break
+                        if route not in chosen:
+                            chosen.append(route)
+
+            # Take the best registrations from the closest routes.
+            answer = []
+            for route in chosen:
+                entries = []
+                for index in indexes:
+                    if route in index:
+                        entries += index[route].entries()
+                ranked = sorted(entries, key=lambda entry: (
+                    -len(names & frozenset([n for n, _ in entry[1]])),
+                    entry[0],
+                ))
+                for _, _, registered in ranked:
+                    if registered not in answer and registered in self:
+                        answer.append(registered)
+            return answer[:count]
+
+    def __contains__(self, key):
+        if super(Registry, self).__contains__(key):
+            return True
+        return self._base is not None and key in self._base
+
+    def __iter__(self):
+        if self._base is not None:
+            for key in self._base:
+                yield key
+        for key in list(super(Registry, self).keys()):
+            if self._base is None or key not in self._base:
+                yield key
+
+    def __len__(self):
+        answer = super(Registry, self).__len__()
+        if self._base is not None:
+            answer += len(self._base) - self._shadowed
+        return answer
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self.get(i) for i in self]
+
+    def items(self):
+        return [(i, self.get(i)) for i in self]
+
+    def get(self, key, default=None):
+        """Return the value registered under exactly `key`, or `default`.
+
+        Unlike item lookup, this does not attempt superset matching.
+        """
+        no = object()
+        answer = super(Registry, self).get(key, no)
+        if answer is not no:
+            return answer
+        if self._base is not None:
+            return self._base.get(key, default)
+        return default
+
+    def clear(self):
+        """Remove every registration, along with the index."""
+        with self._lock:
+            self._check_mutable()
+            self._index = {}
+            self._router = Router(QueryIndex)
+            self._base = None
+            self._depth = 0
+            self._shadowed = 0
+            super(Registry, self).clear()
+
+    def pop(self, key, *args):
+        """Remove the given key and return its value, keeping the
+        index in sync.
+        """
+        with self._lock:
+            if key not in self:
+                return super(Registry, self).pop(key, *args)
+            value = self.get(key)
+            del self[key]
+            return value
+
+    def popitem(self):
+        """Remove and return an arbitrary `(key, value)` pair, keeping
+        the index in sync.
+        """
+        with self._lock:
+            if self._base is not None:
+                self._detach()
+            key = next(iter(self))
+            return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        """Return the value for the given key, registering `default`
+        first if the key is not present.
+        """
+        with self._lock:
+            if key not in self:
+                self[key] = default
+            return self.get(key)
+
+    def update(self, *args, **kwargs):
+        """Update the registry from a mapping or iterable of pairs,
+        keeping the index in sync.
+        """
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def freeze(self):
+        """Prevent any further changes to this registry, so that it may
+        safely be used as the base of overlays. Returns the registry.
+        """
+        self._frozen = True
+        return self
+
+    @property
+    def frozen(self):
+        """Whether this registry has been frozen (see `freeze`)."""
+        return self._frozen
+
+    def overlay(self):
+        """Return a new, empty registry layered over this one.
+
+        This registry is frozen; registrations made on the overlay are
+        visible only through the overlay, and take precedence over
+        registrations for the same key in this registry.
+        """
+        self.freeze()
+        answer = self.__class__()
+        answer._base = self
+        answer._depth = self._depth + 1
+        return answer
+
+    def _best(self, url, exclude=()):
+        """Return a `(rank, key)` tuple for the most specific registration
+        that `url` is an exact superset of (and whose key is not in
+        `exclude`), or None.
+
+        Registrations in the base registry predate those in this one,
+        so they win ties, just as earlier registrations do within a
+        single registry. Each layer counts its registrations separately,
+        so ties are broken by the layer's depth before that order.
+        """
+        answer = None
+        if self._base is not None:
+            answer = self._base._best(url, exclude)
+        bucket = self._index.get((url.method, url.uri))
+        if bucket is not None:
+            match = bucket.best(url, exclude)
+            if match is not None:
+                rank = match[0]
+                match = (rank[0], self._depth, rank[1]), match[1]
+                if answer is None or match < answer:
+                    answer = match
+        return answer
+
+    def _best_route(self, url, exclude=()):
+        """Return a `(rank, key, params)` tuple for the most specific
+        route template that `url` matches (whose key is not in
+        `exclude`), or None.
+
+        As with `_best`, the base registry wins ties. Each layer's router
+        finds its own best route, so routes from different layers are
+        compared only by how specific they are (the kinds of their
+        segments, and then their query strings), and then by layer.
+        """
+        answer = None
+        if self._base is not None:
+            answer = self._base._best_route(url, exclude)
+        match = self._router.best(url, exclude)
+        if match is not None:
+            segments, rank = match[0]
+            match = ((tuple([i[0] for i in segments]), rank[0], self._depth),
+                     match[1], match[2])
+            if answer is None or match[0] < answer[0]:
+                answer = match
+        return answer
+
+    def _indexes(self):
+        """Return a list of dictionaries mapping `(method, uri)` to the
+        `QueryIndex` of every route (literal or templated) in this
+        registry and its base, base first.
+        """
+        answer = []
+        if self._base is not None:
+            answer += self._base._indexes()
+        answer.append(self._index)
+        answer.append(dict([((method, uri), bucket) for method, uri, bucket
+                            in self._router.routes()]))
+        return answer
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise TypeError('This registry is frozen, and may not be '
+                            'modified.')
+
+    def _detach(self):
+        """Copy every registration from the base registry into this one,
+        and stop using the base.
+
+        The new index is built to one side and swapped in, so that
+        lookups in progress are unaffected.
+        """
+        base_items = self._base.items()
+        own_keys = list(super(Registry, self).keys())
+
+        # Build an index of the base's keys followed by our own, so that
+        # base registrations keep their precedence in ties.
+        index = {}
+        router = Router(QueryIndex)
+        seen = set()
+        for key in [i[0] for i in base_items] + own_keys:
+            if key in seen:
+                continue
+            seen.add(key)
+            url = _as_url(key)
+            if is_template(url.uri):
+                router.add(key, url)
+                continue
+            index.setdefault((url.method, url.uri), QueryIndex()).add(key, url)
+
+        # Copy the base's values (but not the ones we shadow), and then
+        # swap in the new index.
+        for key, value in base_items:
+            if not super(Registry, self).__contains__(key):
+                super(Registry, self).__setitem__(key, value)
+        self._index = index
+        self._router = router
+        self._base = None
+        self._depth = 0
+        self._shadowed = 0
+
+
+class QueryIndex(object):
+    """An inverted index over the query strings of every registration
+    sharing a single method and URI.
+
+    Registrations are indexed both by their full set of query pairs and
+    by each individual `(key, value)` pair. A lookup either probes every
+    subset of the request's pairs, or counts hits across the posting
+    lists for the request's pairs, whichever touches fewer entries; in
+    neither case are registrations compared one at a time.
+
+    Writers only ever append to posting lists, so registering is linear
+    in the number of registrations; removing a key instead swaps in a
+    fresh list. Either way a lookup running alongside sees every list
+    in a consistent state and never needs a lock. (Writers must still
+    be serialized; `Registry` takes care of that.)
+    """
+    def __init__(self):
+        self._entries = {}
+        self._exact = {}
+        self._postings = {}
+        self._counter = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, url):
+        """Index the registry key `key`, whose URL object is `url`."""
+        pairs = url.pairs
+        self._counter += 1
+        self._entries[key] = (self._counter, len(pairs), pairs)
+        _append(self._exact, pairs, key)
+        for pair in pairs:
+            _append(self._postings, pair, key)
+
+    def entries(self):
+        """Return a list of `(order, pairs, key)` tuples for every
+        registration in the index, in the order they were indexed.
+        """
+        return sorted([(entry[0], entry[2], key)
+                       for key, entry in list(self._entries.items())])
+
+    def remove(self, key):
+        """Remove the registry key `key` from the index."""
+        _, _, pairs = self._entries[key]
+        for pair in pairs:
+            _discard(self._postings, pair, key)
+        _discard(self._exact, pairs, key)
+        del self._entries[key]
+
+    def match(self, url, default=None):
+        """Return the registry key of the most specific registration
+        that `url` is an exact superset of, or `default` if there is none.
+
+        The most specific registration is the one requiring the most
+        query pairs; ties go to the registration indexed first.
+        """
+        answer = self.best(url)
+        if answer is None:
+            return default
+        return answer[1]
+
+    def best(self, url, exclude=()):
+        """Return a `(rank, key)` tuple for the most specific registration
+        that `url` is an exact superset of, or None if there is none.
+        Registrations whose keys are in `exclude` are passed over.
+
+        Lower ranks are more specific.
+        """
+        postings = {}
+        for pair in url.pairs:
+            posting = self._postings.get(pair)
+            if posting:
+                postings[pair] = posting
+        if 2 ** len(postings) <= sum([len(i) for i in postings.values()]):
+            return self._best_subset(list(postings), exclude)
+        return self._best_posting(postings.values(), exclude)
+
+    def _best_subset(self, pairs, exclude=()):
+        """Find the best match by probing every subset of the request's
+        pairs (ignoring pairs no registration uses), largest first.
+        """
+        for size in range(len(pairs), -1, -1):
+            answer = None
+            for subset in itertools.combinations(pairs, size):
+                for key in self._exact.get(frozenset(subset), ()):
+                    entry = self._entries.get(key)
+                    if entry is None or key in exclude:
+                        continue
+                    rank = (-size, entry[0])
+                    if answer is None or rank < answer[0]:
+                        answer = (rank, key)
+            if answer is not None:
+                return answer
+        return None
+
+    def _best_posting(self, postings, exclude=()):
+        """Find the best match by counting, for every registration
+        sharing a pair with the request, how many of its pairs are hit.
+        """
+        hits = {}
+        for posting in postings:
+            for key in tuple(posting):
+                hits[key] = hits.get(key, 0) + 1
+
+        # A registration matches if every one of its pairs was hit;
+        # registrations with no query string at all always match.
+        candidates = list(hits.items())
+        candidates += [(k, 0) for k in self._exact.get(frozenset(), ())]
+        answer = None
+        for key, count in candidates:
+            entry = self._entries.get(key)
+            if entry is None or count != entry[1] or key in exclude:
+                continue
+            rank = (-entry[1], entry[0])
+            if answer is None or rank < answer[0]:
+                answer = (rank, key)
+        return answer
 
 
 class URL(object):
     """A class for holding a URL and method, with convenience methods
     for poking at its query string separately from the main URI.
+
+    URL objects are immutable values: their canonical key and hash are
+    computed once, when the object is created, so that they are cheap
+    to use as (and to look up) dictionary keys.
     """
+    __slots__ = ('method', 'uri', 'pairs', '_query', '_qs', '_key',
+                 '_hash', '_str')
+
     def __init__(self, url, method='GET', **kwargs):
         # Does the URL string have a query string in it?
         # If so, parse that out into keyword arguments.
@@ -67,10 +586,34 @@ class URL(object):
                 kwargs.setdefault(k, v)
             url = url[:url.index('?')]
 
-        # Store the base URL and the keyword arguments.
-        self.method = method.upper()
-        self.uri = url
-        self.qs = AlphaSortedDict(kwargs)
+        # Store the base URL and the keyword arguments, along with the
+        # canonical key that equality and hashing are based on.
+        method = _intern(method.upper())
+        url = _intern(url)
+        query = dict([(six.text_type(k), v) for k, v in kwargs.items()])
+        pairs = query_pairs(query)
+        key = (method, url, pairs)
+        _set = super(URL, self).__setattr__
+        _set('method', method)
+        _set('uri', url)
+        _set('pairs', pairs)
+        _set('_query', query)
+        _set('_qs', None)
+        _set('_key', key)
+        _set('_hash', hash(key))
+        _set('_str', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('URL objects are immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('URL objects are immutable.')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __eq__(self, other):
         # If this is a string of some kind, convert it to a URL.
@@ -78,32 +621,38 @@ class URL(object):
             other = self.__class__(other)
 
         # Type check!
-        if not hasattr(other, 'qs') or not hasattr(other, 'uri'):
+        if not isinstance(other, URL):
             raise TypeError('Cannot compare URL with %s.' %
                             other.__class__.__name__)
 
-        # Return whether the URI and QS are the same.
-        return all([self.uri == other.uri,
-                    self.qs == other.qs,
-                    self.method == other.method])
+        # Return whether the method, URI and QS are the same.
+        return self._key == other._key
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __str__(self):
         """Return the full method and URL, as a string."""
 
+        # This is only computed once; URL objects are immutable.
+        if self._str is not None:
+            return self._str
+
         # Start with the basic URI.
         answer = '%s %s' % (self.method, self.uri)
 
         # Append any keyword arguments to the query-string
-        if self.qs:
+        if self._query:
             qs_list = []
-            for key, values in self.qs.items():
+            for key in sorted(self._query, key=lambda k: (k.lower(), k)):
                 # Convert `values` to a list if it's not one already.
                 # This way, we seemlessly address situations where the
                 # same key is used multiple times.
-                if isinstance(values, (list, tuple, set)):
+                values = self._query[key]
+                if isinstance(values, (list, tuple, set, frozenset)):
                     values = list(values)
                     values.sort()
                 else:
@@ -116,9 +665,21 @@ class URL(object):
             # Append the query string to the answer.
             answer += '?' + '&'.join(qs_list)
 
-        # Return the answer.
+        # Cache and return the answer.
+        super(URL, self).__setattr__('_str', answer)
         return answer
 
+    @property
+    def qs(self):
+        """Return the query string, as a dictionary sorted by key.
+
+        This is built on first access, and should be treated as
+        read-only.
+        """
+        if self._qs is None:
+            super(URL, self).__setattr__('_qs', AlphaSortedDict(self._query))
+        return self._qs
+
     def is_exact_superset_of(self, other):
         """Return True if this URL is an exact superset of the URL provided
         by `other`.
@@ -133,28 +694,127 @@ class URL(object):
             other = self.__class__(other)
 
         # Type check!
-        if not hasattr(other, 'qs') or not hasattr(other, 'uri'):
+        if not isinstance(other, URL):
             raise TypeError('Cannot compare URL with %s.' %
                             other.__class__.__name__)
 
-        # If the URIs do not exactly match, this is not an exact superset.
-        if self.uri != other.uri:
-            return False
+        # The URIs and methods must match exactly, and every query pair
+        # in `other` must also be present in this URL.
+        return (self.uri == other.uri and self.method == other.method and
+                other.pairs <= self.pairs)
+
+
+class LRUCache(object):
+    """A bounded, thread-safe mapping which, once full, forgets the
+    least recently used entry to make room for a new one.
+
+    The cache counts its `hits` and `misses`, so that its effectiveness
+    can be measured.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the value for the given key, marking it as the most
+        recently used, or `default` if it is not cached.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache the given value, forgetting the least recently used
+        entry if the cache is full.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
 
-        # If the methods do not match, this is not an exact superset.
-        if self.method.upper() != other.method.upper():
-            return False
+    def clear(self):
+        """Forget every cached entry, and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
 
-        # Ensure that every key in `other.qs` exists in `self.qs` with
-        # the same value; if any do not, immediately return False.
-        for key in other.qs.keys():
-            # If the key doesn't exist, return False.
-            if key not in self.qs:
-                return False
 
-            # If the value does not match, return False.
-            if self.qs[key] != other.qs[key]:
-                return False
+def query_pairs(qs):
+    """Return a frozenset of hashable `(key, value)` pairs for the given
+    query string dictionary.
 
-        # Okay, we must have an exact superset!
-        return True
+    Multiple values for a single key (which `URL` stores as a set) are
+    represented by a frozenset, so they must match as a whole.
+    """
+    pairs = []
+    for key, value in qs.items():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = frozenset(value)
+        pairs.append((key, value))
+    return frozenset(pairs)
+
+
+def _append(index, bucket_key, key):
+    """Append `key` to the list stored under `bucket_key` in `index`,
+    publishing a new list if there is none yet.
+    """
+    bucket = index.get(bucket_key)
+    if bucket is None:
+        index[bucket_key] = [key]
+    else:
+        bucket.append(key)
+
+
+def _discard(index, bucket_key, key):
+    """Replace the list stored under `bucket_key` in `index` with one
+    that omits `key`, dropping it entirely once it would be empty.
+
+    The list is replaced rather than modified, so that lookups already
+    iterating over it are not disturbed.
+    """
+    bucket = [i for i in index[bucket_key] if not _same_key(i, key)]
+    if bucket:
+        index[bucket_key] = bucket
+    else:
+        del index[bucket_key]
+
+
+def _same_key(a, b):
+    """Return True if `a` and `b` are the same key, as a dict sees it."""
+    return a is b or (hash(a) == hash(b) and a == b)
+
+
+def _intern(value):
+    """Intern the given string if possible, so that the many URL objects
+    sharing a method or URI share a single string.
+    """
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+
+def _as_url(key):
+    """Return the given registry key as a URL object, parsing it
+    if it is a string.
+    """
+    if isinstance(key, (six.text_type, six.binary_type)):
+        return URL(key)
+    return key
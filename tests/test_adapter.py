@@ -1,6 +1,10 @@
 from __future__ import unicode_literals
 from fauxquests.adapter import FauxAdapter
 from fauxquests.compat import mock, unittest
+from fauxquests.exceptions import UnregisteredRequest
+from fauxquests.timing import VirtualClock
+from requests import Session
+import threading
 
 
 class AdapterTests(unittest.TestCase):
@@ -25,7 +29,7 @@ class AdapterTests(unittest.TestCase):
         fa.register('foo', 'bar')
         self.assertEqual(len(fa._registry), 1)
         bar = fa._registry['http://www.google.com/foo/']
-        self.assertEqual(bar.read(1000), 'bar'.encode('utf8'))
+        self.assertEqual(bar.open().read(1000), 'bar'.encode('utf8'))
 
     def test_register_json(self):
         """Establish that the `register_json` method properly converts
@@ -53,3 +57,316 @@ class AdapterTests(unittest.TestCase):
         self.assertEqual(response.json(), { 'bar': 'baz' })
         response = fa.send(request, stream=True)
         self.assertEqual(response.json(), { 'bar': 'baz' })
+
+    def test_send_streams_iterable_body(self):
+        """Establish that a streamed response pulls an iterable body
+        only as its content is iterated.
+        """
+        pulled = []
+
+        def chunks():
+            for i in range(100):
+                pulled.append(i)
+                yield 'x' * 1024
+
+        fa = FauxAdapter()
+        fa.register('foo', chunks())
+        request = mock.MagicMock()
+        request.method = 'GET'
+        request.url = 'foo'
+        response = fa.send(request, stream=True)
+        self.assertEqual(pulled, [])
+        content = response.iter_content(2048)
+        self.assertEqual(len(next(content)), 2048)
+        self.assertEqual(pulled, [0, 1])
+        rest = sum(len(chunk) for chunk in content)
+        self.assertEqual(rest, 100 * 1024 - 2048)
+
+    def test_send_ranges(self):
+        """Establish that Range headers are honoured for registrations
+        which accept them.
+        """
+        fa = FauxAdapter(ranges=True)
+        fa.register('http://foo/', '0123456789')
+        fa.register('http://foo/', '0123456789', method='POST')
+        fa.register('http://foo/whole/', '0123456789', ranges=False)
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        response = session.get('http://foo/', headers={'Range': 'bytes=-4'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.text, '6789')
+        response = session.post('http://foo/', headers={'Range': 'bytes=-4'})
+        self.assertEqual(response.status_code, 200)
+        response = session.get('http://foo/whole/',
+                               headers={'Range': 'bytes=-4'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, '0123456789')
+
+    def test_send_conditional(self):
+        """Establish that conditional requests are answered with a 304
+        when the client has the current response, and that the journal
+        counts them.
+        """
+        fa = FauxAdapter(conditional=True, clock=VirtualClock(784111777))
+        fa.register('http://foo/', 'bar')
+        fa.register('http://foo/', 'bar', method='POST')
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        response = session.get('http://foo/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Last-Modified'],
+                         'Sun, 06 Nov 1994 08:49:37 GMT')
+        etag = response.headers['ETag']
+        response = session.get('http://foo/',
+                               headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, ''.encode('utf8'))
+        response = session.post('http://foo/',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fa.journal.count, 3)
+        self.assertEqual(fa.journal.not_modified, 1)
+
+    def test_send_encoded(self):
+        """Establish that compressed and chunked responses are decoded by
+        requests, as real ones would be.
+        """
+        fa = FauxAdapter(encodings=('gzip', 'deflate'))
+        fa.register('http://foo/', 'bar' * 1000)
+        fa.register('http://foo/chunked/', 'bar' * 1000, chunked=64)
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        for url in ('http://foo/', 'http://foo/chunked/'):
+            response = session.get(url)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(response.text, 'bar' * 1000)
+        response = session.get('http://foo/chunked/', stream=True,
+                               headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(response.headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual([len(i) for i in response.iter_content(1000)],
+                         [64] * 46 + [56])
+
+    def test_send_response(self):
+        """Establish that responses built without `HTTPAdapter` have
+        everything requests would give them, and do not share headers.
+        """
+        fa = FauxAdapter()
+        fa.register('http://foo/', 'bar', headers={
+            'Content-Type': 'text/plain; charset=latin-1',
+        })
+        fa.register('http://foo/login/', 'ok', headers={
+            'Set-Cookie': 'session=abc; Path=/',
+        })
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        response = session.get('http://foo/?x=1')
+        self.assertEqual(response.url, 'http://foo/?x=1')
+        self.assertEqual(response.reason, 'OK')
+        self.assertEqual(response.encoding, 'latin-1')
+        self.assertEqual(response.headers['content-type'],
+                         'text/plain; charset=latin-1')
+        self.assertEqual(response.text, 'bar')
+        self.assertIs(response.connection, fa)
+        response.headers['X-Mine'] = 'yes'
+        self.assertNotIn('X-Mine', session.get('http://foo/').headers)
+        self.assertEqual(len(response.cookies), 0)
+        response = session.get('http://foo/login/')
+        self.assertEqual(response.cookies['session'], 'abc')
+        self.assertEqual(session.cookies['session'], 'abc')
+
+    def test_send_dynamic(self):
+        """Establish that a function may be registered to compute each
+        response from the request.
+        """
+        def echo(call):
+            return call.body, 201, {'X-Method': call.method}
+
+        fa = FauxAdapter()
+        fa.register('http://foo/', echo, method='POST', cache=10)
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        for body in ('spam', 'eggs', 'spam'):
+            response = session.post('http://foo/', data=body)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.headers['X-Method'], 'POST')
+            self.assertEqual(response.text, body)
+        cache = fa.response_cache('http://foo/', method='POST')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertIsNone(fa.response_cache('http://bar/'))
+
+    def test_send_matching(self):
+        """Establish that registrations for the same URL are told apart
+        by the headers and bodies of requests.
+        """
+        fa = FauxAdapter()
+        url = 'http://foo/rpc'
+        fa.register(url, 'default', method='POST')
+        fa.register(url, 'exact', method='POST', match_body='ping')
+        fa.register(url, 'json', method='POST',
+                    match_json={'op': 'get', 'args': [1, 2]})
+        fa.register(url, 'subset', method='POST',
+                    match_json={'op': 'put'}, json_subset=True)
+        fa.register(url, 'admin', method='POST',
+                    match_headers={'X-Role': 'admin'})
+        fa.register(url, 'admin json', method='POST',
+                    match_json={'op': 'get', 'args': [1, 2]},
+                    match_headers={'x-role': 'admin'})
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        for kwargs, expected in (
+            ({'data': 'ping'}, 'exact'),
+            ({'data': '{"args":[1, 2], "op": "get"}'}, 'json'),
+            ({'json': {'op': 'get', 'args': [1, 2]},
+              'headers': {'X-Role': 'admin'}}, 'admin json'),
+            ({'json': {'op': 'put', 'id': 3}}, 'subset'),
+            ({'json': {'op': 'delete'}, 'headers': {'X-Role': 'admin'}},
+             'admin'),
+            ({'data': 'pong'}, 'default'),
+        ):
+            self.assertEqual(session.post(url, **kwargs).text, expected)
+
+        # Registering the same conditions again replaces the response,
+        # and without a default, requests matching nothing are errors.
+        fa.register(url, 'pong', method='PUT', match_body='ping')
+        fa.register(url, 'PONG', method='PUT', match_body='ping')
+        self.assertEqual(session.put(url, data='ping').text, 'PONG')
+        with self.assertRaises(UnregisteredRequest) as context:
+            session.put(url, data='pong')
+        self.assertIn('only for other headers', str(context.exception))
+
+    def test_send_matching_over_base(self):
+        """Establish that conditions registered on an adapter layered
+        over a base registry never change the base's match sets.
+        """
+        base = FauxAdapter()
+        url = 'http://foo/rpc'
+        base.register(url, 'base', method='POST', match_json={'a': 1})
+        base.register(url, 'default', method='POST')
+        fa = FauxAdapter(base=base._registry)
+        fa.register(url, 'overlay', method='POST', match_json={'a': 2})
+        fa.register(url, 'new default', method='POST')
+        for adapter, expected in ((base, ('base', 'default', 'default')),
+                                  (fa, ('base', 'overlay', 'new default'))):
+            session = Session()
+            session.trust_env = False
+            session.mount('http://', adapter)
+            self.assertEqual(tuple([
+                session.post(url, json={'a': i}).text for i in (1, 2, 3)
+            ]), expected)
+
+    def test_send_matching_falls_back(self):
+        """Establish that a request matching none of the headers and
+        bodies registered for the most specific registration is answered
+        by the next best one.
+        """
+        fa = FauxAdapter()
+        fa.register('http://foo/x', 'plain', method='POST')
+        fa.register('http://foo/x?v=1', 'json', method='POST',
+                    match_json={'a': 1})
+        fa.register('http://foo/{name}', 'template', method='PUT')
+        fa.register('http://foo/x', 'json', method='PUT', match_json={'a': 1})
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        self.assertEqual(session.post('http://foo/x?v=1',
+                                      json={'a': 1}).text, 'json')
+        self.assertEqual(session.post('http://foo/x?v=1',
+                                      json={'a': 2}).text, 'plain')
+        self.assertEqual(session.put('http://foo/x', json={'a': 2}).text,
+                         'template')
+
+        # If nothing else answers, the most specific registration's
+        # conditions are blamed.
+        fa.register('http://foo/y', 'json', method='PATCH',
+                    match_json={'a': 1})
+        with self.assertRaises(UnregisteredRequest) as context:
+            session.patch('http://foo/y?v=1', json={'a': 2})
+        self.assertIn('Requests for PATCH http://foo/y are registered',
+                      str(context.exception))
+
+    def test_send_route_template(self):
+        """Establish that route templates match any URL of their shape,
+        and pass what they capture to dynamic responses.
+        """
+        fa = FauxAdapter(url_pattern='http://api/%s')
+        fa.register('users/{id:int}/orders/{order}',
+                    lambda call: 'order %(order)s of user %(id)d' %
+                                 call.params)
+        fa.register('users/{id}', 'someone')
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        response = session.get('http://api/users/7/orders/x1?page=2')
+        self.assertEqual(response.text, 'order x1 of user 7')
+        self.assertEqual(session.get('http://api/users/bob').text, 'someone')
+        fa.assert_called('users/{id}', times=1)
+
+    def test_call_assertions(self):
+        """Establish that the call assertion methods answer from the
+        journal's per-route statistics.
+        """
+        fa = FauxAdapter(url_pattern='http://foo/%s')
+        fa.register('bar', 'baz')
+        fa.register('bar', 'baz', spam='eggs')
+        fa.register('spam', 'eggs')
+        for url in ('http://foo/bar?a=1', 'http://foo/bar?a=2&spam=eggs'):
+            request = mock.MagicMock()
+            request.method = 'GET'
+            request.url = url
+            fa.send(request)
+
+        self.assertEqual(fa.call_count('bar'), 1)
+        fa.assert_called('bar')
+        fa.assert_called('bar', times=1, spam='eggs')
+        fa.assert_not_called('spam')
+        fa.assert_called_with('bar', {'a': '1'})
+        fa.assert_called_with('bar', {'a': '2'}, spam='eggs')
+        with self.assertRaises(AssertionError):
+            fa.assert_called('bar', times=2)
+        with self.assertRaises(AssertionError):
+            fa.assert_called('spam')
+        with self.assertRaises(AssertionError):
+            fa.assert_not_called('bar')
+        with self.assertRaises(AssertionError):
+            fa.assert_called_with('bar', {'a': '2'})
+        with self.assertRaises(AssertionError):
+            fa.assert_called_with('spam', {'a': '1'})
+
+    def test_concurrent_register_and_send(self):
+        """Establish that requests can be sent from several threads while
+        another thread is registering URLs on the same adapter.
+        """
+        fa = FauxAdapter()
+        fa.register('http://foo/', 'bar')
+        errors = []
+
+        def register():
+            for i in range(500):
+                fa.register('http://foo/', 'bar', page=i)
+                fa.register('http://foo/%d/' % i, 'bar')
+
+        def send():
+            request = mock.MagicMock()
+            request.method = 'GET'
+            request.url = 'http://foo/?page=none'
+            try:
+                for _ in range(500):
+                    fa.send(request)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=register)]
+        threads += [threading.Thread(target=send) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(fa.journal.count, 2000)
+        self.assertEqual(len(fa._registry), 1001)
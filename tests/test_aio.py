@@ -0,0 +1,296 @@
+from __future__ import unicode_literals
+from fauxquests import FauxServer
+from fauxquests.compat import unittest
+from fauxquests.exceptions import UnregisteredRequest
+from fauxquests.timing import VirtualClock
+import hashlib
+import io
+import time
+
+try:
+    import asyncio
+    from fauxquests import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+
+@unittest.skipIf(aio is None, 'Asynchronous clients require Python 3.')
+class AsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = FauxServer()
+        self.server.register_json('http://api/', {'spam': 'eggs'})
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+
+@unittest.skipIf(aio is None or aio.httpx is None, 'httpx is not installed.')
+class HttpxTests(AsyncTestCase):
+    """Establish that httpx's asynchronous client is answered by the
+    FauxServer's adapter.
+    """
+    def test_get(self):
+        with self.server as fs:
+            client = aio.httpx.AsyncClient()
+            response = self.run_async(client.get('http://api/?q=1'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'spam': 'eggs'})
+            self.assertEqual(response.headers['Content-Type'],
+                             'application/json')
+            fs.assert_called_with('http://api/', {'q': '1'})
+            self.run_async(client.aclose())
+
+    def test_concurrent(self):
+        """Establish that many concurrent requests are served on one
+        event loop, and are recorded in the adapter's journal.
+        """
+        with self.server as fs:
+            client = aio.httpx.AsyncClient()
+            responses = self.run_async(asyncio.gather(*[
+                client.get('http://api/?page=%d' % i) for i in range(500)
+            ]))
+            self.assertEqual(set([i.status_code for i in responses]), {200})
+            fs.assert_called('http://api/', times=500)
+            self.run_async(client.aclose())
+
+    def test_transport(self):
+        with self.server as fs:
+            client = aio.httpx.AsyncClient(transport=aio.FauxTransport(fs))
+            response = self.run_async(client.get('http://api/'))
+            self.assertEqual(response.json(), {'spam': 'eggs'})
+            with self.assertRaises(UnregisteredRequest):
+                self.run_async(client.get('http://other/'))
+            self.run_async(client.aclose())
+
+
+@unittest.skipIf(aio is None or aio.aiohttp is None,
+                 'aiohttp is not installed.')
+class AiohttpTests(AsyncTestCase):
+    """Establish that aiohttp's client session is answered by the
+    FauxServer's adapter.
+    """
+    def test_get(self):
+        with self.server as fs:
+            fs.register('http://api/text', 'spam\neggs\n',
+                        headers={'Content-Type': 'text/plain'})
+            session = self.make_session()
+            response = self.run_async(session.get('http://api/',
+                                                  params={'q': 'x'}))
+            self.assertEqual(response.status, 200)
+            self.assertEqual(self.run_async(response.json()),
+                             {'spam': 'eggs'})
+            fs.assert_called_with('http://api/', {'q': 'x'})
+
+            response = self.run_async(session.get('http://api/text'))
+            self.assertEqual(self.run_async(response.content.readline()),
+                             b'spam\n')
+            self.assertEqual(self.run_async(response.text()), 'eggs\n')
+            self.run_async(session.close())
+
+    def test_unregistered(self):
+        with self.server as fs:
+            session = self.make_session()
+            with self.assertRaises(UnregisteredRequest):
+                self.run_async(session.post('http://api/', json={'a': 1}))
+            self.run_async(session.close())
+
+    def test_raise_for_status(self):
+        with self.server as fs:
+            fs.register('http://api/missing', '', status_code=404)
+            session = self.make_session()
+            response = self.run_async(session.get('http://api/missing'))
+            with self.assertRaises(aio.aiohttp.ClientResponseError):
+                response.raise_for_status()
+            self.run_async(session.close())
+
+    def test_decompress(self):
+        """Establish that compressed responses are decompressed, as
+        aiohttp does, unless that is turned off.
+        """
+        server = FauxServer(encodings=('gzip', 'deflate'))
+        server.register_json('http://api/', {'spam': 'eggs' * 10000})
+        with server:
+            session = self.make_session()
+            for encoding in ('gzip', 'deflate'):
+                response = self.run_async(session.get(
+                    'http://api/', headers={'Accept-Encoding': encoding},
+                ))
+                self.assertEqual(response.headers['Content-Encoding'],
+                                 encoding)
+                self.assertEqual(self.run_async(response.json()),
+                                 {'spam': 'eggs' * 10000})
+
+            # Bodies read a chunk at a time are decompressed too.
+            response = self.run_async(session.get(
+                'http://api/', headers={'Accept-Encoding': 'gzip'},
+            ))
+            body = [self.run_async(response.content.read(100))]
+            while body[-1]:
+                body.append(self.run_async(response.content.read(100)))
+            self.assertLessEqual(max([len(i) for i in body]), 100)
+            self.assertEqual(b''.join(body),
+                             b'{"spam": "%s"}' % (b'eggs' * 10000))
+            response = self.run_async(session.get(
+                'http://api/', headers={'Accept-Encoding': 'gzip'},
+                auto_decompress=False,
+            ))
+            self.assertEqual(self.run_async(response.read())[:2],
+                             b'\x1f\x8b')
+            self.run_async(session.close())
+
+    def test_session_headers(self):
+        """Establish that a session's default headers, and the headers
+        aiohttp adds by itself, are sent along with each request's own.
+        """
+        server = FauxServer(encodings=('gzip',))
+        server.register_json('http://api/', {'spam': 'eggs' * 10000},
+                             match_headers={'X-Role': 'admin'})
+        with server:
+            session = self.make_session(headers={'X-Role': 'admin',
+                                                 'X-Trace': 'session'})
+            response = self.run_async(session.get(
+                'http://api/', headers={'X-Trace': 'request'},
+            ))
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(self.run_async(response.json()),
+                             {'spam': 'eggs' * 10000})
+            headers = response.request_info.headers
+            self.assertEqual(headers['X-Trace'], 'request')
+            self.assertIn('gzip', headers['Accept-Encoding'])
+
+            # Skipped automatic headers are not sent.
+            response = self.run_async(session.get(
+                'http://api/', skip_auto_headers=['Accept-Encoding'],
+            ))
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.run_async(session.close())
+
+    def make_session(self, **kwargs):
+        return aio.aiohttp.ClientSession(loop=self.loop, **kwargs)
+
+
+class Chunks(object):
+    """An asynchronous iterable of the given chunks (written without
+    `async def`, which Python 2 cannot parse).
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        answer = asyncio.Future()
+        try:
+            answer.set_result(next(self.chunks))
+        except StopIteration:
+            answer.set_exception(StopAsyncIteration())
+        return answer
+
+
+@unittest.skipIf(aio is None, 'Asynchronous clients require Python 3.')
+class AsyncUploadTests(AsyncTestCase):
+    """Establish that streamed request bodies are drained a chunk at a
+    time, without blocking the event loop.
+    """
+    def setUp(self):
+        super(AsyncUploadTests, self).setUp()
+        self.clock = VirtualClock()
+        self.server = FauxServer(journal='summary', upload_bandwidth=1000,
+                                 clock=self.clock)
+        self.server.register('http://api/', 'ok', method='POST')
+
+    @unittest.skipIf(aio is None or aio.httpx is None,
+                     'httpx is not installed.')
+    def test_httpx(self):
+        with self.server as fs:
+            client = aio.httpx.AsyncClient()
+            self.run_async(asyncio.gather(*[
+                client.post('http://api/', content=Chunks([b'x' * 500] * 4))
+                for i in range(10)
+            ]))
+            self.assertEqual(self.clock.time(), 2)
+            self.assertEqual(fs.requests[-1].body_size, 2000)
+            self.assertEqual(fs.requests[-1].body_digest,
+                             hashlib.sha1(b'x' * 2000).hexdigest())
+            self.run_async(client.aclose())
+
+    @unittest.skipIf(aio is None or aio.aiohttp is None,
+                     'aiohttp is not installed.')
+    def test_aiohttp(self):
+        server = FauxServer(journal='summary', upload_bandwidth=10000)
+        server.register('http://api/', 'ok', method='POST')
+        with server as fs:
+            session = aio.aiohttp.ClientSession(loop=self.loop)
+            start = time.time()
+            self.run_async(asyncio.gather(*[
+                session.post('http://api/', data=io.BytesIO(b'x' * 1000))
+                for i in range(10)
+            ]))
+            self.assertLess(time.time() - start, 0.5)
+            self.assertEqual(fs.requests[-1].body_size, 1000)
+            self.run_async(session.close())
+
+
+@unittest.skipIf(aio is None or aio.httpx is None, 'httpx is not installed.')
+class AsyncLatencyTests(AsyncTestCase):
+    """Establish that simulated latency is applied to asynchronous
+    clients without blocking the event loop.
+    """
+    def setUp(self):
+        super(AsyncLatencyTests, self).setUp()
+        self.clock = VirtualClock()
+        self.server = FauxServer(latency=1, clock=self.clock)
+        self.server.register('http://api/', 'spam' * 100, bandwidth=100)
+
+    def test_latency(self):
+        with self.server:
+            client = aio.httpx.AsyncClient()
+            response = self.run_async(client.get('http://api/'))
+            self.assertEqual(len(response.content), 400)
+            self.assertEqual(self.clock.time(), 5)
+            self.run_async(client.aclose())
+
+    def test_timeout(self):
+        with self.server:
+            client = aio.httpx.AsyncClient(timeout=0.5)
+            with self.assertRaises(aio.httpx.ReadTimeout):
+                self.run_async(client.get('http://api/'))
+            self.assertEqual(self.clock.time(), 0.5)
+            self.run_async(client.aclose())
+
+    def test_concurrent(self):
+        """Establish that concurrent requests wait for their latency
+        concurrently on a virtual clock, and that requests sent after
+        them wait for them to finish first.
+        """
+        with self.server:
+            client = aio.httpx.AsyncClient()
+            self.run_async(asyncio.gather(*[
+                client.get('http://api/') for i in range(100)
+            ]))
+            self.assertEqual(self.clock.time(), 5)
+            self.run_async(client.get('http://api/'))
+            self.assertEqual(self.clock.time(), 10)
+            self.run_async(client.aclose())
+
+    def test_real_clock(self):
+        """Establish that concurrent requests wait for their latency
+        concurrently, rather than one after another.
+        """
+        server = FauxServer(latency=0.2)
+        server.register('http://api/', 'spam')
+        with server:
+            client = aio.httpx.AsyncClient()
+            start = time.time()
+            self.run_async(asyncio.gather(*[
+                client.get('http://api/') for i in range(50)
+            ]))
+            self.assertLess(time.time() - start, 2)
+            self.run_async(client.aclose())
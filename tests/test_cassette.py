@@ -0,0 +1,176 @@
+from __future__ import unicode_literals
+from fauxquests.adapter import FauxAdapter
+from fauxquests.cassette import Recorded, load
+from fauxquests.compat import unittest
+from fauxquests.session import FauxServer
+from fauxquests.utils import URL
+from requests import Session
+import json
+import os
+import shutil
+import tempfile
+
+
+HAR = {'log': {
+    'version': '1.2',
+    'comment': 'Brackets in strings: "entries": [{',
+    'entries': [
+        {
+            'request': {'method': 'GET', 'url': 'http://api/users?page=1'},
+            'response': {
+                'status': 200,
+                'headers': [
+                    {'name': 'Content-Encoding', 'value': 'gzip'},
+                    {'name': 'X-Page', 'value': '1'},
+                ],
+                'content': {'mimeType': 'application/json',
+                            'text': '{"users": ["}{"]}'},
+            },
+        },
+        {
+            'request': {'method': 'POST', 'url': 'http://api/users'},
+            'response': {
+                'status': 201,
+                'content': {'text': 'Y3JlYXRlZA==', 'encoding': 'base64'},
+            },
+        },
+    ],
+}}
+
+JSONL = [
+    {'url': 'http://api/things', 'body': 'old'},
+    {'url': 'http://api/things', 'body': 'things',
+     'headers': {'X-Thing': 'yes'}},
+    {'method': 'DELETE', 'url': 'http://api/things', 'status': 204},
+    {'url': 'http://api/blob', 'body_base64': 'YmxvYg=='},
+]
+
+
+class CassetteTests(unittest.TestCase):
+    """A group of tests for serving recorded traffic from cassettes."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.har = os.path.join(self.directory, 'traffic.har')
+        with open(self.har, 'w') as file_:
+            json.dump(HAR, file_, indent=2)
+        self.jsonl = os.path.join(self.directory, 'traffic.jsonl')
+        with open(self.jsonl, 'w') as file_:
+            for exchange in JSONL:
+                file_.write(json.dumps(exchange) + '\n\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_har(self):
+        """Establish that every entry of a HAR file is indexed, and that
+        responses are only read when first requested.
+        """
+        registry = load(self.har)
+        self.assertEqual(sorted(str(i) for i in registry), [
+            'GET http://api/users?page=1',
+            'POST http://api/users',
+        ])
+        recorded = registry['http://api/users?page=1&x=y']
+        self.assertIsInstance(recorded, Recorded)
+        self.assertIsNone(recorded._template)
+        template = recorded.render(None)
+        self.assertIs(recorded.render(None), template)
+        self.assertEqual(template.headers, {
+            'Content-Type': 'application/json',
+            'X-Page': '1',
+        })
+        self.assertEqual(json.loads(template.open().read().decode('utf8')),
+                         {'users': ['}{']})
+        template = registry[URL('http://api/users',
+                                method='POST')].render(None)
+        self.assertEqual(template.status, 201)
+        self.assertEqual(template.open().read(), 'created'.encode('utf8'))
+
+    def test_jsonl(self):
+        registry = load(self.jsonl)
+        self.assertEqual(len(registry), 3)
+        template = registry['http://api/things'].render(None)
+        self.assertEqual(template.headers, {'X-Thing': 'yes'})
+        self.assertEqual(template.open().read(), 'things'.encode('utf8'))
+        template = registry[URL('http://api/things',
+                                method='DELETE')].render(None)
+        self.assertEqual(template.status, 204)
+        template = registry['http://api/blob'].render(None)
+        self.assertEqual(template.open().read(), 'blob'.encode('utf8'))
+
+    def test_request_only(self):
+        """Establish that loading a cassette parses only the requests in
+        it, so that responses are not parsed until they are requested.
+        """
+        with open(self.jsonl, 'w') as file_:
+            file_.write('{"method": "PUT", "url": "http://api/x", '
+                        '"body": not parsed}\n'
+                        '{"request": {"url": "http://api/y"}, "body": ?}\n')
+        with open(self.har, 'w') as file_:
+            file_.write('{"log": {"entries": [{"response": not parsed, '
+                        '"request": {"method": "PUT", "url": "http://a/"}, '
+                        '"time": 1}]}}')
+        self.assertEqual(sorted(str(i) for i in load(self.jsonl)),
+                         ['GET http://api/y', 'PUT http://api/x'])
+        registry = load(self.har)
+        self.assertEqual([str(i) for i in registry], ['PUT http://a/'])
+        with self.assertRaises(ValueError):
+            registry[URL('http://a/', method='PUT')].render(None)
+
+    def test_format(self):
+        self.assertEqual(len(load(self.har, format='har')), 2)
+        with self.assertRaises(ValueError):
+            load(self.har, format='yaml')
+
+    def test_adapter(self):
+        """Establish that an adapter (or server) serves what a cassette
+        recorded, and that its own registrations take precedence.
+        """
+        fa = FauxAdapter()
+        fa.load(self.jsonl)
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        response = session.get('http://api/things')
+        self.assertEqual(response.headers['X-Thing'], 'yes')
+        self.assertEqual(response.text, 'things')
+
+        server = FauxServer()
+        server.load(self.har)
+        server.register('http://api/users', 'mine', method='POST')
+        session.mount('http://', FauxAdapter(base=server.compile()))
+        self.assertEqual(session.get('http://api/users?page=1').json(),
+                         {'users': ['}{']})
+        self.assertEqual(session.post('http://api/users').text, 'mine')
+
+    def test_record(self):
+        """Establish that requests matching nothing are forwarded to the
+        passthrough adapter and recorded, and are replayed from then on
+        without being forwarded again.
+        """
+        upstream = FauxAdapter()
+        upstream.register('http://api/users', 'users',
+                          headers={'X-Upstream': 'yes'})
+        upstream.register('http://api/logo', b'\x89PNG\xff')
+        path = os.path.join(self.directory, 'recorded.jsonl')
+        fa = FauxAdapter(record=path, passthrough=upstream)
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        for _ in range(2):
+            response = session.get('http://api/users')
+            self.assertEqual(response.text, 'users')
+            self.assertEqual(response.headers['X-Upstream'], 'yes')
+        self.assertEqual(session.get('http://api/logo').content,
+                         b'\x89PNG\xff')
+        upstream.assert_called('http://api/users', times=1)
+        fa.assert_called('http://api/users', times=2)
+        with open(path) as file_:
+            self.assertEqual(len(file_.readlines()), 2)
+
+        # A server recording to the same cassette replays it.
+        server = FauxServer(record=path, passthrough=upstream)
+        session.mount('http://', FauxAdapter(base=server.compile()))
+        self.assertEqual(session.get('http://api/logo').content,
+                         b'\x89PNG\xff')
+        upstream.assert_called('http://api/logo', times=1)
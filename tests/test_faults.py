@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+from fauxquests.adapter import FauxAdapter
+from fauxquests.compat import unittest
+from fauxquests.faults import Fault
+from fauxquests.response import Resp, StreamResp
+from fauxquests.timing import VirtualClock
+from requests import Session
+from requests.exceptions import ChunkedEncodingError, ConnectionError, \
+                                ConnectTimeout, ReadTimeout
+from six.moves.http_client import IncompleteRead
+
+
+class FaultTests(unittest.TestCase):
+    """A group of tests for injected faults."""
+    def test_schedule(self):
+        """Establish that faults choose requests by their schedule, and
+        at random, repeatably, with a seed.
+        """
+        fault = Fault('connection_error', on=(2, 3))
+        self.assertEqual([fault.fires() for _ in range(4)],
+                         [False, True, True, False])
+        fault = Fault('connection_error', every=3)
+        self.assertEqual([fault.fires() for _ in range(6)],
+                         [False, False, True] * 2)
+        faults = [Fault('stall', probability=0.3, seed=1) for _ in range(2)]
+        chosen = [[f.fires() for _ in range(1000)] for f in faults]
+        self.assertEqual(chosen[0], chosen[1])
+        self.assertAlmostEqual(chosen[0].count(True), 300, delta=50)
+        with self.assertRaises(ValueError):
+            Fault('meteor_strike')
+
+    def test_resp(self):
+        """Establish that faulty bodies break off, or stall, where they
+        are told to.
+        """
+        resp = Resp(b'x' * 100)
+        self.assertTrue(Fault('truncate', at=0.25).apply(resp))
+        self.assertEqual(resp.headers['Content-Length'], '100')
+        self.assertEqual(resp.read(20), b'x' * 20)
+        self.assertEqual(resp.read(20), b'x' * 5)
+        with self.assertRaises(IncompleteRead):
+            resp.read(20)
+        resp = Resp(b'x' * 100)
+        Fault('truncate', at=10).apply(resp)
+        with self.assertRaises(IncompleteRead) as context:
+            resp.read()
+        self.assertEqual(context.exception.partial, b'x' * 10)
+
+        resp = StreamResp([b'x' * 10] * 10)
+        self.assertFalse(Fault('truncate').apply(resp))
+        self.assertTrue(Fault('stall', at=25, seconds=5).apply(resp))
+        self.assertEqual(resp.read_timed(20), (b'x' * 20, 0))
+        self.assertEqual(resp.read_timed(20), (b'x' * 5, 0))
+        self.assertEqual(resp.read_timed(20), (b'x' * 20, 5))
+        self.assertEqual(resp.read_timed(), (b'x' * 55, 0))
+
+    def test_adapter(self):
+        """Establish that requests see the faults injected into them,
+        and that the journal counts them.
+        """
+        clock = VirtualClock()
+        fa = FauxAdapter(journal='summary', clock=clock,
+                         faults=Fault('connect_timeout', on=(1,)))
+        fa.register('http://api/', 'x' * 100, faults=[
+            Fault('connection_error', on=(2,)),
+            Fault('read_timeout', on=(2, 3)),
+            Fault('content_length', on=(4,)),
+        ])
+        fa.register('http://api/slow', 'x' * 100,
+                    faults=Fault('stall', seconds=30))
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+
+        with self.assertRaises(ConnectTimeout):
+            session.get('http://api/', timeout=(3, 10))
+        self.assertEqual(clock.time(), 3)
+        with self.assertRaises(ConnectionError):
+            session.get('http://api/', timeout=(3, 10))
+        with self.assertRaises(ReadTimeout):
+            session.get('http://api/', timeout=(3, 10))
+        self.assertEqual(clock.time(), 13)
+        with self.assertRaises(ChunkedEncodingError):
+            session.get('http://api/')
+        self.assertEqual(session.get('http://api/').text, 'x' * 100)
+        self.assertEqual(len(session.get('http://api/slow').content), 100)
+        self.assertEqual(clock.time(), 43)
+
+        self.assertEqual(fa.journal.faults, {
+            'connect_timeout': 1, 'connection_error': 1, 'read_timeout': 1,
+            'content_length': 1, 'stall': 1,
+        })
+        self.assertEqual(fa.journal.stats(fa.journal[0].route).faults,
+                         {'connection_error': 1, 'read_timeout': 1,
+                          'content_length': 1, 'connect_timeout': 1})
+        self.assertEqual([(i.status, i.fault) for i in fa.journal][:3], [
+            (None, 'connect_timeout'), (None, 'connection_error'),
+            (None, 'read_timeout'),
+        ])
+
+    def test_broken_connections_discarded(self):
+        """Establish that connections whose responses were made faulty
+        are thrown away, rather than returned to the pool.
+        """
+        fa = FauxAdapter()
+        fa.register('http://api/', 'x' * 100, faults=[
+            Fault('content_length', on=(1,)),
+            Fault('truncate', on=(2,)),
+        ])
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        for _ in range(2):
+            with self.assertRaises(ChunkedEncodingError):
+                session.get('http://api/')
+        pool = fa.pool('http://api/')
+        self.assertEqual((pool.opened, pool.reused, pool._idle), (2, 0, 0))
+        self.assertEqual(session.get('http://api/').text, 'x' * 100)
+        self.assertEqual((pool.opened, pool.reused, pool._idle), (3, 0, 1))
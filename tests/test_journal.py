@@ -0,0 +1,236 @@
+from __future__ import unicode_literals
+from fauxquests.adapter import FauxAdapter
+from fauxquests.compat import mock, unittest
+from fauxquests.journal import COUNT_MODE_PAIRS, Journal, Summary, drain
+from fauxquests.timing import VirtualClock
+from fauxquests.utils import URL
+from requests import Session
+import hashlib
+import io
+
+
+class JournalTests(unittest.TestCase):
+    """A group of tests for the Journal class, which records the
+    requests sent through an adapter.
+    """
+    def setUp(self):
+        self.request = mock.MagicMock()
+        self.url = URL('http://foo/?bar=baz')
+        self.route = URL('http://foo/')
+
+    def test_full(self):
+        journal = Journal()
+        journal.record(self.request, self.url, self.route)
+        self.assertEqual(journal.count, 1)
+        self.assertEqual(list(journal), [self.request])
+
+    def test_ring_buffer(self):
+        """Establish that a journal with a `maxlen` keeps only the most
+        recent requests, while still counting all of them.
+        """
+        journal = Journal(maxlen=2)
+        requests = [mock.MagicMock() for _ in range(5)]
+        for request in requests:
+            journal.record(request, self.url, self.route)
+        self.assertEqual(journal.count, 5)
+        self.assertEqual(len(journal), 2)
+        self.assertEqual(journal[-1], requests[-1])
+        self.assertEqual(list(journal), requests[-2:])
+
+    def test_summary(self):
+        """Establish that a summary journal does not hold on to the
+        requests themselves.
+        """
+        journal = Journal('summary')
+        journal.record(self.request, self.url, self.route, 'spam')
+        self.assertEqual(journal[0], Summary(
+            method='GET',
+            url=self.url,
+            route=self.route,
+            body_size=4,
+        ))
+
+    def test_not_modified(self):
+        """Establish that requests answered with a 304 are counted, and
+        that summaries record the status.
+        """
+        journal = Journal('summary')
+        journal.record(self.request, self.url, self.route, status=200)
+        journal.record(self.request, self.url, self.route, status=304)
+        self.assertEqual(journal.not_modified, 1)
+        self.assertEqual(journal.stats(self.route).not_modified, 1)
+        self.assertEqual([i.status for i in journal], [200, 304])
+
+    def test_count(self):
+        journal = Journal('count')
+        journal.record(self.request, self.url, self.route)
+        journal.record(self.request, self.url, self.route)
+        self.assertEqual(journal.count, 2)
+        self.assertEqual(len(journal), 0)
+        journal.clear()
+        self.assertEqual(journal.count, 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Journal('everything')
+
+    def test_adapter_journal(self):
+        """Establish that an adapter records what it sends according to
+        its journal settings.
+        """
+        fa = FauxAdapter(journal='summary', journal_size=1)
+        fa.register('http://foo/', 'bar')
+        request = mock.MagicMock()
+        request.method = 'GET'
+        request.url = 'http://foo/?spam=eggs'
+        request.body = None
+        fa.send(request)
+        fa.send(request)
+        self.assertEqual(fa.journal.count, 2)
+        self.assertEqual(len(fa.requests), 1)
+        self.assertEqual(fa.requests[-1].route, URL('http://foo/'))
+        self.assertEqual(fa.requests[-1].url, URL('http://foo/?spam=eggs'))
+
+    def test_adapter_requests(self):
+        """Establish that an adapter's requests can be sliced, however
+        the journal is bounded, and can be replaced.
+        """
+        for size in (None, 3):
+            fa = FauxAdapter(journal='summary', journal_size=size)
+            fa.register('http://foo/', 'bar')
+            for i in range(5):
+                request = mock.MagicMock()
+                request.method = 'GET'
+                request.url = 'http://foo/?page=%d' % i
+                request.body = None
+                fa.send(request)
+            self.assertEqual([i.url.qs['page'] for i in fa.requests[-2:]],
+                             ['3', '4'])
+            fa.requests = fa.requests[-1:]
+            self.assertEqual(len(fa.requests), 1)
+            self.assertEqual(fa.requests[0].url.qs['page'], '4')
+            fa.requests = []
+            self.assertEqual((len(fa.requests), fa.journal.count), (0, 0))
+            fa.assert_not_called('http://foo/')
+
+    def test_route_stats(self):
+        """Establish that the journal keeps statistics for each route,
+        bounded in the same way as the journal.
+        """
+        journal = Journal('summary', maxlen=1)
+        other = URL('http://foo/?bar=eggs')
+        journal.record(self.request, self.url, self.route)
+        journal.record(self.request, other, self.route)
+        stats = journal.stats(self.route)
+        self.assertEqual(stats.count, 2)
+        self.assertLessEqual(stats.first, stats.last)
+        self.assertEqual(dict(stats.urls), {other: 1})
+        self.assertEqual(dict(stats.pairs), {('bar', 'eggs'): 1})
+        self.assertEqual([i.url for i in stats.entries], [other])
+        self.assertTrue(stats.called_with(bar='eggs'))
+        self.assertFalse(stats.called_with(bar='baz'))
+        self.assertIsNone(journal.stats(URL('http://bar/')))
+
+    def test_route_stats_bounded(self):
+        """Establish that a route's query pairs and URLs are bounded in
+        the same way as the journal, and that `called_with` is answered
+        from them.
+        """
+        journal = Journal('summary', maxlen=10)
+        for i in range(5000):
+            journal.record(self.request, URL('http://foo/?a=%d&b=%d'
+                                             % (i, i % 2)), self.route)
+        stats = journal.stats(self.route)
+        self.assertEqual((len(stats.urls), len(stats.pairs)), (10, 10))
+        self.assertTrue(stats.called_with(a='4999', b='1'))
+        self.assertFalse(stats.called_with(a='4999', b='0'))
+        self.assertFalse(stats.called_with(a='1'))
+
+        journal = Journal('count', maxlen=10)
+        for i in range(5000):
+            journal.record(self.request, URL('http://foo/?a=%d' % i),
+                           self.route)
+        stats = journal.stats(self.route)
+        self.assertEqual((len(stats.urls), len(stats.pairs)), (0, 10))
+        self.assertTrue(stats.called_with(a='4999'))
+        self.assertEqual(stats.count, 5000)
+
+        # In count mode, pairs are bounded even without a maxlen.
+        journal = Journal('count')
+        for i in range(COUNT_MODE_PAIRS + 500):
+            journal.record(self.request, URL('http://foo/?a=%d' % i),
+                           self.route)
+        stats = journal.stats(self.route)
+        self.assertEqual(len(stats.pairs), COUNT_MODE_PAIRS)
+        self.assertTrue(stats.called_with(a=str(COUNT_MODE_PAIRS + 499)))
+        self.assertFalse(stats.called_with(a='0'))
+
+    def test_drain(self):
+        """Establish that streamed bodies are drained a chunk at a time,
+        at the given bandwidth, and described rather than kept.
+        """
+        clock = VirtualClock()
+        upload = drain(io.BytesIO(b'x' * 1000), bandwidth=100, clock=clock,
+                       chunk_size=300)
+        self.assertEqual(upload.size, 1000)
+        self.assertEqual(upload.digest,
+                         hashlib.sha1(b'x' * 1000).hexdigest())
+        self.assertEqual(clock.time(), 10)
+        self.assertEqual(upload.rate, 100)
+
+    def test_adapter_upload(self):
+        """Establish that an adapter drains streamed request bodies, and
+        that its journal records their size, digest and rate.
+        """
+        clock = VirtualClock()
+        fa = FauxAdapter(journal='summary', upload_bandwidth=1000,
+                         clock=clock)
+        fa.register('http://foo/', 'ok', method='POST')
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        produced = []
+
+        def chunks():
+            for i in range(10):
+                produced.append(clock.time())
+                yield b'y' * 500
+
+        session.post('http://foo/', data=chunks())
+        self.assertEqual(produced, [0.5 * i for i in range(10)])
+        summary = fa.requests[-1]
+        self.assertEqual(summary.body_size, 5000)
+        self.assertEqual(summary.body_digest,
+                         hashlib.sha1(b'y' * 5000).hexdigest())
+        self.assertEqual(summary.upload_rate, 1000)
+        self.assertEqual(fa.journal.uploaded, 5000)
+
+        # Bodies already in memory take their time through latency.
+        session.post('http://foo/', data=b'z' * 2000)
+        self.assertEqual(clock.time(), 7)
+        self.assertEqual(fa.journal.uploaded, 7000)
+
+    def test_route_uploads(self):
+        """Establish that each route keeps the upload of every request it
+        answered, in step with its entries, whatever the journal's mode.
+        """
+        for mode, kept in (('full', 3), ('summary', 3), ('count', 1)):
+            fa = FauxAdapter(journal=mode, upload_bandwidth=1000,
+                             clock=VirtualClock())
+            fa.register('http://foo/', 'ok', method='POST')
+            session = Session()
+            session.trust_env = False
+            session.mount('http://', fa)
+            session.post('http://foo/', data=iter([b'a' * 300, b'b' * 200]))
+            session.post('http://foo/')
+            session.post('http://foo/', data=iter([b'c' * 100]))
+            stats = fa.journal.stats(fa._route('http://foo/', 'POST', {}))
+            self.assertEqual(stats.uploaded, 600)
+            self.assertEqual(len(stats.uploads), kept)
+            self.assertEqual(stats.uploads[-1].size, 100)
+            self.assertEqual(stats.uploads[-1].digest,
+                             hashlib.sha1(b'c' * 100).hexdigest())
+            if mode != 'count':
+                self.assertIsNone(stats.uploads[1])
+                self.assertEqual(stats.uploads[0].rate, 1000)
+                self.assertEqual(len(stats.entries), 3)
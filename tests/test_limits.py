@@ -0,0 +1,71 @@
+from __future__ import unicode_literals
+from fauxquests.adapter import FauxAdapter
+from fauxquests.compat import unittest
+from fauxquests.limits import SlidingWindow, TokenBucket
+from fauxquests.timing import VirtualClock
+from requests import Session
+
+
+class LimitTests(unittest.TestCase):
+    """A group of tests for rate limits."""
+    def test_token_bucket(self):
+        """Establish that a token bucket allows bursts, and then refills
+        at its rate.
+        """
+        bucket = TokenBucket(2, burst=3)
+        self.assertEqual([bucket.check(0) for _ in range(3)], [None] * 3)
+        refusal = bucket.check(0)
+        self.assertEqual(refusal.status, 429)
+        self.assertEqual(refusal.headers['Retry-After'], '1')
+        self.assertEqual(refusal.headers['X-RateLimit-Limit'], '3')
+        self.assertIsNone(bucket.check(0.5))
+        self.assertIsNotNone(bucket.check(0.6))
+        self.assertEqual((bucket.allowed, bucket.limited), (4, 2))
+
+    def test_sliding_window(self):
+        """Establish that a sliding window allows no more than its limit
+        in any window, and says when the next request will be allowed.
+        """
+        window = SlidingWindow(2, 3600, status=503, body='Busy.')
+        self.assertIsNone(window.check(0))
+        self.assertIsNone(window.check(1000))
+        refusal = window.check(2000)
+        self.assertEqual(refusal.status, 503)
+        self.assertEqual(refusal.headers['Retry-After'], '1600')
+        self.assertIsNone(window.check(3600))
+        self.assertIsNotNone(window.check(3601))
+
+    def test_adapter(self):
+        """Establish that an adapter refuses requests beyond its own, its
+        hosts' and its registrations' limits, on its clock.
+        """
+        clock = VirtualClock()
+        fa = FauxAdapter(journal='summary', clock=clock,
+                         limit=SlidingWindow(100, 86400),
+                         host_limits={'slow': TokenBucket(1)})
+        fa.register('http://slow/', 'slow')
+        fa.register('http://fast/', 'fast')
+        fa.register('http://fast/quota', 'quota',
+                    limit=SlidingWindow(2, 60))
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+
+        statuses = [session.get('http://slow/').status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 429, 429])
+        clock.advance(1)
+        self.assertEqual(session.get('http://slow/').text, 'slow')
+        self.assertEqual(session.get('http://fast/').status_code, 200)
+        fa.assert_called('http://slow/', times=2)
+        self.assertEqual(fa.journal.count, 5)
+
+        statuses = [session.get('http://fast/quota').status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = session.get('http://fast/quota')
+        self.assertEqual(response.headers['Retry-After'], '60')
+        fa.assert_called('http://fast/quota', times=4)
+        clock.advance(60)
+        self.assertEqual(session.get('http://fast/quota').text, 'quota')
+        self.assertEqual(fa.limit.allowed, 10)
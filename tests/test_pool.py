@@ -0,0 +1,80 @@
+from __future__ import unicode_literals
+from fauxquests.adapter import FauxAdapter
+from fauxquests.compat import unittest
+from requests import Session
+from urllib3.exceptions import EmptyPoolError
+import threading
+import time
+
+
+class PoolTests(unittest.TestCase):
+    """A group of tests for emulated connection pools."""
+    def session(self, **kwargs):
+        fa = FauxAdapter(journal='count', **kwargs)
+        for host in ('a', 'b', 'c'):
+            fa.register('http://%s/' % host, 'spam')
+        session = Session()
+        session.trust_env = False
+        session.mount('http://', fa)
+        return fa, session
+
+    def test_reuse(self):
+        """Establish that connections are reused once responses have
+        been read, and that a pool which does not block opens more
+        connections than it keeps.
+        """
+        fa, session = self.session(pool_maxsize=2)
+        for _ in range(3):
+            session.get('http://a/')
+        pool = fa.pool('http://a:80/spam')
+        self.assertEqual((pool.opened, pool.reused, pool.peak), (1, 2, 1))
+
+        # Streamed responses hold their connections until they are read
+        # (or closed).
+        responses = [session.get('http://a/', stream=True)
+                     for _ in range(3)]
+        self.assertEqual((pool.in_use, pool.peak, pool.opened), (3, 3, 3))
+        self.assertEqual(responses[0].text, 'spam')
+        for response in responses[1:]:
+            response.close()
+        self.assertEqual((pool.in_use, pool.discarded), (0, 1))
+        session.get('http://a/')
+        self.assertEqual((pool.checkouts, pool.reused), (7, 4))
+
+    def test_block(self):
+        """Establish that a pool which blocks makes requests wait for
+        a connection, giving up after its timeout.
+        """
+        fa, session = self.session(pool_maxsize=1, pool_block=True,
+                                   pool_timeout=0.05)
+        response = session.get('http://a/', stream=True)
+        with self.assertRaises(EmptyPoolError):
+            session.get('http://a/')
+
+        timer = threading.Timer(0.02, response.close)
+        timer.start()
+        pool = fa.pool('http://a/')
+        pool.timeout = None
+        started = time.time()
+        self.assertEqual(session.get('http://a/').text, 'spam')
+        self.assertGreater(time.time() - started, 0.01)
+        timer.join()
+        self.assertEqual((pool.checkouts, pool.waits, pool.peak), (2, 1, 1))
+        self.assertGreater(pool.max_wait, 0.01)
+
+    def test_pool_connections(self):
+        """Establish that only so many hosts' pools are kept, and that
+        connections are lost with the pools evicted.
+        """
+        fa, session = self.session(pool_connections=2)
+        for host in 'abab':
+            session.get('http://%s/' % host)
+        session.get('http://c/')
+        self.assertEqual(fa.poolmanager.evicted, 1)
+        session.get('http://a/')
+        self.assertEqual(fa.poolmanager.evicted, 2)
+        pool = fa.pool('http://a/')
+        self.assertEqual((pool.opened, pool.reused), (2, 1))
+        session.get('http://c/')
+        self.assertEqual(fa.poolmanager.evicted, 2)
+        self.assertEqual(fa.pool('http://c/').reused, 1)
@@ -1,6 +1,13 @@
 from __future__ import unicode_literals
-from fauxquests.response import Resp
+from fauxquests.response import (Call, ChunkedReader, Dynamic, Resp,
+                                 StreamResp, Template, byte_ranges,
+                                 choose_encoding, mapped)
+from fauxquests.exceptions import ConsumedBody
+from fauxquests.utils import URL
 from fauxquests.compat import mock, unittest
+import io
+import tempfile
+import zlib
 
 
 class RespTests(unittest.TestCase):
@@ -21,3 +28,407 @@ class RespTests(unittest.TestCase):
         resp = Resp('foo'.encode('utf8'), headers={ 'bar': 'baz' })
         self.assertEqual(resp.get_all('bar', None), ['baz'])
         self.assertEqual(resp.get_all('spam', None), None)
+
+    def test_read_in_chunks(self):
+        resp = Resp('foobar'.encode('utf8'))
+        self.assertEqual(resp.read(4), 'foob'.encode('utf8'))
+        self.assertEqual(resp.read(4), 'ar'.encode('utf8'))
+        self.assertEqual(resp.read(4), ''.encode('utf8'))
+        resp.seek(3)
+        self.assertEqual(resp.read(), 'bar'.encode('utf8'))
+
+
+class TemplateTests(unittest.TestCase):
+    """A group of tests for the immutable Template class, from which
+    each request's Resp is opened.
+    """
+    def test_open_shares_body(self):
+        """Establish that every Resp opened from a Template reads the
+        same underlying body, without copying it.
+        """
+        template = Template('foobar'.encode('utf8'), 201, {'bar': 'baz'})
+        first, second = template.open(), template.open()
+        self.assertIs(first._body.obj, template.body.obj)
+        self.assertIs(second._body.obj, template.body.obj)
+        self.assertEqual(first.read(3), 'foo'.encode('utf8'))
+        self.assertEqual(second.read(), 'foobar'.encode('utf8'))
+        self.assertEqual(first.read(), 'bar'.encode('utf8'))
+        self.assertEqual(first.status, 201)
+        self.assertEqual(first.reason, 'CREATED')
+
+    def test_immutable(self):
+        """Establish that a Template cannot be changed once created,
+        including through the headers given to a Resp.
+        """
+        template = Template('foo'.encode('utf8'), headers={'bar': 'baz'})
+        with self.assertRaises(AttributeError):
+            template.status = 404
+        template.open().headers['bar'] = 'eggs'
+        template.headers['bar'] = 'eggs'
+        self.assertEqual(template.headers, {'bar': 'baz'})
+
+    def test_file_body(self):
+        """Establish that a file given as a body is mapped into memory
+        rather than read, and shared between every Resp.
+        """
+        with tempfile.TemporaryFile() as file_:
+            file_.write('foobar'.encode('utf8'))
+            file_.flush()
+            template = Template(file_)
+        self.assertEqual(template.body.nbytes, 6)
+        self.assertTrue(template.body.readonly)
+        first, second = template.open(), template.open()
+        self.assertIs(first._body, second._body)
+        self.assertEqual(first.read(3), 'foo'.encode('utf8'))
+        self.assertEqual(second.read(), 'foobar'.encode('utf8'))
+
+    def test_mapped(self):
+        """Establish that `mapped` returns a read-only view of a file,
+        which a Template serves as-is.
+        """
+        with tempfile.NamedTemporaryFile() as file_:
+            file_.write('foobar'.encode('utf8'))
+            file_.flush()
+            body = mapped(file_.name)
+        self.assertIs(Template(body).body, body)
+        self.assertEqual(body.tobytes(), 'foobar'.encode('utf8'))
+        with tempfile.NamedTemporaryFile() as file_:
+            self.assertEqual(mapped(file_.name).nbytes, 0)
+
+    def test_in_memory_file_body(self):
+        """Establish that file-like objects which are not real files are
+        simply read.
+        """
+        template = Template(io.BytesIO('foobar'.encode('utf8')))
+        self.assertEqual(template.open().read(), 'foobar'.encode('utf8'))
+
+    def test_iterable_body(self):
+        """Establish that an iterable body is only iterated as the
+        response is read, and afresh for each response.
+        """
+        template = Template(['foo', 'bar'.encode('utf8'), '', 'baz'])
+        resp = template.open()
+        self.assertIsInstance(resp, StreamResp)
+        self.assertFalse(resp.seekable())
+        self.assertEqual(resp.read(2), 'fo'.encode('utf8'))
+        self.assertEqual(resp.read(5), 'obarb'.encode('utf8'))
+        self.assertEqual(resp.tell(), 7)
+        self.assertEqual(resp.read(), 'az'.encode('utf8'))
+        self.assertEqual(resp.read(), ''.encode('utf8'))
+        with self.assertRaises(io.UnsupportedOperation):
+            resp.seek(0)
+        self.assertEqual(template.open().read(), 'foobarbaz'.encode('utf8'))
+
+    def test_generator_body_is_pulled_on_demand(self):
+        """Establish that chunks are only pulled from a generator when
+        the reader needs them.
+        """
+        pulled = []
+
+        def chunks():
+            for i in range(3):
+                pulled.append(i)
+                yield ('%d' % i).encode('utf8') * 4
+
+        resp = Template(chunks()).open()
+        self.assertEqual(pulled, [])
+        self.assertEqual(resp.read(4), '0000'.encode('utf8'))
+        self.assertEqual(pulled, [0])
+        self.assertEqual(resp.read(5), '11112'.encode('utf8'))
+        self.assertEqual(pulled, [0, 1, 2])
+
+    def test_generator_body_is_served_once(self):
+        """Establish that serving a generator's body a second time is an
+        error, rather than an empty body, while iterables which are not
+        iterators are served every time.
+        """
+        template = Template(i for i in ['foo', 'bar'])
+        self.assertEqual(template.open().read(), 'foobar'.encode('utf8'))
+        with self.assertRaises(ConsumedBody):
+            template.open()
+        template = Template(['foo', 'bar'])
+        for i in range(2):
+            self.assertEqual(template.open().read(), 'foobar'.encode('utf8'))
+
+        # Generators made afresh for each request are served every time.
+        dynamic = Dynamic(lambda call: (i for i in ['foo', 'bar']))
+        for i in range(2):
+            template = dynamic.render(Call('GET', URL('http://foo/'), {},
+                                           None, None))
+            self.assertEqual(template.open().read(), 'foobar'.encode('utf8'))
+
+
+class RangeTests(unittest.TestCase):
+    """A group of tests for serving byte ranges of a Template's body."""
+    def setUp(self):
+        self.template = Template('0123456789'.encode('utf8'),
+                                 headers={'Content-Type': 'text/plain'})
+
+    def test_byte_ranges(self):
+        self.assertEqual(byte_ranges('bytes=0-3', 10), [(0, 4)])
+        self.assertEqual(byte_ranges('bytes=8-', 10), [(8, 10)])
+        self.assertEqual(byte_ranges('bytes=-3', 10), [(7, 10)])
+        self.assertEqual(byte_ranges('bytes=-30', 10), [(0, 10)])
+        self.assertEqual(byte_ranges('bytes=5-50', 10), [(5, 10)])
+        self.assertEqual(byte_ranges('bytes=0-0, 9-', 10), [(0, 1), (9, 10)])
+        self.assertEqual(byte_ranges('bytes=10-', 10), [])
+        self.assertEqual(byte_ranges('bytes=-0', 10), [])
+        for header in ('lines=0-3', 'bytes=', 'bytes=3', 'bytes=4-3',
+                       'bytes=a-b', 'bytes=-', 'bytes=0--3'):
+            self.assertIsNone(byte_ranges(header, 10), header)
+
+    def test_disabled(self):
+        """Establish that Range headers are ignored unless ranges are
+        turned on.
+        """
+        resp = self.template.open(range_header='bytes=0-3')
+        self.assertEqual(resp.status, 200)
+        self.assertNotIn('Accept-Ranges', resp.headers)
+        self.assertEqual(resp.read(), '0123456789'.encode('utf8'))
+
+    def test_no_range(self):
+        resp = self.template.open(ranges=True)
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
+        resp = self.template.open(range_header='bytes=4-3', ranges=True)
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.read(), '0123456789'.encode('utf8'))
+
+    def test_single_range(self):
+        """Establish that a single range is a slice of the shared body."""
+        resp = self.template.open(range_header='bytes=2-5', ranges=True)
+        self.assertEqual(resp.status, 206)
+        self.assertEqual(resp.reason, 'PARTIAL CONTENT')
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(resp.headers['Content-Length'], '4')
+        self.assertEqual(resp.headers['Content-Type'], 'text/plain')
+        self.assertIs(resp._body.obj, self.template.body.obj)
+        self.assertEqual(resp.read(), '2345'.encode('utf8'))
+
+    def test_multiple_ranges(self):
+        resp = self.template.open(range_header='bytes=0-1,-2', ranges=True)
+        self.assertEqual(resp.status, 206)
+        content_type = resp.headers['Content-Type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; '))
+        boundary = content_type.split('boundary=')[1]
+        body = resp.read()
+        self.assertEqual(int(resp.headers['Content-Length']), len(body))
+        self.assertEqual(body.decode('utf8'), '\r\n'.join((
+            '--%s' % boundary,
+            'Content-Type: text/plain',
+            'Content-Range: bytes 0-1/10',
+            '',
+            '01',
+            '--%s' % boundary,
+            'Content-Type: text/plain',
+            'Content-Range: bytes 8-9/10',
+            '',
+            '89',
+            '--%s--' % boundary,
+            '',
+        )))
+
+    def test_unsatisfiable(self):
+        resp = self.template.open(range_header='bytes=20-', ranges=True)
+        self.assertEqual(resp.status, 416)
+        self.assertEqual(resp.headers['Content-Range'], 'bytes */10')
+        self.assertEqual(resp.read(), ''.encode('utf8'))
+
+    def test_only_successful_responses(self):
+        template = Template('nope'.encode('utf8'), 404)
+        resp = template.open(range_header='bytes=0-1', ranges=True)
+        self.assertEqual(resp.status, 404)
+        self.assertEqual(resp.read(), 'nope'.encode('utf8'))
+
+
+class ConditionalTests(unittest.TestCase):
+    """A group of tests for answering conditional requests from
+    a Template's validators.
+    """
+    def setUp(self):
+        self.template = Template('foo'.encode('utf8'), conditional=True,
+                                 modified=784111777,
+                                 headers={'Cache-Control': 'max-age=60',
+                                          'Content-Type': 'text/plain'})
+        self.etag = '"0beec7b5ea3f0fdbc95d0dd47f3c5bc275da8a33"'
+
+    def test_validators(self):
+        self.assertEqual(self.template.etag, self.etag)
+        self.assertEqual(self.template.headers['ETag'], self.etag)
+        self.assertEqual(self.template.headers['Last-Modified'],
+                         'Sun, 06 Nov 1994 08:49:37 GMT')
+        self.assertIsNone(Template('foo'.encode('utf8')).etag)
+        self.assertNotIn('ETag', Template('foo'.encode('utf8')).headers)
+
+    def test_given_validators(self):
+        """Establish that validators in the registered headers are used
+        rather than computed.
+        """
+        template = Template('foo'.encode('utf8'), conditional=True, headers={
+            'etag': '"v1"',
+            'last-modified': 'Sun, 06 Nov 1994 08:49:37 GMT',
+        })
+        self.assertEqual(template.etag, '"v1"')
+        self.assertEqual(template.modified, 784111777)
+        self.assertEqual(len(template.headers), 2)
+
+    def test_if_none_match(self):
+        for header in (self.etag, '"nope", W/%s' % self.etag, '*'):
+            resp = self.template.open(if_none_match=header)
+            self.assertEqual(resp.status, 304)
+            self.assertEqual(resp.read(), ''.encode('utf8'))
+            self.assertEqual(resp.headers, {
+                'Cache-Control': 'max-age=60',
+                'ETag': self.etag,
+                'Last-Modified': 'Sun, 06 Nov 1994 08:49:37 GMT',
+            })
+        resp = self.template.open(
+            if_none_match='"nope"',
+            if_modified_since='Sun, 06 Nov 1994 08:49:37 GMT',
+        )
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.read(), 'foo'.encode('utf8'))
+
+    def test_if_modified_since(self):
+        resp = self.template.open(
+            if_modified_since='Sun, 06 Nov 1994 08:49:37 GMT',
+        )
+        self.assertEqual(resp.status, 304)
+        resp = self.template.open(
+            if_modified_since='Sun, 06 Nov 1994 08:49:36 GMT',
+        )
+        self.assertEqual(resp.status, 200)
+        resp = self.template.open(if_modified_since='yesterday')
+        self.assertEqual(resp.status, 200)
+
+    def test_streamed_body(self):
+        """Establish that an iterable body gets a Last-Modified date, but
+        no ETag.
+        """
+        template = Template(['foo'], conditional=True, modified=784111777)
+        self.assertIsNone(template.etag)
+        self.assertEqual(template.open(if_none_match='*').status, 200)
+        resp = template.open(
+            if_modified_since='Sun, 06 Nov 1994 08:49:37 GMT',
+        )
+        self.assertEqual(resp.status, 304)
+
+
+class EncodingTests(unittest.TestCase):
+    """A group of tests for sending compressed and chunked bodies."""
+    def setUp(self):
+        self.body = 'foobar'.encode('utf8') * 100
+        self.template = Template(self.body, encodings=('gzip', 'deflate'),
+                                 conditional=True, headers={'ETag': '"v1"'})
+
+    def test_choose_encoding(self):
+        encodings = ('gzip', 'deflate')
+        self.assertEqual(choose_encoding('gzip, deflate', encodings), 'gzip')
+        self.assertEqual(choose_encoding('deflate', encodings), 'deflate')
+        self.assertEqual(choose_encoding('gzip;q=0.5, deflate', encodings),
+                         'deflate')
+        self.assertEqual(choose_encoding('*', encodings), 'gzip')
+        self.assertEqual(choose_encoding('*, gzip;q=0', encodings),
+                         'deflate')
+        self.assertIsNone(choose_encoding('identity', encodings))
+        self.assertIsNone(choose_encoding('gzip;q=nope', encodings))
+        self.assertIsNone(choose_encoding(None, encodings))
+
+    def test_variants(self):
+        """Establish that each variant is compressed once, and is sent
+        with its own headers and entity tag.
+        """
+        gzip = self.template.open(accept_encoding='gzip')
+        self.assertIs(gzip._body, self.template.open(
+            accept_encoding='gzip',
+        )._body)
+        self.assertEqual(gzip.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.headers['ETag'], '"v1-gzip"')
+        self.assertEqual(zlib.decompress(gzip.read(), 16 + zlib.MAX_WBITS),
+                         self.body)
+        deflate = self.template.open(accept_encoding='deflate')
+        self.assertEqual(zlib.decompress(deflate.read()), self.body)
+        identity = self.template.open()
+        self.assertNotIn('Content-Encoding', identity.headers)
+        self.assertEqual(identity.headers['ETag'], '"v1"')
+        self.assertEqual(identity.read(), self.body)
+
+    def test_variant_not_modified(self):
+        resp = self.template.open(accept_encoding='gzip',
+                                  if_none_match='"v1-gzip"')
+        self.assertEqual(resp.status, 304)
+        resp = self.template.open(accept_encoding='gzip',
+                                  if_none_match='"v1"')
+        self.assertEqual(resp.status, 200)
+
+    def test_unsupported_encoding(self):
+        with self.assertRaises(ValueError):
+            Template(self.body, encodings=('compress',))
+
+    def test_chunked(self):
+        """Establish that a chunked response is framed as it is read."""
+        resp = Template(['foo', 'bar']).open(chunked=4)
+        self.assertEqual(resp.headers, {'Transfer-Encoding': 'chunked'})
+        reader = ChunkedReader(resp, resp.chunk_size)
+        self.assertIs(reader.fp, reader)
+        self.assertEqual(reader.readline(), '4\r\n'.encode('utf8'))
+        self.assertEqual(reader.read(6), 'foob\r\n'.encode('utf8'))
+        self.assertEqual(reader.read(),
+                         '2\r\nar\r\n0\r\n\r\n'.encode('utf8'))
+        reader.close()
+        self.assertIsNone(reader.fp)
+        self.assertTrue(resp.closed)
+
+
+class DynamicTests(unittest.TestCase):
+    """A group of tests for responses computed by calling a function."""
+    def call(self, url, body=None):
+        return Call('GET', URL(url), {}, body, None)
+
+    def test_render(self):
+        """Establish that a function's answer may be a body, or a body
+        with a status and headers.
+        """
+        dynamic = Dynamic(lambda call: call.url.qs['id'], 201, {'a': 'b'})
+        template = dynamic.render(self.call('http://foo/?id=42'))
+        self.assertEqual(template.status, 201)
+        self.assertEqual(template.headers, {'a': 'b'})
+        self.assertEqual(template.open().read(), '42'.encode('utf8'))
+        dynamic = Dynamic(lambda call: ('nope', 404, {'c': 'd'}),
+                          headers={'a': 'b'}, ranges=True)
+        template = dynamic.render(self.call('http://foo/'))
+        self.assertEqual(template.status, 404)
+        self.assertEqual(template.headers, {'a': 'b', 'c': 'd'})
+        self.assertTrue(template.ranges)
+        self.assertIsNone(dynamic.cache)
+
+    def test_cache(self):
+        """Establish that cached answers are reused for requests with the
+        same URL and body.
+        """
+        calls = []
+
+        def respond(call):
+            calls.append(call)
+            return 'page %s' % call.url.qs['page']
+
+        dynamic = Dynamic(respond, cache=2)
+        first = dynamic.render(self.call('http://foo/?page=1'))
+        self.assertIs(dynamic.render(self.call('http://foo/?page=1')), first)
+        self.assertIsNot(dynamic.render(self.call('http://foo/?page=1',
+                                                  body='spam')), first)
+        dynamic.render(self.call('http://foo/?page=2'))
+        dynamic.render(self.call('http://foo/?page=1'))
+        self.assertEqual(len(calls), 4)
+        self.assertEqual((dynamic.cache.hits, dynamic.cache.misses), (1, 4))
+
+    def test_cache_skips_streams(self):
+        """Establish that answers which can only be read once, and
+        requests whose bodies cannot be digested, are not cached.
+        """
+        dynamic = Dynamic(lambda call: iter(['foo']), cache=2)
+        dynamic.render(self.call('http://foo/'))
+        dynamic = Dynamic(lambda call: 'foo', cache=2)
+        dynamic.render(self.call('http://foo/', body=iter(['spam'])))
+        self.assertEqual(len(dynamic.cache), 0)
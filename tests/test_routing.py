@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+from fauxquests.compat import unittest
+from fauxquests.routing import Router, Segment
+from fauxquests.utils import QueryIndex, URL
+
+
+class SegmentTests(unittest.TestCase):
+    """A group of tests for parsing and matching templated segments."""
+    def test_plain(self):
+        segment = Segment('{id}')
+        self.assertEqual(segment.match('42'), (('id', '42'),))
+        self.assertIsNone(segment.match(''))
+        self.assertEqual(segment.rank[0], 2)
+
+    def test_typed(self):
+        segment = Segment('{id:int}')
+        self.assertEqual(segment.match('42'), (('id', 42),))
+        self.assertIsNone(segment.match('42a'))
+        self.assertEqual(segment.rank[0], 1)
+
+    def test_regex(self):
+        segment = Segment('{code:[A-Z]{3}}')
+        self.assertEqual(segment.match('ABC'), (('code', 'ABC'),))
+        self.assertIsNone(segment.match('ABCD'))
+
+    def test_literal_text(self):
+        segment = Segment('{name}.{ext}')
+        self.assertEqual(segment.match('a.b.json'),
+                         (('name', 'a.b'), ('ext', 'json')))
+        self.assertIsNone(segment.match('readme'))
+        self.assertEqual(segment.rank[0], 1)
+
+    def test_path(self):
+        segment = Segment('{rest:path}')
+        self.assertTrue(segment.path)
+        self.assertEqual(segment.rank[0], 3)
+        with self.assertRaises(ValueError):
+            Segment('x{rest:path}')
+
+    def test_invalid(self):
+        for source in ('{id', '{}', '{1d}'):
+            with self.assertRaises(ValueError):
+                Segment(source)
+
+
+class RouterTests(unittest.TestCase):
+    """A group of tests for finding the route template matching a URL."""
+    def setUp(self):
+        self.router = Router(QueryIndex)
+        self.routes = {}
+        for template in ('http://api/users/{id}',
+                         'http://api/users/{id:int}',
+                         'http://api/users/me',
+                         'http://api/users/{id}/orders/{order_id}',
+                         'http://api/files/{rest:path}',
+                         'http://api/{anything:path}'):
+            self.add(template)
+
+    def add(self, template, method='GET', **kwargs):
+        key = URL(template, method=method, **kwargs)
+        self.router.add(key, key)
+        self.routes[template] = key
+        return key
+
+    def match(self, url, method='GET'):
+        answer = self.router.best(URL(url, method=method))
+        if answer is None:
+            return None
+        return answer[1].uri, answer[2]
+
+    def test_most_specific(self):
+        """Establish that typed segments beat plain ones, and plain ones
+        beat whole paths.
+        """
+        self.assertEqual(self.match('http://api/users/42'),
+                         ('http://api/users/{id:int}', {'id': 42}))
+        self.assertEqual(self.match('http://api/users/bob'),
+                         ('http://api/users/{id}', {'id': 'bob'}))
+        self.assertEqual(self.match('http://api/users/bob/orders/7'), (
+            'http://api/users/{id}/orders/{order_id}',
+            {'id': 'bob', 'order_id': '7'},
+        ))
+        self.assertEqual(self.match('http://api/users/bob/friends'), (
+            'http://api/{anything:path}', {'anything': 'users/bob/friends'},
+        ))
+
+    def test_literal_segments_win(self):
+        self.assertEqual(self.match('http://api/users/me'),
+                         ('http://api/users/me', {}))
+
+    def test_path(self):
+        self.assertEqual(self.match('http://api/files/a/b/c.txt'), (
+            'http://api/files/{rest:path}', {'rest': 'a/b/c.txt'},
+        ))
+        self.assertEqual(self.match('http://api/files/'), (
+            'http://api/{anything:path}', {'anything': 'files/'},
+        ))
+
+    def test_method_and_query(self):
+        """Establish that routes are told apart by method and query
+        string, just as literal URLs are.
+        """
+        self.add('http://api/items/{id}', q='kitties')
+        self.assertIsNone(self.match('http://other/users/42'))
+        self.assertIsNone(self.match('http://api/users/42', method='POST'))
+        self.assertEqual(self.match('http://api/items/1?q=kitties')[0],
+                         'http://api/items/{id}')
+        self.assertEqual(self.match('http://api/items/1')[0],
+                         'http://api/{anything:path}')
+
+    def test_remove(self):
+        key = self.routes['http://api/users/{id:int}']
+        self.router.remove(key, key)
+        self.assertEqual(len(self.router), 5)
+        self.assertEqual(self.match('http://api/users/42'),
+                         ('http://api/users/{id}', {'id': '42'}))
@@ -45,3 +45,22 @@ class FauxServerTests(unittest.TestCase):
         # registered item.
         with faux_server as fs:
             self.assertEqual(len(fs._registry), 1)
+
+    def test_server_registrations_compiled_once(self):
+        """Establish that server registrations are compiled once and
+        shared between context managers, and recompiled only when
+        another registration is made.
+        """
+        faux_server = FauxServer()
+        faux_server.register('http://foo/', 'bar baz')
+        with faux_server as fs:
+            base = fs._registry._base
+        with faux_server as fs:
+            self.assertIs(fs._registry._base, base)
+            fs.register('http://bar/', 'spam eggs')
+        self.assertEqual(len(base), 1)
+
+        faux_server.register_json('http://spam/', {'eggs': True})
+        with faux_server as fs:
+            self.assertIsNot(fs._registry._base, base)
+            self.assertEqual(len(fs._registry), 2)
@@ -0,0 +1,94 @@
+from __future__ import unicode_literals
+from fauxquests.adapter import FauxAdapter
+from fauxquests.compat import unittest
+from fauxquests.response import Resp
+from fauxquests.timing import (VirtualClock, exponential, normal, read_timeout,
+                               sample, uniform)
+from requests import Session
+from requests.exceptions import ReadTimeout
+
+
+class ClockTests(unittest.TestCase):
+    def test_virtual_clock(self):
+        clock = VirtualClock(start=10)
+        clock.sleep(2.5)
+        clock.sleep(-1)
+        self.assertEqual(clock.time(), 12.5)
+
+    def test_sample(self):
+        self.assertEqual(sample(None), 0)
+        self.assertEqual(sample(0.5), 0.5)
+        self.assertEqual(sample(lambda: 2), 2)
+
+    def test_distributions_are_seeded(self):
+        """Establish that distributions with the same seed produce the
+        same latencies, and never negative ones.
+        """
+        for factory, args in ((uniform, (0, 1)), (normal, (0.1, 1)),
+                              (exponential, (0.1,))):
+            first, second = factory(*args, seed=4), factory(*args, seed=4)
+            samples = [first() for _ in range(50)]
+            self.assertEqual(samples, [second() for _ in range(50)])
+            self.assertTrue(all([i >= 0 for i in samples]))
+
+    def test_read_timeout(self):
+        self.assertIsNone(read_timeout(None))
+        self.assertEqual(read_timeout(3), 3)
+        self.assertEqual(read_timeout((1, 2.5)), 2.5)
+        self.assertIsNone(read_timeout((1, None)))
+
+
+class LatencyTests(unittest.TestCase):
+    """Establish that simulated latency and bandwidth are applied to
+    responses, as measured by the adapter's clock.
+    """
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.adapter = FauxAdapter(latency=0.25, clock=self.clock)
+        self.session = Session()
+        self.session.trust_env = False
+        self.session.mount('http://', self.adapter)
+
+    def test_adapter_latency(self):
+        self.adapter.register('http://foo/', 'bar')
+        self.assertEqual(self.session.get('http://foo/').text, 'bar')
+        self.assertEqual(self.clock.time(), 0.25)
+
+    def test_registration_settings(self):
+        """Establish that a registration's own settings take precedence
+        over the adapter's, and that the body is throttled.
+        """
+        self.adapter.register('http://foo/', 'x' * 1000, latency=0.5,
+                              ttfb=0.25, bandwidth=500)
+        response = self.session.get('http://foo/', stream=True)
+        self.assertEqual(self.clock.time(), 0.5)
+        self.assertEqual(len(response.raw.read(500)), 500)
+        self.assertEqual(self.clock.time(), 1.75)
+        self.assertEqual(len(response.content), 500)
+        self.assertEqual(self.clock.time(), 2.75)
+
+    def test_read_timeout(self):
+        """Establish that a response slower than the read timeout raises
+        ReadTimeout, after waiting for the timeout.
+        """
+        self.adapter.register('http://foo/', 'bar', latency=lambda: 5)
+        with self.assertRaises(ReadTimeout):
+            self.session.get('http://foo/', timeout=(1, 2))
+        self.assertEqual(self.clock.time(), 2)
+        self.session.get('http://foo/', timeout=10)
+        self.assertEqual(self.clock.time(), 7)
+
+    def test_journal_uses_clock(self):
+        self.adapter.register('http://foo/', 'bar')
+        self.session.get('http://foo/')
+        self.clock.advance(10)
+        self.session.get('http://foo/')
+        stats = self.adapter.journal.stats(self.adapter._route('http://foo/',
+                                                               'GET', {}))
+        self.assertEqual((stats.first, stats.last), (0, 10.25))
+
+    def test_resp_read_timed(self):
+        resp = Resp(b'x' * 100, ttfb=1, bandwidth=50, clock=self.clock)
+        self.assertEqual(resp.read_timed(50), (b'x' * 50, 2))
+        self.assertEqual(resp.read_timed(), (b'x' * 50, 1))
+        self.assertEqual(self.clock.time(), 0)
@@ -1,8 +1,9 @@
 from __future__ import unicode_literals
 from fauxquests.compat import unittest
 from fauxquests.exceptions import UnregisteredURL
-from fauxquests.utils import Registry, URL
+from fauxquests.utils import LRUCache, QueryIndex, Registry, URL
 import six
+import threading
 
 
 class RegistryTests(unittest.TestCase):
@@ -48,6 +49,278 @@ class RegistryTests(unittest.TestCase):
         with self.assertRaises(UnregisteredURL):
             reg['baz']
 
+    def test_not_found_message(self):
+        """Establish that the message for a request that matched nothing
+        is only built when it is shown, and lists only the closest
+        registrations.
+        """
+        reg = Registry()
+        for i in range(100):
+            reg['http://api/other/%d' % i] = 'x'
+        reg['http://api/users?page=1&sort=name'] = 'a'
+        reg['http://api/users?page=1'] = 'b'
+        reg[URL('http://api/users', method='POST')] = 'c'
+        reg['http://api/users/{id:int}'] = 'd'
+        with self.assertRaises(UnregisteredURL) as context:
+            reg['http://api/users?sort=age']
+        self.assertIsNone(context.exception._message)
+        message = six.text_type(context.exception)
+        lines = [i.strip() for i in message.splitlines()]
+        self.assertIn('(5 of 104)', message)
+        self.assertEqual(lines[3:7], [
+            '- http://api/users?page=1&sort=name',
+            '- http://api/users?page=1',
+            '- http://api/users/{id:int}',
+            '- POST http://api/users',
+        ])
+        self.assertEqual(reg.nearest('http://api/users', count=1),
+                         ['http://api/users?page=1&sort=name'])
+
+    def test_not_found_message_while_registering(self):
+        """Establish that the message for a request that matched nothing
+        can be built while another thread is registering.
+        """
+        reg = Registry()
+        reg['http://api/users/{id:int}'] = 'x'
+        done = threading.Event()
+
+        def register():
+            for i in range(2000):
+                if done.is_set():
+                    return
+                reg['http://api/users?page=%d' % i] = 'x'
+                reg['http://api/items/%d/{name}' % i] = 'x'
+                reg['http://api/%d' % i] = 'x'
+
+        thread = threading.Thread(target=register)
+        thread.start()
+        try:
+            for i in range(100):
+                with self.assertRaises(UnregisteredURL) as context:
+                    reg[URL('http://api/users?sort=age', method='PUT')]
+                self.assertIn('closest', six.text_type(context.exception))
+        finally:
+            done.set()
+            thread.join()
+
+    def test_getitem_superset_method_mismatch(self):
+        """Establish that a superset lookup does not match a registration
+        for the same URI but a different method.
+        """
+        reg = Registry()
+        reg[URL('foo', method='POST')] = 'bar'
+        with self.assertRaises(UnregisteredURL):
+            reg['foo?baz=eggs']
+
+    def test_index_follows_deletion(self):
+        """Establish that removing a key also removes it from the
+        index used for superset lookups.
+        """
+        reg = Registry()
+        reg['foo'] = 'bar'
+        reg['foo?spam=eggs'] = 'baz'
+        del reg['foo']
+        self.assertEqual(reg['foo?spam=eggs&x=y'], 'baz')
+        with self.assertRaises(UnregisteredURL):
+            reg['foo?x=y']
+        self.assertEqual(reg.pop('foo?spam=eggs'), 'baz')
+        self.assertEqual(reg._index, {})
+
+    def test_index_follows_clear(self):
+        """Establish that clearing the registry also clears its index."""
+        reg = Registry({'foo': 'bar'})
+        self.assertEqual(reg['foo?baz=eggs'], 'bar')
+        reg.clear()
+        self.assertEqual(reg._index, {})
+        with self.assertRaises(UnregisteredURL):
+            reg['foo?baz=eggs']
+
+
+class RouteTemplateTests(unittest.TestCase):
+    """A group of tests for registries holding route templates."""
+    def test_resolve(self):
+        """Establish that route templates are only consulted when no
+        literal URL matches, and that their captures are returned.
+        """
+        reg = Registry()
+        reg['http://api/users/{id:int}'] = 'user'
+        reg['http://api/users/1'] = 'first user'
+        self.assertEqual(reg.resolve('http://api/users/1?x=y'),
+                         (URL('http://api/users/1'), 'first user', {}))
+        self.assertEqual(reg.resolve('http://api/users/2'),
+                         ('http://api/users/{id:int}', 'user', {'id': 2}))
+        self.assertEqual(reg['http://api/users/3'], 'user')
+        self.assertEqual(len(reg), 2)
+        with self.assertRaises(UnregisteredURL):
+            reg['http://api/users/bob']
+
+    def test_delete(self):
+        reg = Registry()
+        reg['http://api/users/{id}'] = 'user'
+        del reg['http://api/users/{id}']
+        self.assertEqual(len(reg), 0)
+        with self.assertRaises(UnregisteredURL):
+            reg['http://api/users/1']
+
+    def test_overlay(self):
+        """Establish that route templates in a base registry are served
+        by overlays, and survive the overlay detaching from its base.
+        """
+        base = Registry()
+        base['http://api/users/{id}'] = 'base user'
+        base['http://api/things'] = 'base things'
+        reg = base.overlay()
+        reg['http://api/users/{id:int}'] = 'overlay user'
+        self.assertEqual(reg['http://api/users/1'], 'overlay user')
+        self.assertEqual(reg['http://api/users/bob'], 'base user')
+        self.assertEqual(base['http://api/users/1'], 'base user')
+        del reg['http://api/things']
+        self.assertEqual(reg['http://api/users/1'], 'overlay user')
+        self.assertEqual(reg['http://api/users/bob'], 'base user')
+
+
+class OverlayTests(unittest.TestCase):
+    def setUp(self):
+        self.base = Registry()
+        self.base['foo'] = 'base foo'
+        self.base['foo?q=a'] = 'base q'
+        self.reg = self.base.overlay()
+
+    def test_base_is_frozen(self):
+        """Establish that a registry used as a base may no longer
+        be modified.
+        """
+        with self.assertRaises(TypeError):
+            self.base['bar'] = 'baz'
+
+    def test_lookup_falls_through(self):
+        """Establish that an overlay serves registrations from its base,
+        and that its own registrations are kept out of the base.
+        """
+        self.reg['bar'] = 'overlay bar'
+        self.assertEqual(self.reg['foo?x=y'], 'base foo')
+        self.assertEqual(self.reg['bar?x=y'], 'overlay bar')
+        self.assertEqual(len(self.reg), 3)
+        self.assertEqual(len(self.base), 2)
+        with self.assertRaises(UnregisteredURL):
+            self.base['bar']
+
+    def test_most_specific_across_layers(self):
+        """Establish that the most specific registration wins whichever
+        layer it lives in, and that an overlay may replace a base value.
+        """
+        self.reg['foo?q=a&page=2'] = 'overlay page'
+        self.reg['foo?q=a'] = 'overlay q'
+        self.assertEqual(self.reg['foo?q=a&page=2'], 'overlay page')
+        self.assertEqual(self.reg['foo?q=a&x=y'], 'overlay q')
+        self.assertEqual(self.base['foo?q=a&x=y'], 'base q')
+        self.assertEqual(len(self.reg), 3)
+
+    def test_base_wins_ties(self):
+        """Establish that registrations in the base win ties with equally
+        specific ones in an overlay, as earlier registrations do in a
+        single registry.
+        """
+        base = Registry()
+        base['http://x/x?p=1'] = 'p'
+        base['http://x/x?q=1'] = 'q'
+        base['http://x/{name}/{id}'] = 'base route'
+        reg = base.overlay()
+        reg['http://x/x?z=1'] = 'z'
+        reg['http://x/{kind}/{key}'] = 'overlay route'
+        self.assertEqual(reg['http://x/x?q=1&z=1'], 'q')
+        self.assertEqual(reg['http://x/y/1'], 'base route')
+        reg['http://x/x/{id}'] = 'literal'
+        self.assertEqual(reg['http://x/x/1'], 'literal')
+
+    def test_delete_base_key(self):
+        """Establish that deleting a key from an overlay works even when
+        the key came from the base, without modifying the base.
+        """
+        self.reg['bar'] = 'overlay bar'
+        del self.reg['foo']
+        self.assertEqual(sorted(self.reg.keys()), ['bar', 'foo?q=a'])
+        self.assertEqual(len(self.base), 2)
+        with self.assertRaises(UnregisteredURL):
+            self.reg['foo?x=y']
+
+    def test_clear(self):
+        self.reg.clear()
+        self.assertEqual(len(self.reg), 0)
+        self.assertEqual(len(self.base), 2)
+
+
+class QueryIndexTests(unittest.TestCase):
+    def test_most_specific_match(self):
+        """Establish that the registration requiring the most query
+        pairs wins, regardless of registration order.
+        """
+        reg = Registry()
+        reg['foo?q=a&page=2'] = 'page two'
+        reg['foo'] = 'bare'
+        reg['foo?q=a'] = 'first page'
+        self.assertEqual(reg['foo?q=a&page=2&api_key=x'], 'page two')
+        self.assertEqual(reg['foo?q=a&page=3'], 'first page')
+        self.assertEqual(reg['foo?q=b'], 'bare')
+
+    def test_tie_goes_to_first_registration(self):
+        """Establish that equally specific matches are resolved in
+        favor of the one registered first.
+        """
+        reg = Registry()
+        reg['foo?a=1'] = 'a'
+        reg['foo?b=2'] = 'b'
+        self.assertEqual(reg['foo?b=2&a=1'], 'a')
+
+    def test_multiple_values(self):
+        """Establish that a key registered with multiple values only
+        matches a request carrying exactly those values.
+        """
+        reg = Registry()
+        reg['foo?bar=baz&bar=eggs'] = 'both'
+        self.assertEqual(reg['foo?bar=eggs&bar=baz&x=y'], 'both')
+        with self.assertRaises(UnregisteredURL):
+            reg['foo?bar=baz']
+
+    def test_match_default(self):
+        index = QueryIndex()
+        index.add('foo?a=1', URL('foo?a=1'))
+        self.assertEqual(index.match(URL('foo?a=2'), 'nope'), 'nope')
+        self.assertEqual(index.match(URL('foo?a=1&b=2')), 'foo?a=1')
+        index.remove('foo?a=1')
+        self.assertEqual(len(index), 0)
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', 'nope'), 'nope')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        """Establish that a full cache forgets the entry which was used
+        least recently, rather than the one set first.
+        """
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
 
 class URLTests(unittest.TestCase):
     def test_url_creation(self):
@@ -97,6 +370,25 @@ class URLTests(unittest.TestCase):
             'GET http://foo/?bar=baz&bar=eggs&spam=eggs'
         )
 
+    def test_hash(self):
+        """Establish that equal URL objects hash equally, regardless of
+        how their query strings were provided.
+        """
+        url = URL('http://foo/?bar=baz&spam=eggs')
+        url2 = URL('http://foo/', spam='eggs', bar='baz')
+        self.assertEqual(hash(url), hash(url2))
+        self.assertEqual({url: 1}[url2], 1)
+
+    def test_immutable(self):
+        """Establish that URL objects may not be modified once created."""
+        url = URL('http://foo/?bar=baz')
+        with self.assertRaises(AttributeError):
+            url.uri = 'http://bar/'
+        with self.assertRaises(AttributeError):
+            del url.method
+        with self.assertRaises(AttributeError):
+            url.extra = True
+
     def test_superset_uncomparable(self):
         url = URL('http://foo/?bar=eggs&bar=baz&spam=eggs')
         url2 = object()